@@ -0,0 +1,100 @@
+import codecs
+import csv
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Optional, Tuple
+
+import orjson
+
+# (line number, row, error): exactly one of row and error is set
+ImportRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+class ImportFormatError(ValueError):
+    """The upload cannot be parsed past `line`; rows before it were read."""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(message)
+        self.line = line
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, str]]:
+    """Decode a UTF-8 byte stream into numbered lines, holding one partial line at a time."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    line_number = 0
+    try:
+        async for chunk in chunks:
+            buffer += decoder.decode(chunk)
+            lines = buffer.split("\n")
+            buffer = lines.pop()
+            for line in lines:
+                line_number += 1
+                yield line_number, line.rstrip("\r")
+            if len(buffer) > max_line_bytes:
+                raise ImportFormatError(line_number + 1, f"Line is longer than {max_line_bytes} bytes")
+        buffer += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise ImportFormatError(line_number + 1, "File is not valid UTF-8")
+    if buffer:
+        yield line_number + 1, buffer.rstrip("\r")
+
+
+async def iter_csv_rows(chunks: AsyncIterable[bytes], max_line_bytes: int) -> AsyncIterator[ImportRow]:
+    """Rows of a CSV file whose first record names the columns.
+
+    Quoted fields may span lines; empty cells are left out of the row so the
+    model's defaults apply.
+    """
+    header = None
+    pending = []
+    start = 0
+    async for line_number, line in iter_lines(chunks, max_line_bytes):
+        if not pending:
+            start = line_number
+        pending.append(line)
+        record = "\n".join(pending)
+        # An odd number of quotes means a quoted field continues on the next line
+        if record.count('"') % 2:
+            if len(record) > max_line_bytes:
+                raise ImportFormatError(start, f"Record is longer than {max_line_bytes} bytes")
+            continue
+        pending = []
+        if not record.strip():
+            continue
+        try:
+            fields = next(csv.reader([record]))
+        except csv.Error as e:
+            yield start, None, f"Malformed CSV: {e}"
+            continue
+        if header is None:
+            header = [name.strip() for name in fields]
+            continue
+        if len(fields) > len(header):
+            yield start, None, f"Expected {len(header)} columns, got {len(fields)}"
+            continue
+        yield start, {name: value for name, value in zip(header, fields) if value != ""}, None
+    if pending:
+        raise ImportFormatError(start, "Unterminated quoted field")
+
+
+async def iter_ndjson_rows(chunks: AsyncIterable[bytes], max_line_bytes: int) -> AsyncIterator[ImportRow]:
+    """Rows of a newline-delimited JSON file, one object per line."""
+    async for line_number, line in iter_lines(chunks, max_line_bytes):
+        if not line.strip():
+            continue
+        try:
+            row = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, row, None
+
+
+IMPORT_FORMATS = {
+    "text/csv": iter_csv_rows,
+    "application/x-ndjson": iter_ndjson_rows,
+    "application/ndjson": iter_ndjson_rows,
+    "application/jsonl": iter_ndjson_rows,
+}
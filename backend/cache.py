@@ -0,0 +1,201 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (value, self._clock() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        if self._data.pop(key, _MISSING) is not _MISSING:
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._data)
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxSize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class MemoryBackend:
+    """In-process LRU byte store capped by entry count and total value size.
+
+    Each worker has its own copy, so with several workers a product write is
+    only seen by the others once their entries expire; use RedisBackend there.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self.bytes = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= self._clock():
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (value, self._clock() + ttl)
+        self.bytes += len(value)
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            self.evictions += 1
+
+    async def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    def _drop(self, key: str):
+        value, _ = self._data.pop(key)
+        self.bytes -= len(value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "entries": len(self._data), "bytes": self.bytes,
+                "maxBytes": self.max_bytes, "evictions": self.evictions}
+
+
+class RedisBackend:
+    """Byte store on any server speaking the Redis protocol.
+
+    Memory limits and eviction are left to the server (maxmemory with an
+    allkeys-lru policy). Pass `client` to use an existing redis.asyncio
+    compatible client, such as a fakeredis stand-in.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", client: Any = None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self._client = client
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def get_counter(self, key: str) -> int:
+        value = await self._client.get(key)
+        return int(value) if value is not None else 0
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+
+class VersionedCache:
+    """Read-through cache whose keys embed a version counter.
+
+    Bumping the version makes every existing entry unreachable at once; the
+    stale entries are never read again and age out through LRU or TTL. A
+    `scope` gives a group of keys (one supplier's, say) its own counter.
+    """
+
+    def __init__(self, backend: Any, namespace: str, ttl: float = 300.0):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _prefix(self, scope: str) -> str:
+        return f"{self.namespace}:{scope}:" if scope else f"{self.namespace}:"
+
+    async def version(self, scope: str = "") -> int:
+        return await self.backend.get_counter(f"{self._prefix(scope)}version")
+
+    async def lookup(self, key: str, scope: str = "") -> Tuple[int, Optional[bytes]]:
+        version = await self.version(scope)
+        value = await self.backend.get(f"{self._prefix(scope)}{version}:{key}")
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return version, value
+
+    async def store(self, key: str, version: int, value: bytes, scope: str = ""):
+        await self.backend.set(f"{self._prefix(scope)}{version}:{key}", value, self.ttl)
+
+    async def bump(self, scope: str = "") -> int:
+        return await self.backend.incr(f"{self._prefix(scope)}version")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            **self.backend.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
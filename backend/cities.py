@@ -0,0 +1,155 @@
+"""Offline geocoding of users' free-text city and state.
+
+Coordinates are city centres, which is as precise as a registration form's
+city field gets; nothing here calls an external geocoder.
+"""
+import math
+import re
+from typing import Dict, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+# (latitude, longitude) of city centres, keyed by normalized name
+CITY_COORDINATES: Dict[str, Tuple[float, float]] = {
+    "agra": (27.1767, 78.0081),
+    "ahmedabad": (23.0225, 72.5714),
+    "amritsar": (31.6340, 74.8723),
+    "aurangabad": (19.8762, 75.3433),
+    "bengaluru": (12.9716, 77.5946),
+    "bhopal": (23.2599, 77.4126),
+    "bhubaneswar": (20.2961, 85.8245),
+    "chandigarh": (30.7333, 76.7794),
+    "chennai": (13.0827, 80.2707),
+    "coimbatore": (11.0168, 76.9558),
+    "dehradun": (30.3165, 78.0322),
+    "delhi": (28.6139, 77.2090),
+    "faridabad": (28.4089, 77.3178),
+    "gandhinagar": (23.2156, 72.6369),
+    "ghaziabad": (28.6692, 77.4538),
+    "gurugram": (28.4595, 77.0266),
+    "guwahati": (26.1445, 91.7362),
+    "gwalior": (26.2183, 78.1828),
+    "hyderabad": (17.3850, 78.4867),
+    "imphal": (24.8170, 93.9368),
+    "indore": (22.7196, 75.8577),
+    "itanagar": (27.0844, 93.6053),
+    "jabalpur": (23.1815, 79.9864),
+    "jaipur": (26.9124, 75.7873),
+    "jalandhar": (31.3260, 75.5762),
+    "jammu": (32.7266, 74.8570),
+    "jodhpur": (26.2389, 73.0243),
+    "kanpur": (26.4499, 80.3319),
+    "kochi": (9.9312, 76.2673),
+    "kohima": (25.6751, 94.1086),
+    "kolkata": (22.5726, 88.3639),
+    "kota": (25.2138, 75.8648),
+    "lucknow": (26.8467, 80.9462),
+    "ludhiana": (30.9010, 75.8573),
+    "madurai": (9.9252, 78.1198),
+    "mangaluru": (12.9141, 74.8560),
+    "meerut": (28.9845, 77.7064),
+    "mumbai": (19.0760, 72.8777),
+    "mysuru": (12.2958, 76.6394),
+    "nagpur": (21.1458, 79.0882),
+    "nashik": (19.9975, 73.7898),
+    "noida": (28.5355, 77.3910),
+    "panaji": (15.4909, 73.8278),
+    "patna": (25.5941, 85.1376),
+    "prayagraj": (25.4358, 81.8463),
+    "puducherry": (11.9416, 79.8083),
+    "pune": (18.5204, 73.8567),
+    "raipur": (21.2514, 81.6296),
+    "rajkot": (22.3039, 70.8022),
+    "ranchi": (23.3441, 85.3096),
+    "shillong": (25.5788, 91.8933),
+    "shimla": (31.1048, 77.1734),
+    "srinagar": (34.0837, 74.7973),
+    "surat": (21.1702, 72.8311),
+    "thane": (19.2183, 72.9781),
+    "thiruvananthapuram": (8.5241, 76.9366),
+    "udaipur": (24.5854, 73.7125),
+    "vadodara": (22.3072, 73.1812),
+    "varanasi": (25.3176, 82.9739),
+    "vijayawada": (16.5062, 80.6480),
+    "visakhapatnam": (17.6868, 83.2185),
+}
+
+# Former and alternative spellings people still type
+CITY_ALIASES = {
+    "allahabad": "prayagraj",
+    "bangalore": "bengaluru",
+    "baroda": "vadodara",
+    "bombay": "mumbai",
+    "calcutta": "kolkata",
+    "cochin": "kochi",
+    "goa": "panaji",
+    "gurgaon": "gurugram",
+    "madras": "chennai",
+    "mangalore": "mangaluru",
+    "mysore": "mysuru",
+    "new delhi": "delhi",
+    "pondicherry": "puducherry",
+    "poona": "pune",
+    "trivandrum": "thiruvananthapuram",
+    "vizag": "visakhapatnam",
+}
+
+# An unknown city falls back to its state's capital (or largest market)
+STATE_CITIES = {
+    "andhra pradesh": "vijayawada",
+    "arunachal pradesh": "itanagar",
+    "assam": "guwahati",
+    "bihar": "patna",
+    "chandigarh": "chandigarh",
+    "chhattisgarh": "raipur",
+    "delhi": "delhi",
+    "goa": "panaji",
+    "gujarat": "ahmedabad",
+    "haryana": "gurugram",
+    "himachal pradesh": "shimla",
+    "jammu and kashmir": "srinagar",
+    "jharkhand": "ranchi",
+    "karnataka": "bengaluru",
+    "kerala": "thiruvananthapuram",
+    "madhya pradesh": "bhopal",
+    "maharashtra": "mumbai",
+    "manipur": "imphal",
+    "meghalaya": "shillong",
+    "nagaland": "kohima",
+    "odisha": "bhubaneswar",
+    "puducherry": "puducherry",
+    "punjab": "ludhiana",
+    "rajasthan": "jaipur",
+    "tamil nadu": "chennai",
+    "telangana": "hyderabad",
+    "uttar pradesh": "lucknow",
+    "uttarakhand": "dehradun",
+    "west bengal": "kolkata",
+}
+
+
+def normalize_place(name: str) -> str:
+    return re.sub(r"[^a-z]+", " ", (name or "").lower()).strip()
+
+
+def geo_point(lat: float, lng: float) -> Dict[str, object]:
+    # GeoJSON puts longitude first
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def geocode(city: str, state: str = "") -> Optional[Dict[str, object]]:
+    """GeoJSON point for a city, else its state; None when neither is known."""
+    name = normalize_place(city)
+    name = CITY_ALIASES.get(name, name)
+    if name not in CITY_COORDINATES:
+        name = STATE_CITIES.get(normalize_place(state))
+    if name is None:
+        return None
+    return geo_point(*CITY_COORDINATES[name])
+
+
+def distance_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Great-circle distance between two (lat, lng) pairs."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
@@ -0,0 +1,4 @@
+"""Settings shared by the accounts the server's sample data and the seeder create."""
+
+# Every sample and seeded account logs in with this password
+DEMO_PASSWORD = "demo123"
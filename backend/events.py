@@ -0,0 +1,86 @@
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+
+class Subscription:
+    """One connected client's bounded event buffer.
+
+    When the buffer is full the oldest event is dropped and the subscription
+    is flagged, so the stream can tell the client to re-fetch its orders.
+    """
+
+    __slots__ = ("user_id", "events", "overflowed", "_wakeup", "_maxlen")
+
+    def __init__(self, user_id: str, maxlen: int):
+        self.user_id = user_id
+        self.events: Deque[Dict[str, Any]] = deque()
+        self.overflowed = False
+        self._wakeup = asyncio.Event()
+        self._maxlen = maxlen
+
+    def push(self, event: Dict[str, Any]):
+        if len(self.events) >= self._maxlen:
+            self.events.popleft()
+            self.overflowed = True
+        self.events.append(event)
+        self._wakeup.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until an event is buffered; False when the timeout passes first."""
+        if self.events:
+            return True
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class EventBroker:
+    """In-process fan-out of order events to the vendor and supplier involved."""
+
+    def __init__(self, buffer_size: int = 100, max_subscriptions: int = 10000):
+        self.buffer_size = buffer_size
+        self.max_subscriptions = max_subscriptions
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.connections = 0
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, user_id: str) -> Optional[Subscription]:
+        if self.connections >= self.max_subscriptions:
+            return None
+        subscription = Subscription(user_id, self.buffer_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        self.connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscribers.get(subscription.user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscribers[subscription.user_id]
+        self.connections -= 1
+
+    def publish(self, event: Dict[str, Any]):
+        self.published += 1
+        for user_id in {event.get("vendorId"), event.get("supplierId")}:
+            for subscription in self._subscribers.get(user_id, ()):
+                if len(subscription.events) >= self.buffer_size:
+                    self.overflows += 1
+                subscription.push(event)
+                self.delivered += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "users": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class HashingPoolBusy(Exception):
+    """Raised when the pool's wait queue is already full."""
+
+
+class HashingPool:
+    """Runs CPU-heavy password hashing off the event loop.
+
+    `kind` is "thread" (bcrypt releases the GIL), "process" or "inline"
+    (runs on the loop, only useful as a benchmark baseline). At most
+    `max_concurrency` jobs run at once; callers beyond that wait, and once
+    `max_queue` callers are waiting new ones are rejected with HashingPoolBusy.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 4,
+                 max_concurrency: Optional[int] = None, max_queue: int = 0):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown hashing pool kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_concurrency = max_concurrency or self.workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Metrics
+        self.running = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hashing")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.kind == "inline":
+            self.completed += 1
+            return fn(*args)
+
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HashingPoolBusy("Too many pending hashing jobs")
+
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "maxConcurrency": self.max_concurrency,
+            "maxQueue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "peakWaiting": self.peak_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
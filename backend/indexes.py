@@ -0,0 +1,179 @@
+"""Declared MongoDB indexes for the StreetBazaar collections.
+
+Run from the backend directory:
+    python indexes.py            create missing indexes, then report drift
+    python indexes.py --check    only report drift (exit status 1 if any)
+    python indexes.py --explain  show the winning plan of every hot query
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+
+class IndexSpec:
+    def __init__(self, collection: str, keys: List[Tuple[str, Any]], unique: bool = False,
+                 name: Optional[str] = None, **options: Any):
+        self.collection = collection
+        self.keys = keys
+        self.unique = unique
+        self.options = options
+        # Same naming scheme as pymongo, so indexes created without a name match
+        self.name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    def matches(self, info: Dict[str, Any]) -> bool:
+        return (list(info.get("key", [])) == [(field, direction) for field, direction in self.keys]
+                and bool(info.get("unique", False)) == self.unique
+                and all(info.get(option) == value for option, value in self.options.items()))
+
+
+INDEXES: List[IndexSpec] = [
+    # Login and registration look users up by email; principal lookups by id
+    IndexSpec("users", [("email", ASCENDING)], unique=True),
+    IndexSpec("users", [("id", ASCENDING)], unique=True),
+    # Nearby suppliers ($geoNear filtered by userType)
+    IndexSpec("users", [("location", "2dsphere"), ("userType", ASCENDING)]),
+
+    # Product detail, search fetches and cart pricing
+    IndexSpec("products", [("id", ASCENDING)], unique=True),
+    # Catalog pages, with and without a category filter
+    IndexSpec("products", [("isAvailable", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("products", [("isAvailable", ASCENDING), ("category", ASCENDING),
+                           ("createdAt", DESCENDING), ("id", DESCENDING)]),
+    # distinct("category") becomes a DISTINCT_SCAN
+    IndexSpec("products", [("category", ASCENDING)]),
+    # Nearby products ($geoNear filtered by availability and category)
+    IndexSpec("products", [("location", "2dsphere"), ("isAvailable", ASCENDING), ("category", ASCENDING)]),
+    # Catalog delta sync
+    IndexSpec("products", [("changeSeq", ASCENDING)]),
+
+    IndexSpec("orders", [("id", ASCENDING)], unique=True),
+    # Orders placed before checkouts existed used second-resolution timestamps
+    # that collide, so uniqueness is only enforced for checkout orders
+    IndexSpec("orders", [("orderNumber", ASCENDING)], unique=True,
+              partialFilterExpression={"checkoutId": {"$exists": True}}),
+    # Vendor and supplier order pages
+    IndexSpec("orders", [("vendorId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("orders", [("supplierId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+    # Polling source for the order event stream
+    IndexSpec("orders", [("updatedAt", ASCENDING)]),
+
+    # Stored idempotent responses expire after a day
+    IndexSpec("idempotency_keys", [("createdAt", ASCENDING)], expireAfterSeconds=24 * 60 * 60),
+]
+
+# (collection, filter, sort) for every query issued by a hot endpoint
+HOT_QUERIES: List[Tuple[str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("users", {"email": "rajesh.dosa@gmail.com"}, None),
+    ("users", {"id": "user-id"}, None),
+    ("users", {"location": {"$nearSphere": {"$geometry": {"type": "Point", "coordinates": [77.209, 28.6139]},
+                                            "$maxDistance": 25000}}, "userType": "supplier"}, None),
+    ("products", {"id": "product-id"}, None),
+    ("products", {"id": {"$in": ["product-id"]}, "isAvailable": True}, None),
+    ("products", {"isAvailable": True}, [("createdAt", -1), ("id", -1)]),
+    ("products", {"isAvailable": True, "category": "grains"}, [("createdAt", -1), ("id", -1)]),
+    ("products", {"changeSeq": {"$gt": 0}}, [("changeSeq", 1)]),
+    ("products", {"location": {"$nearSphere": {"$geometry": {"type": "Point", "coordinates": [77.209, 28.6139]},
+                                               "$maxDistance": 25000}}, "isAvailable": True}, None),
+    ("orders", {"vendorId": "vendor-id"}, [("createdAt", -1), ("id", -1)]),
+    ("orders", {"supplierId": "supplier-id"}, [("createdAt", -1), ("id", -1)]),
+    ("orders", {"id": "order-id", "supplierId": "supplier-id"}, None),
+    ("orders", {"supplierId": "supplier-id", "createdAt": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 2, 1)}},
+     [("createdAt", 1), ("id", 1)]),
+]
+
+
+async def ensure_indexes(db, specs: List[IndexSpec] = INDEXES) -> List[str]:
+    """Create every declared index that is missing; returns the names of failures."""
+    failed = []
+    for spec in specs:
+        try:
+            await db[spec.collection].create_index(spec.keys, name=spec.name, unique=spec.unique, **spec.options)
+        except OperationFailure as e:
+            failed.append(f"{spec.collection}.{spec.name}: {e}")
+    return failed
+
+
+async def index_drift(db, specs: List[IndexSpec] = INDEXES) -> Dict[str, List[str]]:
+    """Compare the declared indexes with the ones that exist in the database."""
+    drift: Dict[str, List[str]] = {"missing": [], "changed": [], "extra": []}
+    for collection in sorted({spec.collection for spec in specs}):
+        existing = await db[collection].index_information()
+        declared = {spec.name: spec for spec in specs if spec.collection == collection}
+        for name, spec in declared.items():
+            if name not in existing:
+                drift["missing"].append(f"{collection}.{name}")
+            elif not spec.matches(existing[name]):
+                drift["changed"].append(f"{collection}.{name}")
+        for name in existing:
+            if name != "_id_" and name not in declared:
+                drift["extra"].append(f"{collection}.{name}")
+    return drift
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries(db) -> List[Dict[str, Any]]:
+    """Winning plan stages of every hot query; any COLLSCAN is a missing index."""
+    results = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explained = await cursor.limit(51).explain()
+        stages = plan_stages(explained["queryPlanner"]["winningPlan"])
+        results.append({
+            "collection": collection,
+            "query": query,
+            "sort": sort,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return results
+
+
+async def main(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    try:
+        if args.explain:
+            results = await explain_hot_queries(db)
+            for result in results:
+                flag = "COLLSCAN" if result["collscan"] else "ok"
+                print(f"{flag:<9} {result['collection']}.find({result['query']}) sort={result['sort']} "
+                      f"-> {' <- '.join(result['stages'])}")
+            return 1 if any(result["collscan"] for result in results) else 0
+
+        if not args.check:
+            for failure in await ensure_indexes(db):
+                print(f"failed   {failure}")
+        drift = await index_drift(db)
+        for kind, names in drift.items():
+            for name in names:
+                print(f"{kind:<8} {name}")
+        return 1 if drift["missing"] or drift["changed"] else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage StreetBazaar MongoDB indexes")
+    parser.add_argument("--check", action="store_true", help="report drift without creating indexes")
+    parser.add_argument("--explain", action="store_true", help="explain every hot query")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,614 @@
+"""In-process storage engine.
+
+Documents live in dicts keyed by id, with sorted key lists standing in for
+the MongoDB indexes the queries need, so pages and lookups cost a bisect
+rather than a scan. Every operation runs without awaiting in between, so
+each is atomic with respect to other requests on the event loop. Nothing
+is persisted and nothing is shared between processes: run one worker.
+"""
+import asyncio
+import copy
+import math
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from cities import EARTH_RADIUS_KM, distance_km
+from storage import (CounterRepo, GeoPosition, IdempotencyRepo, OrderRepo, ProductRepo, Storage, SupplierStatsRepo,
+                     UserRepo)
+from supplier_stats import StatsChange, build_supplier_stats, supplier_drift
+
+# Same lifetime as the TTL index on idempotency_keys.createdAt
+IDEMPOTENCY_TTL = timedelta(days=1)
+
+
+def project(doc: dict, projection: Optional[Dict[str, int]]) -> dict:
+    """A copy of `doc` through a top-level MongoDB projection."""
+    if not projection:
+        return dict(doc)
+    fields = {field: value for field, value in projection.items() if field != "_id"}
+    if fields and all(fields.values()):
+        return {field: doc[field] for field in fields if field in doc}
+    return {field: value for field, value in doc.items() if field not in fields}
+
+
+def geo_distance(point: dict, location: dict) -> float:
+    # GeoJSON coordinates are [longitude, latitude]; distances are in metres like $geoNear's
+    (lng1, lat1), (lng2, lat2) = point["coordinates"], location["coordinates"]
+    return distance_km((lat1, lng1), (lat2, lng2)) * 1000
+
+
+def nearest(candidates: Iterable[dict], point: dict, radius_km: float, after: Optional[GeoPosition], limit: int,
+            projection: Dict[str, int]) -> List[dict]:
+    within = []
+    for doc in candidates:
+        location = doc.get("location")
+        if location is None:
+            continue
+        distance = geo_distance(point, location)
+        if distance <= radius_km * 1000 and (after is None or (distance, doc["id"]) > after):
+            within.append((distance, doc["id"], doc))
+    within.sort(key=lambda entry: entry[:2])
+    return [{**project(doc, projection), "distance": distance} for distance, _, doc in within[:limit]]
+
+
+class SortedKeys:
+    """Sorted (sort value, id) pairs: the in-memory stand-in for a compound index."""
+
+    __slots__ = ("keys",)
+
+    def __init__(self):
+        self.keys: List[tuple] = []
+
+    def add(self, key: tuple):
+        insort(self.keys, key)
+
+    def remove(self, key: tuple):
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def descending(self, before: Optional[tuple], limit: int) -> List[tuple]:
+        """Up to `limit` keys below `before` (or from the top), largest first."""
+        end = len(self.keys) if before is None else bisect_left(self.keys, before)
+        return self.keys[max(0, end - limit):end][::-1]
+
+    def ascending(self, start: tuple, limit: int, inclusive: bool = True) -> List[tuple]:
+        """Up to `limit` keys from `start` onwards, smallest first."""
+        begin = bisect_left(self.keys, start) if inclusive else bisect_right(self.keys, start)
+        return self.keys[begin:begin + limit]
+
+    def between(self, low: float, high: float) -> List[tuple]:
+        """Keys whose sort value is in [low, high], smallest first."""
+        begin = bisect_left(self.keys, (low,))
+        end = bisect_left(self.keys, (math.nextafter(high, math.inf),))
+        return self.keys[begin:end]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class GeoKeys:
+    """Located documents by (latitude, id): the in-memory stand-in for a 2dsphere
+    index. A radius query bisects to the circle's latitude band and drops the
+    longitudes outside its bounding box; only those candidates are measured."""
+
+    # Degrees added to each side of the box so rounding never drops a boundary point
+    SLACK = 1e-6
+
+    __slots__ = ("by_lat", "points")
+
+    def __init__(self):
+        self.by_lat = SortedKeys()
+        self.points: Dict[str, Tuple[float, float]] = {}
+
+    def add(self, doc_id: str, location: dict):
+        self.remove(doc_id)
+        lng, lat = location["coordinates"]
+        self.by_lat.add((lat, doc_id))
+        self.points[doc_id] = (lat, lng)
+
+    def remove(self, doc_id: str):
+        point = self.points.pop(doc_id, None)
+        if point is not None:
+            self.by_lat.remove((point[0], doc_id))
+
+    def within_box(self, point: dict, radius_km: float) -> List[str]:
+        lng, lat = point["coordinates"]
+        angle = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(angle) + self.SLACK
+        doc_ids = [doc_id for _, doc_id in self.by_lat.between(lat - dlat, lat + dlat)]
+        # The circle's widest longitude span; unbounded when it takes in a pole
+        if angle >= math.pi / 2 or math.sin(angle) >= math.cos(math.radians(lat)):
+            return doc_ids
+        dlng = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat)))) + self.SLACK
+        return [doc_id for doc_id in doc_ids if abs((self.points[doc_id][1] - lng + 180) % 360 - 180) <= dlng]
+
+
+class MemoryUserRepo(UserRepo):
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.by_email: Dict[str, str] = {}
+        self.suppliers: Set[str] = set()
+        self.supplier_locations = GeoKeys()
+
+    async def get(self, user_id, projection=None):
+        user = self.by_id.get(user_id)
+        return project(user, projection) if user is not None else None
+
+    async def get_by_email(self, email):
+        user_id = self.by_email.get(email)
+        return dict(self.by_id[user_id]) if user_id is not None else None
+
+    def _insert(self, user: dict):
+        if user["id"] in self.by_id or user["email"] in self.by_email:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: users dup key: {user['email']}")
+        user = copy.deepcopy(user)
+        self.by_id[user["id"]] = user
+        self.by_email[user["email"]] = user["id"]
+        if user.get("userType") == "supplier":
+            self.suppliers.add(user["id"])
+            if "location" in user:
+                self.supplier_locations.add(user["id"], user["location"])
+
+    async def insert(self, user):
+        self._insert(user)
+
+    async def insert_many(self, users):
+        for user in users:
+            self._insert(user)
+
+    async def clear(self):
+        self.by_id, self.by_email, self.suppliers = {}, {}, set()
+        self.supplier_locations = GeoKeys()
+
+    async def count(self):
+        return len(self.by_id)
+
+    async def unlocated(self):
+        return [{field: user[field] for field in ("id", "city", "state") if field in user}
+                for user in self.by_id.values() if "location" not in user]
+
+    async def set_locations(self, locations):
+        for user_id, location in locations.items():
+            if user_id in self.by_id:
+                self.by_id[user_id]["location"] = location
+                if user_id in self.suppliers:
+                    self.supplier_locations.add(user_id, location)
+
+    async def locations(self, user_ids):
+        return {user_id: self.by_id[user_id]["location"] for user_id in user_ids
+                if "location" in self.by_id.get(user_id, {})}
+
+    async def nearby_suppliers(self, point, radius_km, after, limit, projection):
+        return nearest((self.by_id[user_id] for user_id in self.supplier_locations.within_box(point, radius_km)),
+                       point, radius_km, after, limit, projection)
+
+
+class MemoryProductRepo(ProductRepo):
+    """Products by id, plus the catalog orderings: available products by
+    (createdAt, id) overall and per category, all products by changeSeq, and
+    located products by latitude."""
+
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.available: Dict[Optional[str], SortedKeys] = {None: SortedKeys()}
+        self.by_seq = SortedKeys()
+        self.locations = GeoKeys()
+        self.category_counts: Dict[str, int] = {}
+
+    def _index(self, product: dict):
+        if product.get("isAvailable", True):
+            key = (product["createdAt"], product["id"])
+            self.available[None].add(key)
+            self.available.setdefault(product["category"], SortedKeys()).add(key)
+        if "changeSeq" in product:
+            self.by_seq.add((product["changeSeq"], product["id"]))
+        if "location" in product:
+            self.locations.add(product["id"], product["location"])
+        self.category_counts[product["category"]] = self.category_counts.get(product["category"], 0) + 1
+
+    def _insert(self, product: dict):
+        if product["id"] in self.by_id:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: products dup key: {product['id']}")
+        product = copy.deepcopy(product)
+        self.by_id[product["id"]] = product
+        self._index(product)
+
+    async def get(self, product_id, projection=None):
+        product = self.by_id.get(product_id)
+        return project(product, projection) if product is not None else None
+
+    async def get_many(self, product_ids, projection=None, category=None, available_only=False):
+        products = []
+        for product_id in dict.fromkeys(product_ids):
+            product = self.by_id.get(product_id)
+            if product is None or (available_only and not product.get("isAvailable", True)):
+                continue
+            if category and product["category"] != category:
+                continue
+            products.append(project(product, projection))
+        return products
+
+    async def page(self, category, after, limit, projection):
+        index = self.available.get(category)
+        if index is None:
+            return []
+        return [project(self.by_id[product_id], projection) for _, product_id in index.descending(after, limit)]
+
+    async def nearby(self, point, radius_km, category, product_ids, after, limit, projection):
+        if product_ids is not None:
+            candidates = (self.by_id[product_id] for product_id in product_ids if product_id in self.by_id)
+        else:
+            candidates = (self.by_id[product_id] for product_id in self.locations.within_box(point, radius_km))
+        return nearest((product for product in candidates if product.get("isAvailable", True)
+                        and (not category or product["category"] == category)),
+                       point, radius_km, after, limit, projection)
+
+    async def categories(self):
+        return sorted(category for category, count in self.category_counts.items() if count)
+
+    async def changes(self, since_seq, limit, projection):
+        return [project(self.by_id[product_id], projection)
+                for _, product_id in self.by_seq.ascending((since_seq + 1,), limit)]
+
+    async def insert(self, product):
+        self._insert(product)
+
+    async def insert_many(self, products):
+        errors = {}
+        for position, product in enumerate(products):
+            try:
+                self._insert(product)
+            except DuplicateKeyError as e:
+                errors[position] = str(e)
+        return errors
+
+    async def clear(self):
+        self.by_id, self.by_seq, self.category_counts = {}, SortedKeys(), {}
+        self.available, self.locations = {None: SortedKeys()}, GeoKeys()
+
+    async def scan(self, projection, created_since=None):
+        for product in list(self.by_id.values()):
+            if created_since is None or product["createdAt"] >= created_since:
+                yield project(product, projection)
+
+    async def unstamped(self):
+        return [{"id": product["id"], "createdAt": product.get("createdAt")}
+                for product in self.by_id.values() if "changeSeq" not in product]
+
+    async def stamp(self, stamps):
+        for product_id, seq, updated_at in stamps:
+            product = self.by_id.get(product_id)
+            if product is not None and "changeSeq" not in product:
+                product.update({"changeSeq": seq, "updatedAt": updated_at})
+                self.by_seq.add((seq, product_id))
+
+    async def unlocated_suppliers(self):
+        return sorted({product["supplierId"] for product in self.by_id.values() if "location" not in product})
+
+    async def locate(self, locations):
+        changed = 0
+        for product in self.by_id.values():
+            if "location" not in product and product["supplierId"] in locations:
+                product["location"] = locations[product["supplierId"]]
+                self.locations.add(product["id"], product["location"])
+                changed += 1
+        return changed
+
+    async def stock(self, product_ids):
+        return {product_id: self.by_id[product_id]["stock"] for product_id in product_ids if product_id in self.by_id}
+
+    def _level(self, product: dict) -> dict:
+        return {"id": product["id"], "supplierId": product["supplierId"], "stock": product["stock"]}
+
+    def _can_take(self, item: dict, taken: int = 0) -> bool:
+        product = self.by_id.get(item["productId"])
+        return (product is not None and product.get("isAvailable", True)
+                and product["stock"] - taken >= item["quantity"])
+
+    def _restamp(self, product: dict, stamp: dict):
+        if "changeSeq" in product:
+            self.by_seq.remove((product["changeSeq"], product["id"]))
+        product.update(stamp)
+        self.by_seq.add((product["changeSeq"], product["id"]))
+
+    async def adjust_stock(self, items, sign, stamps):
+        levels = []
+        for item in items:
+            product = self.by_id.get(item["productId"])
+            if product is None or (sign < 0 and not self._can_take(item)):
+                levels.append(None)
+                continue
+            product["stock"] += sign * item["quantity"]
+            self._restamp(product, stamps[product["id"]])
+            levels.append(self._level(product))
+        return levels
+
+    async def reserve_stock(self, items, stamps):
+        # Checked in full before anything is taken; nothing else runs in between
+        taken: Dict[str, int] = {}
+        failed = []
+        for item in items:
+            if self._can_take(item, taken.get(item["productId"], 0)):
+                taken[item["productId"]] = taken.get(item["productId"], 0) + item["quantity"]
+            else:
+                failed.append(item)
+        if failed:
+            return None, failed
+        return await self.adjust_stock(items, -1, stamps), []
+
+
+class MemoryOrderRepo(OrderRepo):
+    """Orders by id, with (createdAt, id) keys per vendor and per supplier,
+    (updatedAt, id) keys for change polling, and ids per checkout."""
+
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.by_owner: Dict[Tuple[str, str], SortedKeys] = {}
+        self.by_checkout: Dict[str, List[str]] = {}
+        self.by_updated = SortedKeys()
+        self.watchers: Set[asyncio.Queue] = set()
+
+    def _owner_index(self, owner: Dict[str, str]) -> Optional[SortedKeys]:
+        (field, value), = owner.items()
+        return self.by_owner.get((field, value))
+
+    def _notify(self, order: dict):
+        for queue in self.watchers:
+            queue.put_nowait(copy.deepcopy(order))
+
+    async def insert_many(self, orders):
+        if any(order["id"] in self.by_id for order in orders):
+            raise DuplicateKeyError("E11000 duplicate key error collection: orders dup key: id")
+        for order in orders:
+            order = copy.deepcopy(order)
+            self.by_id[order["id"]] = order
+            key = (order["createdAt"], order["id"])
+            for field in ("vendorId", "supplierId"):
+                self.by_owner.setdefault((field, order[field]), SortedKeys()).add(key)
+            self.by_checkout.setdefault(order.get("checkoutId", ""), []).append(order["id"])
+            self.by_updated.add((order.get("updatedAt") or order["createdAt"], order["id"]))
+            self._notify(order)
+
+    async def clear(self):
+        # Watchers stay subscribed; only the orders go
+        self.by_id, self.by_owner, self.by_checkout, self.by_updated = {}, {}, {}, SortedKeys()
+
+    async def delete_checkout(self, checkout_id):
+        for order_id in self.by_checkout.pop(checkout_id, []):
+            order = self.by_id.pop(order_id, None)
+            if order is None:
+                continue
+            key = (order["createdAt"], order_id)
+            for field in ("vendorId", "supplierId"):
+                self.by_owner[(field, order[field])].remove(key)
+            self.by_updated.remove((order.get("updatedAt") or order["createdAt"], order_id))
+
+    async def page(self, owner, after, limit, projection):
+        index = self._owner_index(owner)
+        if index is None:
+            return []
+        return [project(self.by_id[order_id], projection) for _, order_id in index.descending(after, limit)]
+
+    async def export(self, owner, start, end, projection, batch_size):
+        index = self._owner_index(owner)
+        if index is None:
+            return
+        # Resumed by key each batch, so orders written meanwhile cannot shift it
+        position: tuple = (start,) if start else ()
+        inclusive = True
+        while True:
+            keys = index.ascending(position, batch_size, inclusive)
+            for key in keys:
+                if end is not None and key[0] >= end:
+                    return
+                if key[1] in self.by_id:
+                    yield project(self.by_id[key[1]], projection)
+            if len(keys) < batch_size:
+                return
+            position, inclusive = keys[-1], False
+            await asyncio.sleep(0)
+
+    async def update_status(self, order_id, supplier_id, status, updated_at, projection):
+        order = self.by_id.get(order_id)
+        if order is None or order["supplierId"] != supplier_id or order["status"] == "cancelled":
+            return None
+        before = project(order, projection)
+        self.by_updated.remove((order.get("updatedAt") or order["createdAt"], order_id))
+        order.update({"status": status, "updatedAt": updated_at})
+        self.by_updated.add((updated_at, order_id))
+        self._notify(order)
+        return before
+
+    async def exists(self, order_id, supplier_id):
+        order = self.by_id.get(order_id)
+        return order is not None and order["supplierId"] == supplier_id
+
+    async def changed_since(self, since, projection):
+        for _, order_id in self.by_updated.ascending((since,), len(self.by_updated)):
+            yield project(self.by_id[order_id], projection)
+
+    async def watch(self):
+        queue: asyncio.Queue = asyncio.Queue()
+        self.watchers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.watchers.discard(queue)
+
+    async def supplier_analytics(self, supplier_id, days, weeks, now, top_products, top_vendors):
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        daily_from = today - timedelta(days=days - 1)
+        weekly_from = today - timedelta(days=today.weekday()) - timedelta(weeks=weeks - 1)
+        totals = {"revenue": 0.0, "orders": 0, "units": 0}
+        statuses: Dict[str, Dict[str, Any]] = {}
+        products: Dict[str, Dict[str, Any]] = {}
+        vendors: Dict[str, Dict[str, Any]] = {}
+        daily: Dict[str, Dict[str, Any]] = {}
+        weekly: Dict[str, Dict[str, Any]] = {}
+
+        def add_period(periods: Dict[str, Dict[str, Any]], period: str, order: dict, units: int):
+            row = periods.setdefault(period, {"period": period, "orders": 0, "units": 0, "revenue": 0.0})
+            row["orders"] += 1
+            row["units"] += units
+            row["revenue"] += order["totalAmount"]
+
+        index = self.by_owner.get(("supplierId", supplier_id))
+        for _, order_id in (index.keys if index else []):
+            order = self.by_id[order_id]
+            status = statuses.setdefault(order["status"], {"status": order["status"], "orders": 0, "revenue": 0.0})
+            status["orders"] += 1
+            status["revenue"] += order["totalAmount"]
+            if order["status"] == "cancelled":
+                continue
+            units = sum(item["quantity"] for item in order["items"])
+            totals["revenue"] += order["totalAmount"]
+            totals["orders"] += 1
+            totals["units"] += units
+            for item in order["items"]:
+                product = products.setdefault(item["productId"], {"productId": item["productId"], "units": 0,
+                                                                  "revenue": 0.0})
+                product["productName"] = item["productName"]
+                product["units"] += item["quantity"]
+                product["revenue"] += item["totalPrice"]
+            vendor = vendors.setdefault(order["vendorId"], {"vendorId": order["vendorId"], "orders": 0,
+                                                            "revenue": 0.0})
+            vendor["vendorName"] = order.get("vendorName", "")
+            vendor["orders"] += 1
+            vendor["revenue"] += order["totalAmount"]
+            if order["createdAt"] >= daily_from:
+                add_period(daily, order["createdAt"].strftime("%Y-%m-%d"), order, units)
+            if order["createdAt"] >= weekly_from:
+                add_period(weekly, order["createdAt"].strftime("%G-W%V"), order, units)
+
+        return {
+            "totals": [totals] if totals["orders"] else [],
+            "byStatus": sorted(statuses.values(), key=lambda row: (-row["orders"], row["status"])),
+            "products": sorted(products.values(), key=lambda row: (-row["units"], row["productId"]))[:top_products],
+            "topVendors": sorted(vendors.values(), key=lambda row: (-row["revenue"], row["vendorId"]))[:top_vendors],
+            "daily": [daily[period] for period in sorted(daily)],
+            "weekly": [weekly[period] for period in sorted(weekly)],
+        }
+
+
+class MemorySupplierStatsRepo(SupplierStatsRepo):
+    def __init__(self, products: MemoryProductRepo, orders: MemoryOrderRepo):
+        self.products = products
+        self.orders = orders
+        self.by_supplier: Dict[str, dict] = {}
+
+    async def apply(self, changes: List[StatsChange]):
+        for supplier_id, increments in changes:
+            stats = self.by_supplier.setdefault(supplier_id, {"_id": supplier_id})
+            for path, amount in increments.items():
+                *parents, field = path.split(".")
+                target = stats
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                target[field] = target.get(field, 0) + amount
+
+    async def clear(self):
+        self.by_supplier = {}
+
+    async def get(self, supplier_id, days):
+        stats = self.by_supplier.get(supplier_id)
+        if stats is None:
+            return None
+        stats = copy.deepcopy({key: value for key, value in stats.items() if key != "_id"})
+        revenue_by_day = stats.get("revenueByDay", {})
+        stats["revenueByDay"] = {day: revenue_by_day[day] for day in days if day in revenue_by_day}
+        return stats
+
+    async def count(self):
+        return len(self.by_supplier)
+
+    async def reconcile(self, low_stock_threshold, fix=False):
+        expected = build_supplier_stats(self.orders.by_id.values(), self.products.by_id.values(),
+                                        low_stock_threshold)
+        drift = supplier_drift(expected, self.by_supplier.values())
+        if fix:
+            now = datetime.utcnow()
+            for supplier_id in drift:
+                self.by_supplier[supplier_id] = {**expected.get(supplier_id, {"_id": supplier_id}), "updatedAt": now}
+        return drift
+
+
+class MemoryCounterRepo(CounterRepo):
+    def __init__(self):
+        self.values: Dict[str, int] = {}
+
+    async def increment(self, name, count=1):
+        self.values[name] = self.values.get(name, 0) + count
+        return self.values[name]
+
+
+class MemoryIdempotencyRepo(IdempotencyRepo):
+    """Records in creation order, so the expired ones are always at the front
+    and are swept there on every create (the engine's TTL index)."""
+
+    def __init__(self):
+        self.records: Dict[str, dict] = {}
+
+    def _sweep(self):
+        expired_before = datetime.utcnow() - IDEMPOTENCY_TTL
+        while self.records:
+            record_id, record = next(iter(self.records.items()))
+            if record["createdAt"] >= expired_before:
+                break
+            del self.records[record_id]
+
+    def _live(self, record_id: str) -> Optional[dict]:
+        record = self.records.get(record_id)
+        if record is not None and record["createdAt"] < datetime.utcnow() - IDEMPOTENCY_TTL:
+            del self.records[record_id]
+            return None
+        return record
+
+    async def create(self, record):
+        self._sweep()
+        if self._live(record["_id"]) is not None:
+            return False
+        self.records[record["_id"]] = dict(record)
+        return True
+
+    async def take_over(self, record_id, fingerprint, locked_before, now):
+        record = self._live(record_id)
+        if (record is None or record["state"] != "pending" or record["fingerprint"] != fingerprint
+                or record["lockedAt"] >= locked_before):
+            return False
+        record["lockedAt"] = now
+        return True
+
+    async def get(self, record_id):
+        record = self._live(record_id)
+        return dict(record) if record is not None else None
+
+    async def complete(self, record_id, body):
+        record = self._live(record_id)
+        if record is not None:
+            record.update({"state": "done", "body": body})
+
+    async def delete(self, record_id):
+        self.records.pop(record_id, None)
+
+
+class MemoryStorage(Storage):
+    engine = "memory"
+
+    def __init__(self):
+        self.users = MemoryUserRepo()
+        self.products = MemoryProductRepo()
+        self.orders = MemoryOrderRepo()
+        self.supplier_stats = MemorySupplierStatsRepo(self.products, self.orders)
+        self.counters = MemoryCounterRepo()
+        self.idempotency = MemoryIdempotencyRepo()
+
+    async def prepare(self):
+        """Nothing to create: the indexes are built as documents arrive."""
+
+    def close(self):
+        """Nothing to release."""
@@ -0,0 +1,196 @@
+"""Request and MongoDB command metrics in the Prometheus text format.
+
+MetricsMiddleware times every HTTP request by route template, and
+CommandMetrics (a pymongo command listener) times every command by
+collection and operation. Both record into one Metrics object that
+renders the /metrics page.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from pymongo import monitoring
+
+# Seconds; the implicit +Inf bucket catches everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests that matched no route share one label, so unknown paths cannot
+# grow the number of series
+UNMATCHED_ROUTE = "unmatched"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteStats:
+    """Latency and response statuses of one method and route template."""
+
+    __slots__ = ("latency", "statuses")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.latency = Histogram(buckets)
+        self.statuses: Dict[int, int] = {}
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def label_text(names: Iterable[str], values: Iterable[str]) -> str:
+    return ",".join(f'{name}="{escape_label(str(value))}"' for name, value in zip(names, values))
+
+
+def render_histogram(lines: List[str], name: str, help_text: str, label_names: Tuple[str, ...],
+                     series: Dict[tuple, Histogram]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in sorted(series.items()):
+        base = label_text(label_names, labels)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{base},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{base}}} {histogram.sum!r}")
+        lines.append(f"{name}_count{{{base}}} {histogram.count}")
+
+
+def render_counter(lines: List[str], name: str, help_text: str, label_names: Tuple[str, ...],
+                   series: Dict[tuple, int], kind: str = "counter"):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in sorted(series.items()):
+        lines.append(f"{name}{{{label_text(label_names, labels)}}} {value}" if labels else f"{name} {value}")
+
+
+class Metrics:
+    """Process-wide request and database metrics.
+
+    Request metrics are only touched from the event loop. Command events
+    arrive on pymongo's threads, so database metrics take a lock.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.in_flight = 0
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.db_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.db_failures: Dict[Tuple[str, str], int] = {}
+        self._db_lock = threading.Lock()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        # One lookup per request; this runs on every response
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = RouteStats(self.buckets)
+        stats.latency.observe(seconds)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def observe_command(self, collection: str, command: str, seconds: float, failed: bool = False):
+        with self._db_lock:
+            histogram = self.db_latency.get((collection, command))
+            if histogram is None:
+                histogram = self.db_latency[(collection, command)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if failed:
+                self.db_failures[(collection, command)] = self.db_failures.get((collection, command), 0) + 1
+
+    def render(self) -> str:
+        lines: List[str] = []
+        render_counter(lines, "http_requests_in_flight", "HTTP requests being served", (),
+                       {(): self.in_flight}, kind="gauge")
+        render_counter(lines, "http_requests_total", "HTTP responses by route and status",
+                       ("method", "route", "status"),
+                       {(method, route, str(status)): count for (method, route), stats in self.routes.items()
+                        for status, count in stats.statuses.items()})
+        render_histogram(lines, "http_request_duration_seconds", "Time to serve HTTP requests, by route",
+                         ("method", "route"), {key: stats.latency for key, stats in self.routes.items()})
+        with self._db_lock:
+            render_histogram(lines, "mongodb_command_duration_seconds", "MongoDB command round trips",
+                             ("collection", "command"), self.db_latency)
+            render_counter(lines, "mongodb_command_failures_total", "MongoDB commands that returned an error",
+                           ("collection", "command"), self.db_failures)
+        lines.append("")
+        return "\n".join(lines)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight count per route template.
+
+    Streaming responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight -= 1
+            # The router adds the matched route to the scope it was given
+            route = scope.get("route")
+            metrics.observe_request(scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status,
+                                    time.perf_counter() - started)
+
+
+def command_collection(event) -> str:
+    # The command's first key names it and usually holds the collection;
+    # getMore carries the collection separately
+    target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+    return target if isinstance(target, str) else ""
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Times MongoDB commands per collection; pass it to the client's event_listeners."""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._collections: Dict[Tuple[object, int], str] = {}
+
+    def started(self, event):
+        if not self.metrics.enabled:
+            return
+        self._collections[(event.connection_id, event.request_id)] = command_collection(event)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        self.metrics.observe_command(collection, event.command_name, event.duration_micros / 1e6, failed)
@@ -0,0 +1,491 @@
+"""MongoDB storage engine (Motor)."""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from indexes import ensure_indexes, index_drift
+from storage import (CounterRepo, GeoPosition, IdempotencyRepo, KeysetPosition, OrderRepo, ProductRepo, Storage,
+                     SupplierStatsRepo, UserRepo)
+from supplier_stats import StatsChange, reconcile_supplier_stats
+
+logger = logging.getLogger(__name__)
+
+STOCK_LEVEL_PROJECTION = {"_id": 0, "id": 1, "supplierId": 1, "stock": 1}
+
+
+def after_query(query: dict, after: Optional[KeysetPosition]) -> dict:
+    # Newest first with id as the tie-breaker, so the order is total and stable
+    if after is None:
+        return query
+    created_at, last_id = after
+    return {"$and": [query, {"$or": [
+        {"createdAt": {"$lt": created_at}},
+        {"createdAt": created_at, "id": {"$lt": last_id}},
+    ]}]}
+
+
+async def keyset_find(collection, query: dict, after: Optional[KeysetPosition], limit: int,
+                      projection: Dict[str, int]) -> List[dict]:
+    return await collection.find(after_query(query, after), projection).sort(
+        [("createdAt", -1), ("id", -1)]).limit(limit).to_list(limit)
+
+
+async def geo_near(collection, point: dict, radius_km: float, query: dict, after: Optional[GeoPosition], limit: int,
+                   projection: Dict[str, int]) -> List[dict]:
+    # Users in the same city share its coordinates, so equal distances are
+    # common. Resuming restarts $geoNear at the last distance (minDistance is
+    # inclusive) and skips the ids already returned at exactly that distance.
+    stage = {"near": point, "key": "location", "distanceField": "distance", "spherical": True,
+             "maxDistance": radius_km * 1000, "query": query}
+    resume = []
+    if after is not None:
+        last_distance, last_id = after
+        stage["minDistance"] = last_distance
+        resume.append({"$match": {"$or": [
+            {"distance": {"$gt": last_distance}},
+            {"distance": last_distance, "id": {"$gt": last_id}},
+        ]}})
+    pipeline = [
+        {"$geoNear": stage},
+        *resume,
+        {"$sort": {"distance": 1, "id": 1}},
+        {"$limit": limit},
+        {"$project": {**projection, "distance": 1}},
+    ]
+    return await collection.aggregate(pipeline).to_list(limit)
+
+
+class MongoUserRepo(UserRepo):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, user_id, projection=None):
+        return await self.collection.find_one({"id": user_id}, projection or {"_id": 0})
+
+    async def get_by_email(self, email):
+        return await self.collection.find_one({"email": email}, {"_id": 0})
+
+    async def insert(self, user):
+        await self.collection.insert_one(dict(user))
+
+    async def insert_many(self, users):
+        await self.collection.insert_many([dict(user) for user in users])
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+    async def count(self):
+        return await self.collection.count_documents({})
+
+    async def unlocated(self):
+        return await self.collection.find({"location": {"$exists": False}},
+                                          {"_id": 0, "id": 1, "city": 1, "state": 1}).to_list(None)
+
+    async def set_locations(self, locations):
+        if locations:
+            await self.collection.bulk_write([
+                UpdateOne({"id": user_id}, {"$set": {"location": location}})
+                for user_id, location in locations.items()
+            ], ordered=False)
+
+    async def locations(self, user_ids):
+        users = await self.collection.find({"id": {"$in": list(user_ids)}, "location": {"$exists": True}},
+                                           {"_id": 0, "id": 1, "location": 1}).to_list(None)
+        return {user["id"]: user["location"] for user in users}
+
+    async def nearby_suppliers(self, point, radius_km, after, limit, projection):
+        return await geo_near(self.collection, point, radius_km, {"userType": "supplier"}, after, limit, projection)
+
+
+class MongoProductRepo(ProductRepo):
+    def __init__(self, collection, storage: "MongoStorage"):
+        self.collection = collection
+        self.storage = storage
+
+    async def get(self, product_id, projection=None):
+        return await self.collection.find_one({"id": product_id}, projection or {"_id": 0})
+
+    async def get_many(self, product_ids, projection=None, category=None, available_only=False):
+        query: Dict[str, Any] = {"id": {"$in": product_ids}}
+        if available_only:
+            query["isAvailable"] = True
+        if category:
+            query["category"] = category
+        return await self.collection.find(query, projection or {"_id": 0}).to_list(len(product_ids))
+
+    async def page(self, category, after, limit, projection):
+        query = {"isAvailable": True, **({"category": category} if category else {})}
+        return await keyset_find(self.collection, query, after, limit, projection)
+
+    async def nearby(self, point, radius_km, category, product_ids, after, limit, projection):
+        query: Dict[str, Any] = {"isAvailable": True}
+        if category:
+            query["category"] = category
+        if product_ids is not None:
+            query["id"] = {"$in": product_ids}
+        return await geo_near(self.collection, point, radius_km, query, after, limit, projection)
+
+    async def categories(self):
+        return await self.collection.distinct("category")
+
+    async def changes(self, since_seq, limit, projection):
+        return await self.collection.find({"changeSeq": {"$gt": since_seq}}, projection).sort(
+            "changeSeq", 1).limit(limit).to_list(limit)
+
+    async def insert(self, product):
+        await self.collection.insert_one(dict(product))
+
+    async def insert_many(self, products):
+        try:
+            await self.collection.insert_many([dict(product) for product in products], ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+        return {}
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+    async def scan(self, projection, created_since=None):
+        query = {"createdAt": {"$gte": created_since}} if created_since else {}
+        async for product in self.collection.find(query, projection):
+            yield product
+
+    async def unstamped(self):
+        return await self.collection.find({"changeSeq": {"$exists": False}},
+                                          {"_id": 0, "id": 1, "createdAt": 1}).to_list(None)
+
+    async def stamp(self, stamps):
+        if stamps:
+            await self.collection.bulk_write([
+                UpdateOne({"id": product_id, "changeSeq": {"$exists": False}},
+                          {"$set": {"changeSeq": seq, "updatedAt": updated_at}})
+                for product_id, seq, updated_at in stamps
+            ], ordered=False)
+
+    async def unlocated_suppliers(self):
+        return await self.collection.distinct("supplierId", {"location": {"$exists": False}})
+
+    async def locate(self, locations):
+        if not locations:
+            return 0
+        result = await self.collection.bulk_write([
+            UpdateMany({"supplierId": supplier_id, "location": {"$exists": False}}, {"$set": {"location": location}})
+            for supplier_id, location in locations.items()
+        ], ordered=False)
+        return result.modified_count
+
+    async def stock(self, product_ids):
+        products = await self.collection.find({"id": {"$in": product_ids}},
+                                              {"_id": 0, "id": 1, "stock": 1}).to_list(len(product_ids))
+        return {product["id"]: product["stock"] for product in products}
+
+    @staticmethod
+    def stock_changes(items: List[dict], sign: int, stamps: Dict[str, dict]) -> List[Tuple[dict, dict]]:
+        # (filter, update) per line; taking stock is guarded so it can never go negative
+        changes = []
+        for item in items:
+            query = {"id": item["productId"]}
+            if sign < 0:
+                query.update({"isAvailable": True, "stock": {"$gte": item["quantity"]}})
+            changes.append((query, {"$inc": {"stock": sign * item["quantity"]}, "$set": stamps[item["productId"]]}))
+        return changes
+
+    async def adjust_stock(self, items, sign, stamps):
+        # One guarded update per line, sent concurrently
+        return list(await asyncio.gather(*(
+            self.collection.find_one_and_update(query, update, projection=STOCK_LEVEL_PROJECTION,
+                                                return_document=ReturnDocument.AFTER)
+            for query, update in self.stock_changes(items, sign, stamps)
+        )))
+
+    async def reserve_stock(self, items, stamps):
+        # With transactions, one bulk write of guarded $inc updates commits only
+        # if every line matched. Bulk results cannot say which guarded updates
+        # matched, so after a failed bulk the reservation is retried line by line
+        # in a fresh transaction, which commits or is aborted with the lines that
+        # failed. Without transactions, each line's update is sent concurrently
+        # and the lines that succeeded are given back if any line failed.
+        if not self.storage.transactions_supported:
+            levels = await self.adjust_stock(items, -1, stamps)
+            reserved = [item for item, level in zip(items, levels) if level is not None]
+            if len(reserved) == len(items):
+                return levels, []
+            if reserved:
+                # Same stamps: the give-back lands within the changes settle window
+                await self.adjust_stock(reserved, +1, stamps)
+            return None, [item for item, level in zip(items, levels) if level is None]
+
+        per_line = False
+        attempt = 0
+        while True:
+            try:
+                async with await self.storage.client.start_session() as session:
+                    async with session.start_transaction():
+                        changes = self.stock_changes(items, -1, stamps)
+                        if per_line:
+                            failed = []
+                            for item, (query, update) in zip(items, changes):
+                                result = await self.collection.update_one(query, update, session=session)
+                                if not result.matched_count:
+                                    failed.append(item)
+                            if failed:
+                                await session.abort_transaction()
+                                return None, failed
+                        else:
+                            updates = [UpdateOne(query, update) for query, update in changes]
+                            result = await self.collection.bulk_write(updates, ordered=True, session=session)
+                            if result.modified_count != len(items):
+                                await session.abort_transaction()
+                                per_line = True
+                                continue
+                        # Read back inside the transaction for exact post-reservation stock
+                        levels = await self.collection.find(
+                            {"id": {"$in": [item["productId"] for item in items]}}, STOCK_LEVEL_PROJECTION,
+                            session=session,
+                        ).to_list(len(items))
+                        return levels, []
+            except PyMongoError as e:
+                attempt += 1
+                if not e.has_error_label("TransientTransactionError") or attempt == 5:
+                    raise
+
+
+def sales_period_group(date_format: str) -> List[dict]:
+    return [
+        {"$group": {
+            "_id": {"$dateToString": {"format": date_format, "date": "$createdAt"}},
+            "orders": {"$sum": 1},
+            "units": {"$sum": {"$sum": "$items.quantity"}},
+            "revenue": {"$sum": "$totalAmount"},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "period": "$_id", "orders": 1, "units": 1, "revenue": 1}},
+    ]
+
+
+def supplier_analytics_pipeline(supplier_id: str, days: int, weeks: int, now: datetime,
+                                top_products: int, top_vendors: int) -> List[dict]:
+    """One pass over the supplier's orders; every facet but byStatus excludes cancelled orders."""
+    not_cancelled = {"$match": {"status": {"$ne": "cancelled"}}}
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    this_week = today - timedelta(days=today.weekday())
+    return [
+        # Served by the supplierId/createdAt/id orders index; oldest first, so
+        # $last picks the names from the supplier's latest order
+        {"$match": {"supplierId": supplier_id}},
+        {"$sort": {"createdAt": 1, "id": 1}},
+        {"$project": {"_id": 0, "status": 1, "totalAmount": 1, "createdAt": 1, "vendorId": 1, "vendorName": 1,
+                      "items.productId": 1, "items.productName": 1, "items.quantity": 1, "items.totalPrice": 1}},
+        {"$facet": {
+            "totals": [
+                not_cancelled,
+                {"$group": {"_id": None, "revenue": {"$sum": "$totalAmount"}, "orders": {"$sum": 1},
+                            "units": {"$sum": {"$sum": "$items.quantity"}}}},
+                {"$project": {"_id": 0}},
+            ],
+            "byStatus": [
+                {"$group": {"_id": "$status", "orders": {"$sum": 1}, "revenue": {"$sum": "$totalAmount"}}},
+                {"$sort": {"orders": -1, "_id": 1}},
+                {"$project": {"_id": 0, "status": "$_id", "orders": 1, "revenue": 1}},
+            ],
+            "products": [
+                not_cancelled,
+                {"$unwind": "$items"},
+                {"$group": {"_id": "$items.productId", "productName": {"$last": "$items.productName"},
+                            "units": {"$sum": "$items.quantity"}, "revenue": {"$sum": "$items.totalPrice"}}},
+                {"$sort": {"units": -1, "_id": 1}},
+                {"$limit": top_products},
+                {"$project": {"_id": 0, "productId": "$_id", "productName": 1, "units": 1, "revenue": 1}},
+            ],
+            "topVendors": [
+                not_cancelled,
+                {"$group": {"_id": "$vendorId", "vendorName": {"$last": "$vendorName"},
+                            "orders": {"$sum": 1}, "revenue": {"$sum": "$totalAmount"}}},
+                {"$sort": {"revenue": -1, "_id": 1}},
+                {"$limit": top_vendors},
+                {"$project": {"_id": 0, "vendorId": "$_id", "vendorName": 1, "orders": 1, "revenue": 1}},
+            ],
+            "daily": [
+                not_cancelled,
+                {"$match": {"createdAt": {"$gte": today - timedelta(days=days - 1)}}},
+                *sales_period_group("%Y-%m-%d"),
+            ],
+            "weekly": [
+                not_cancelled,
+                {"$match": {"createdAt": {"$gte": this_week - timedelta(weeks=weeks - 1)}}},
+                *sales_period_group("%G-W%V"),
+            ],
+        }},
+    ]
+
+
+class MongoOrderRepo(OrderRepo):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert_many(self, orders):
+        await self.collection.insert_many([dict(order) for order in orders])
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+    async def delete_checkout(self, checkout_id):
+        await self.collection.delete_many({"checkoutId": checkout_id})
+
+    async def page(self, owner, after, limit, projection):
+        return await keyset_find(self.collection, dict(owner), after, limit, projection)
+
+    async def export(self, owner, start, end, projection, batch_size):
+        query: Dict[str, Any] = dict(owner)
+        if start or end:
+            query["createdAt"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+        cursor = self.collection.find(query, projection).sort([("createdAt", 1), ("id", 1)]).batch_size(batch_size)
+        async for order in cursor:
+            yield order
+
+    async def update_status(self, order_id, supplier_id, status, updated_at, projection):
+        return await self.collection.find_one_and_update(
+            {"id": order_id, "supplierId": supplier_id, "status": {"$ne": "cancelled"}},
+            {"$set": {"status": status, "updatedAt": updated_at}},
+            projection=projection,
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def exists(self, order_id, supplier_id):
+        return bool(await self.collection.count_documents({"id": order_id, "supplierId": supplier_id}, limit=1))
+
+    async def changed_since(self, since, projection):
+        async for order in self.collection.find({"updatedAt": {"$gte": since}}, projection).sort("updatedAt", 1):
+            yield order
+
+    async def watch(self):
+        # Needs a replica set; the caller reconnects when the stream fails
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        async with self.collection.watch(pipeline, full_document="updateLookup") as stream:
+            async for change in stream:
+                if change.get("fullDocument"):
+                    yield change["fullDocument"]
+
+    async def supplier_analytics(self, supplier_id, days, weeks, now, top_products, top_vendors):
+        pipeline = supplier_analytics_pipeline(supplier_id, days, weeks, now, top_products, top_vendors)
+        return (await self.collection.aggregate(pipeline).to_list(1))[0]
+
+
+class MongoSupplierStatsRepo(SupplierStatsRepo):
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.supplier_stats
+
+    async def apply(self, changes: List[StatsChange]):
+        if changes:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": supplier_id}, {"$inc": increments}, upsert=True)
+                for supplier_id, increments in changes
+            ], ordered=False)
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+    async def get(self, supplier_id, days):
+        return await self.collection.find_one(
+            {"_id": supplier_id},
+            {"_id": 0, "orders": 1, "revenue": 1, "unitsSold": 1, "products": 1,
+             **{f"revenueByDay.{day}": 1 for day in days}},
+        )
+
+    async def count(self):
+        return await self.collection.estimated_document_count()
+
+    async def reconcile(self, low_stock_threshold, fix=False):
+        return await reconcile_supplier_stats(self.db, low_stock_threshold, fix=fix)
+
+
+class MongoCounterRepo(CounterRepo):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def increment(self, name, count=1):
+        counter = await self.collection.find_one_and_update(
+            {"_id": name}, {"$inc": {"value": count}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter["value"]
+
+
+class MongoIdempotencyRepo(IdempotencyRepo):
+    """Records expire through the TTL index on idempotency_keys.createdAt."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def create(self, record):
+        try:
+            await self.collection.insert_one(dict(record))
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def take_over(self, record_id, fingerprint, locked_before, now):
+        stale = await self.collection.find_one_and_update(
+            {"_id": record_id, "state": "pending", "fingerprint": fingerprint, "lockedAt": {"$lt": locked_before}},
+            {"$set": {"lockedAt": now}},
+        )
+        return stale is not None
+
+    async def get(self, record_id):
+        return await self.collection.find_one({"_id": record_id})
+
+    async def complete(self, record_id, body):
+        await self.collection.update_one({"_id": record_id}, {"$set": {"state": "done", "body": body}})
+
+    async def delete(self, record_id):
+        await self.collection.delete_one({"_id": record_id})
+
+
+class MongoStorage(Storage):
+    """Repositories over one Motor database.
+
+    `use_transactions` is "true", "false" or "auto"; auto uses multi-document
+    transactions for stock reservation when the deployment is a replica set
+    or sharded cluster.
+    """
+
+    engine = "mongo"
+
+    def __init__(self, client, db, use_transactions: str = "auto"):
+        self.client = client
+        self.db = db
+        self.use_transactions = use_transactions
+        self.transactions_supported = False
+        self.users = MongoUserRepo(db.users)
+        self.products = MongoProductRepo(db.products, self)
+        self.orders = MongoOrderRepo(db.orders)
+        self.supplier_stats = MongoSupplierStatsRepo(db)
+        self.counters = MongoCounterRepo(db.counters)
+        self.idempotency = MongoIdempotencyRepo(db.idempotency_keys)
+
+    async def detect_transactions(self):
+        if self.use_transactions in ("true", "false"):
+            self.transactions_supported = self.use_transactions == "true"
+            return
+        try:
+            hello = await self.client.admin.command("hello")
+            self.transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception:
+            self.transactions_supported = False
+
+    async def prepare(self):
+        await self.detect_transactions()
+        # Create declared indexes and report any drift from them
+        for failure in await ensure_indexes(self.db):
+            logger.error("Index creation failed: %s", failure)
+        drift = await index_drift(self.db)
+        for kind, names in drift.items():
+            if names:
+                logger.warning("Index drift (%s): %s", kind, ", ".join(names))
+
+    def close(self):
+        self.client.close()
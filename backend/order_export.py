@@ -0,0 +1,71 @@
+import csv
+import io
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List
+
+import orjson
+
+# CSV exports have one row per order line; order fields repeat on each line
+ORDER_CSV_COLUMNS = [
+    "orderNumber", "orderId", "checkoutId", "createdAt", "status", "vendorId", "vendorName",
+    "supplierId", "supplierName", "deliveryAddress", "orderTotal",
+    "productId", "productName", "quantity", "unitPrice", "totalPrice",
+]
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Spreadsheets evaluate text cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_cell(value: Any) -> Any:
+    # A leading quote makes the cell plain text; numbers are left alone
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def order_csv_rows(order: Dict[str, Any]) -> List[list]:
+    created_at = order.get("createdAt")
+    head = [
+        order.get("orderNumber"), order.get("id"), order.get("checkoutId"),
+        created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+        order.get("status"), order.get("vendorId"), order.get("vendorName"),
+        order.get("supplierId"), order.get("supplierName"), order.get("deliveryAddress"),
+        order.get("totalAmount"),
+    ]
+    lines = [head + [item.get("productId"), item.get("productName"), item.get("quantity"),
+                     item.get("unitPrice"), item.get("totalPrice")]
+             for item in order.get("items") or [{}]]
+    return [[csv_cell(value) for value in line] for line in lines]
+
+
+async def encode_orders(orders: AsyncIterable[Dict[str, Any]], export_format: str,
+                        chunk_bytes: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Encode orders as NDJSON or CSV, yielding chunks of about `chunk_bytes`.
+
+    Only the current chunk is held, so memory does not grow with the number
+    of orders as long as `orders` is itself streamed (a cursor with a fixed
+    batch size).
+    """
+    if export_format == "csv":
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(ORDER_CSV_COLUMNS)
+        async for order in orders:
+            writer.writerows(order_csv_rows(order))
+            if text.tell() >= chunk_bytes:
+                yield text.getvalue().encode("utf-8")
+                text.seek(0)
+                text.truncate()
+        if text.tell():
+            yield text.getvalue().encode("utf-8")
+    else:
+        chunk = bytearray()
+        async for order in orders:
+            chunk += orjson.dumps(order, option=orjson.OPT_APPEND_NEWLINE)
+            if len(chunk) >= chunk_bytes:
+                yield bytes(chunk)
+                chunk.clear()
+        if chunk:
+            yield bytes(chunk)
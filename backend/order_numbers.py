@@ -0,0 +1,49 @@
+import asyncio
+from typing import List
+
+
+class OrderNumberService:
+    """Hands out unique, sortable order numbers from blocks of a shared counter.
+
+    Each worker reserves `block_size` numbers at a time with one atomic
+    increment of a storage counter (storage.CounterRepo) and serves them
+    from memory, so the hot path is a local increment. Numbers are
+    fixed-width, so they sort lexicographically; across workers they are
+    unique but only roughly in creation order.
+    """
+
+    def __init__(self, counters, name: str = "orderNumber", block_size: int = 100, prefix: str = "ORD"):
+        self.counters = counters
+        self.name = name
+        self.block_size = block_size
+        self.prefix = prefix
+        self._next = 0
+        self._end = -1
+        self._refill_lock = asyncio.Lock()
+        self.blocks_allocated = 0
+
+    def format(self, value: int) -> str:
+        return f"{self.prefix}{value:010d}"
+
+    async def _allocate(self):
+        self._end = await self.counters.increment(self.name, self.block_size)
+        self._next = self._end - self.block_size + 1
+        self.blocks_allocated += 1
+
+    async def next(self) -> str:
+        while self._next > self._end:
+            async with self._refill_lock:
+                # Another task may have refilled while this one waited
+                if self._next > self._end:
+                    await self._allocate()
+        value = self._next
+        self._next += 1
+        return self.format(value)
+
+    async def next_many(self, count: int) -> List[str]:
+        return [await self.next() for _ in range(count)]
+
+    async def reserve(self, count: int) -> range:
+        """Reserve `count` consecutive values for a bulk load, outside this worker's block."""
+        end = await self.counters.increment(self.name, count)
+        return range(end - count + 1, end + 1)
@@ -0,0 +1,247 @@
+"""Opt-in profiles of single requests.
+
+A profile is a sampled call tree of the request's own task (pyinstrument in
+async mode, so concurrent requests do not leak in) plus every MongoDB
+command the request issued, with literal values masked. Requests are
+profiled when they carry the profiling token, or at random at a configured
+rate; sampled profiles are only kept when the request turned out slow.
+"""
+import asyncio
+import hmac
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+import orjson
+from pymongo import monitoring
+
+from metrics import command_collection
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import JSONRenderer
+except ImportError:  # pyinstrument is optional; profiling is then unavailable
+    Profiler = None
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_OUTPUT_HEADER = b"x-profile-output"
+PROFILE_QUERY = "profile"
+PROFILE_OUTPUT_QUERY = "profile_output"
+INLINE_OUTPUTS = ("json", "text")
+
+# Command fields that are protocol bookkeeping rather than part of the query
+COMMAND_NOISE = {"$db", "lsid", "$clusterTime", "txnNumber", "autocommit", "startTransaction", "$readPreference"}
+SHAPE_MAX_ITEMS = 3
+
+
+class RequestTrace:
+    __slots__ = ("started", "commands", "pending")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.commands: List[Dict[str, Any]] = []
+        self.pending: Dict[tuple, Dict[str, Any]] = {}
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def query_shape(value: Any) -> Any:
+    """The structure of a command with every literal replaced by "?"."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shape = [query_shape(item) for item in value[:SHAPE_MAX_ITEMS]]
+        if len(value) > SHAPE_MAX_ITEMS:
+            shape.append(f"... {len(value) - SHAPE_MAX_ITEMS} more")
+        return shape
+    return "?"
+
+
+class CommandTrace(monitoring.CommandListener):
+    """Records the commands of profiled requests; pass it to the client's event_listeners.
+
+    Motor runs pymongo calls with a copy of the caller's context, so the
+    request's trace is visible on the executor thread.
+    """
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is None:
+            return
+        entry = {
+            "command": event.command_name,
+            "collection": command_collection(event),
+            "startMs": round((time.perf_counter() - trace.started) * 1000, 3),
+            "shape": query_shape({key: value for key, value in event.command.items()
+                                  if key != event.command_name and key not in COMMAND_NOISE}),
+        }
+        trace.pending[(event.connection_id, event.request_id)] = entry
+        trace.commands.append(entry)
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "failed")))
+
+    def _finish(self, event, error: Optional[str]):
+        trace = current_trace.get()
+        entry = trace.pending.pop((event.connection_id, event.request_id), None) if trace else None
+        if entry is None:
+            return
+        entry["durationMs"] = event.duration_micros / 1000
+        if error is not None:
+            entry["error"] = error
+
+
+class ProfileSettings:
+    """Mutable at runtime, so sampling can be changed without a restart."""
+
+    def __init__(self, token: str = "", sample_rate: float = 0.0, slow_ms: float = 1000.0,
+                 directory: str = "profiles", max_files: int = 200, interval: float = 0.001,
+                 max_concurrent: int = 4):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.interval = interval
+        self.max_concurrent = max_concurrent
+
+    @property
+    def available(self) -> bool:
+        return Profiler is not None
+
+
+def store_profile(directory: Path, report: Dict[str, Any], max_files: int) -> Path:
+    """Write one profile and delete the oldest beyond `max_files`."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{report['id']}.json"
+    path.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    profiles = sorted(directory.glob("*.json"))
+    for old in profiles[:max(0, len(profiles) - max_files)]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def render_text(report: Dict[str, Any], call_tree: str) -> str:
+    lines = [f"{report['method']} {report['path']} -> {report['status']} in {report['durationMs']:.1f} ms", ""]
+    lines.append(call_tree)
+    lines.append(f"MongoDB commands ({len(report['commands'])}):")
+    for command in report["commands"]:
+        duration = command.get("durationMs")
+        lines.append(f"  +{command['startMs']:>9.3f} ms  {duration if duration is not None else '?':>9} ms  "
+                     f"{command['collection']}.{command['command']} {orjson.dumps(command['shape']).decode()}"
+                     + (f"  error: {command['error']}" if "error" in command else ""))
+    return "\n".join(lines) + "\n"
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requested and sampled requests.
+
+    A request is profiled on demand when it sends the profiling token in an
+    X-Profile header or a ?profile= parameter. X-Profile-Output (or
+    ?profile_output=) set to "json" or "text" replaces the response with the
+    profile. Otherwise the profile is written to the profile directory and
+    its id is returned in X-Profile-Id. Sampled requests are never answered
+    with their profile.
+    """
+
+    def __init__(self, app, settings: ProfileSettings):
+        self.app = app
+        self.settings = settings
+        self.active = 0
+
+    def requested_output(self, scope) -> Optional[str]:
+        """"store", "json" or "text" when the request asked for a profile with a valid token."""
+        token = output = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                token = value.decode("latin-1")
+            elif name == PROFILE_OUTPUT_HEADER:
+                output = value.decode("latin-1")
+        if (token is None or output is None) and PROFILE_QUERY.encode() in scope.get("query_string", b""):
+            params = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+            token = token or params.get(PROFILE_QUERY)
+            output = output or params.get(PROFILE_OUTPUT_QUERY)
+        if not token or not hmac.compare_digest(token.encode("utf-8"), self.settings.token.encode("utf-8")):
+            return None
+        return output if output in INLINE_OUTPUTS else "store"
+
+    async def __call__(self, scope, receive, send):
+        settings = self.settings
+        if scope["type"] != "http" or Profiler is None:
+            await self.app(scope, receive, send)
+            return
+        output = self.requested_output(scope) if settings.token else None
+        if output is None:
+            if not (settings.sample_rate and self.active < settings.max_concurrent
+                    and random.random() < settings.sample_rate):
+                await self.app(scope, receive, send)
+                return
+            output = "sampled"
+
+        # Ids sort by time, which is the order rotation deletes in
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+        status = 500
+
+        async def send_profiled(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if output == "store":
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-profile-id", profile_id.encode())]}
+            # Inline profiles replace the response, so it is not sent
+            if output not in INLINE_OUTPUTS:
+                await send(message)
+
+        trace = RequestTrace()
+        trace_token = current_trace.set(trace)
+        profiler = Profiler(interval=settings.interval, async_mode="enabled")
+        self.active += 1
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            profiler.stop()
+            current_trace.reset(trace_token)
+            self.active -= 1
+            duration_ms = (time.perf_counter() - trace.started) * 1000
+
+        if output == "sampled" and duration_ms < settings.slow_ms:
+            return
+        query = [(key, value) for key, value in parse_qsl(scope.get("query_string", b"").decode("latin-1"))
+                 if key not in (PROFILE_QUERY, PROFILE_OUTPUT_QUERY)]
+        report = {
+            "id": profile_id,
+            "trigger": "slow" if output == "sampled" else "requested",
+            "method": scope["method"],
+            "path": scope["path"] + (f"?{urlencode(query)}" if query else ""),
+            "status": status,
+            "durationMs": round(duration_ms, 3),
+            "commands": trace.commands,
+        }
+
+        if output == "text":
+            body = render_text(report, profiler.output_text(unicode=True, color=False)).encode("utf-8")
+            await self.send_inline(send, body, b"text/plain; charset=utf-8")
+            return
+        # Rendering walks the whole call tree, so it runs off the event loop
+        report["callTree"] = orjson.loads(await asyncio.to_thread(profiler.output, JSONRenderer()))
+        if output == "json":
+            await self.send_inline(send, orjson.dumps(report), b"application/json")
+        else:
+            await asyncio.to_thread(store_profile, settings.directory, report, settings.max_files)
+
+    @staticmethod
+    async def send_inline(send, body: bytes, content_type: bytes):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
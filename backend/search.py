@@ -0,0 +1,140 @@
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+
+def _combining_marks() -> str:
+    # Regex class of combining marks (vowel signs, viramas, accents); \w does
+    # not match them, so हल्दी would otherwise split at its virama
+    ranges, start = [], None
+    for code_point in range(0x20001):
+        is_mark = code_point < 0x20000 and unicodedata.category(chr(code_point)).startswith("M")
+        if is_mark and start is None:
+            start = code_point
+        elif not is_mark and start is not None:
+            ranges.append(f"{re.escape(chr(start))}-{re.escape(chr(code_point - 1))}")
+            start = None
+    return f"[{''.join(ranges)}]"
+
+
+# Words in any script, marks included; \w runs first so Latin text stays fast
+TOKEN_RE = re.compile(rf"\w+(?:{_combining_marks()}+\w*)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(unicodedata.normalize("NFKC", text).casefold()) if text else []
+
+
+class ProductSearchIndex:
+    """In-process inverted index over product names and descriptions.
+
+    Every query term is matched as a prefix of an indexed token and all terms
+    must match. Results are ranked by a TF-IDF style score where name hits
+    outweigh description hits and exact token hits outweigh prefix hits.
+    """
+
+    NAME_WEIGHT = 3.0
+    DESCRIPTION_WEIGHT = 1.0
+    PREFIX_PENALTY = 0.5
+    MAX_PREFIX_EXPANSION = 64
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._vocabulary: List[str] = []
+        self._docs: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _weights(self, product: dict) -> Dict[str, float]:
+        weights: Dict[str, float] = {}
+        for token, count in Counter(tokenize(product.get("name", ""))).items():
+            weights[token] = weights.get(token, 0.0) + count * self.NAME_WEIGHT
+        for token, count in Counter(tokenize(product.get("description", ""))).items():
+            weights[token] = weights.get(token, 0.0) + count * self.DESCRIPTION_WEIGHT
+        return weights
+
+    def add(self, product: dict):
+        product_id = product["id"]
+        if product_id in self._docs:
+            self.remove(product_id)
+        if not product.get("isAvailable", True):
+            return
+        weights = self._weights(product)
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[product_id] = weight
+        self._docs[product_id] = {"category": product.get("category"), "tokens": set(weights)}
+
+    def bulk_load(self, products: Iterable[dict]):
+        """Replace the index contents; much faster than repeated add() calls."""
+        self._postings = {}
+        self._docs = {}
+        for product in products:
+            if not product.get("isAvailable", True):
+                continue
+            weights = self._weights(product)
+            for token, weight in weights.items():
+                self._postings.setdefault(token, {})[product["id"]] = weight
+            self._docs[product["id"]] = {"category": product.get("category"), "tokens": set(weights)}
+        self._vocabulary = sorted(self._postings)
+
+    def remove(self, product_id: str):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        for token in doc["tokens"]:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect.bisect_left(self._vocabulary, token)
+                if index < len(self._vocabulary) and self._vocabulary[index] == token:
+                    del self._vocabulary[index]
+
+    def _expand(self, term: str) -> List[str]:
+        start = bisect.bisect_left(self._vocabulary, term)
+        tokens = []
+        for token in self._vocabulary[start:start + self.MAX_PREFIX_EXPANSION]:
+            if not token.startswith(term):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, query: str, category: Optional[str] = None, limit: int = 50) -> List[str]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        total_docs = len(self._docs) or 1
+        scores: Optional[Dict[str, float]] = None
+        for term in terms:
+            term_scores: Dict[str, float] = {}
+            for token in self._expand(term):
+                postings = self._postings[token]
+                idf = math.log(1 + total_docs / len(postings))
+                factor = idf if token == term else idf * self.PREFIX_PENALTY
+                for product_id, weight in postings.items():
+                    score = weight * factor
+                    if score > term_scores.get(product_id, 0.0):
+                        term_scores[product_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pid: scores[pid] + s for pid, s in term_scores.items() if pid in scores}
+            if not scores:
+                return []
+
+        if category:
+            scores = {pid: s for pid, s in scores.items() if self._docs[pid]["category"] == category}
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, _ in ranked]
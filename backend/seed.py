@@ -0,0 +1,348 @@
+"""Deterministic synthetic vendors, suppliers, products and orders at scale.
+
+The same seed and end date always produce the same documents. Categories,
+prices, cities and order sizes follow rough real-world shapes: most stock
+is staples, big cities have more traders, a few suppliers and vendors
+account for most of the orders, and old orders are delivered. Documents
+are written in insert_many batches while the next batch is generated, and
+every account shares one demo password hashed once.
+
+Run from the backend directory:
+    python seed.py --vendors 2000 --suppliers 300 --products 20000 --orders 1000000
+    python seed.py --drop ...    empty users, products, orders and supplier_stats first
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import bcrypt
+
+from cities import CITY_COORDINATES, STATE_CITIES, geo_point
+from demo import DEMO_PASSWORD
+from mongo_storage import MongoCounterRepo
+from order_numbers import OrderNumberService
+
+BATCH_SIZE = 5000
+
+# category: (share of the catalog, units, (low, high) price per unit, items)
+CATEGORY_PROFILES = {
+    "grains": (20, ["kg"], (25, 140), ["Basmati Rice", "Sona Masoori Rice", "Wheat Flour", "Chakki Atta",
+                                       "Maida", "Sooji", "Poha", "Besan"]),
+    "vegetables": (18, ["kg"], (12, 90), ["Red Onions", "Potatoes", "Tomatoes", "Green Chillies", "Cabbage",
+                                          "Cauliflower", "Capsicum", "Ginger", "Garlic", "Coriander Leaves"]),
+    "pulses": (12, ["kg"], (70, 180), ["Toor Dal", "Moong Dal", "Chana Dal", "Masoor Dal", "Urad Dal",
+                                       "Rajma", "Kabuli Chana"]),
+    "spices": (14, ["kg", "packet"], (120, 950), ["Turmeric Powder", "Red Chilli Powder", "Cumin Seeds",
+                                                  "Coriander Powder", "Garam Masala", "Chaat Masala",
+                                                  "Black Pepper", "Mustard Seeds"]),
+    "oils": (10, ["liter"], (95, 260), ["Sunflower Oil", "Mustard Oil", "Groundnut Oil", "Rice Bran Oil",
+                                        "Palm Oil", "Coconut Oil"]),
+    "dairy": (10, ["kg", "liter"], (50, 650), ["Paneer", "Ghee", "Butter", "Curd", "Milk", "Khoya"]),
+    "fruits": (8, ["kg", "dozen"], (30, 220), ["Bananas", "Mangoes", "Lemons", "Pomegranates", "Apples",
+                                               "Oranges"]),
+    "snacks": (8, ["packet"], (10, 120), ["Namkeen", "Papad", "Bhujia", "Sev", "Pav", "Bread"]),
+}
+QUALIFIERS = ["Premium", "Fresh", "Organic", "Local", "Export Quality", "Desi", "Farm", "Wholesale"]
+# Units most traders sell in; minimums are per unit, maximums a multiple of them
+MIN_ORDER_QTYS = ([1, 2, 5, 10, 25], [20, 25, 25, 20, 10])
+
+# Metros carry more traders; every other bundled city has weight 1
+CITY_WEIGHTS = {"delhi": 12, "mumbai": 12, "bengaluru": 9, "kolkata": 8, "chennai": 8, "hyderabad": 8,
+                "pune": 6, "ahmedabad": 6, "surat": 4, "jaipur": 4, "lucknow": 4, "kanpur": 3, "nagpur": 3,
+                "indore": 3, "thane": 3, "bhopal": 2, "patna": 2, "vadodara": 2, "ludhiana": 2, "agra": 2}
+CITY_STATES = {city: state for state, city in STATE_CITIES.items()}
+
+FIRST_NAMES = ["Rajesh", "Sunita", "Vikram", "Amit", "Priya", "Harjeet", "Anita", "Suresh", "Meena", "Ravi",
+               "Kavita", "Arjun", "Pooja", "Manoj", "Lakshmi", "Imran", "Farah", "Deepak", "Geeta", "Sanjay"]
+LAST_NAMES = ["Kumar", "Sharma", "Singh", "Gupta", "Patel", "Reddy", "Iyer", "Das", "Khan", "Yadav",
+              "Verma", "Nair", "Joshi", "Mehta", "Bose"]
+STALLS = ["Dosa Corner", "Chaat Bhandaar", "Paratha Point", "Chai Stall", "Pav Bhaji Centre", "Momos Junction",
+          "Juice Centre", "Samosa House", "Biryani Point", "Vada Pav Stall", "Kathi Rolls", "Idli Cart"]
+SUPPLIER_TRADES = ["Agro Supplies", "Traders", "Wholesale", "Oil Traders", "Fresh Supply", "Spice Mart",
+                   "Dairy Farms", "Grain Merchants"]
+
+# Orders older than this are settled; newer ones are still moving through the statuses
+OPEN_ORDER_DAYS = 3
+SETTLED_STATUSES = (["delivered", "cancelled"], [92, 8])
+OPEN_STATUSES = (["pending", "confirmed", "delivered", "cancelled"], [40, 30, 25, 5])
+
+
+class SeedProduct(NamedTuple):
+    """What order generation needs of a product, without keeping the documents"""
+    id: str
+    name: str
+    price: float
+    min_qty: int
+    max_qty: int
+
+
+def skewed_index(rng: random.Random, count: int) -> int:
+    # Squaring a uniform draw favours low indices: a few accounts do most of the business
+    return int(count * rng.random() ** 2)
+
+
+def seeded_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate_users(count: int, user_type: str, password_hash: str, seed: int, end: datetime) -> Iterator[Dict[str, Any]]:
+    """Vendors or suppliers spread over the bundled cities, metros first, signed up over the past year."""
+    rng = random.Random(f"{seed}-{user_type}")
+    cities = sorted(CITY_COORDINATES)
+    weights = [CITY_WEIGHTS.get(city, 1) for city in cities]
+    for position in range(count):
+        city = rng.choices(cities, weights)[0]
+        lat, lng = CITY_COORDINATES[city]
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        if user_type == "vendor":
+            business = f"{first}'s {rng.choice(STALLS)}"
+        else:
+            business = f"{city.title()} {rng.choice(SUPPLIER_TRADES)}"
+        yield {
+            "id": seeded_uuid(rng),
+            "email": f"seed{seed}.{user_type}{position}@example.com",
+            "password": password_hash,
+            "name": f"{first} {last}",
+            "phone": f"9{rng.randrange(10 ** 9):09d}",
+            "userType": user_type,
+            "businessName": business,
+            "city": city.title(),
+            "state": CITY_STATES.get(city, "").title(),
+            # Within about 10 km of the city centre
+            "location": geo_point(lat + rng.uniform(-0.09, 0.09), lng + rng.uniform(-0.09, 0.09)),
+            "createdAt": end - timedelta(days=365) + timedelta(seconds=rng.randrange(365 * 86400)),
+        }
+
+
+def generate_products(count: int, suppliers: List[Dict[str, Any]], seed: int, first_seq: int,
+                      end: datetime) -> Iterator[Dict[str, Any]]:
+    """Catalog weighted towards staples, with log-uniform prices inside each category's range.
+
+    Products carry consecutive changeSeq values from `first_seq`, reserved by the caller.
+    """
+    rng = random.Random(f"{seed}-products")
+    categories = list(CATEGORY_PROFILES)
+    weights = [profile[0] for profile in CATEGORY_PROFILES.values()]
+    started_at = end - timedelta(days=180)
+    for position in range(count):
+        category = rng.choices(categories, weights)[0]
+        _, units, (low, high), items = CATEGORY_PROFILES[category]
+        supplier = suppliers[skewed_index(rng, len(suppliers))]
+        item = rng.choice(items)
+        qualifier = rng.choice(QUALIFIERS)
+        min_qty = rng.choices(*MIN_ORDER_QTYS)[0]
+        # One listing in ten is running low
+        stock = rng.randint(0, 10) if rng.random() < 0.1 else rng.randint(20, 2000)
+        created_at = started_at + timedelta(seconds=position * 180 * 86400 // max(count, 1))
+        yield {
+            "id": seeded_uuid(rng),
+            "name": f"{qualifier} {item}",
+            "category": category,
+            "description": f"{qualifier.lower()} {item.lower()} from {supplier['city']}",
+            "price": round(math.exp(rng.uniform(math.log(low), math.log(high))), 2),
+            "unit": rng.choice(units),
+            "stock": stock,
+            "minOrderQty": min_qty,
+            "maxOrderQty": min_qty * rng.choice([10, 20, 40]),
+            "supplierId": supplier["id"],
+            "supplierName": supplier["businessName"],
+            "isAvailable": rng.random() < 0.97,
+            "location": supplier["location"],
+            "createdAt": created_at,
+            "updatedAt": created_at,
+            "changeSeq": first_seq + position,
+        }
+
+
+def generate_orders(count: int, vendors: List[Dict[str, Any]], products_by_supplier: Dict[str, List[SeedProduct]],
+                    supplier_names: Dict[str, str], seed: int, order_numbers: Iterable[str], end: datetime,
+                    days: int = 180) -> Iterator[Dict[str, Any]]:
+    """Single-supplier orders of one to four lines, in creation order over the `days` before `end`."""
+    rng = random.Random(f"{seed}-orders")
+    # Suppliers are drawn in proportion to their catalog size
+    supplier_ids = list(products_by_supplier)
+    cumulative = list(itertools.accumulate(len(products) for products in products_by_supplier.values()))
+    started_at = end - timedelta(days=days)
+    step = days * 86400 / max(count, 1)
+    open_since = end - timedelta(days=OPEN_ORDER_DAYS)
+    for position, number in zip(range(count), order_numbers):
+        vendor = vendors[skewed_index(rng, len(vendors))]
+        supplier_id = rng.choices(supplier_ids, cum_weights=cumulative)[0]
+        catalog = products_by_supplier[supplier_id]
+        items = []
+        for product in rng.sample(catalog, min(len(catalog), rng.choices([1, 2, 3, 4], [50, 30, 15, 5])[0])):
+            quantity = rng.randint(product.min_qty, min(product.max_qty, product.min_qty * 4))
+            items.append({
+                "productId": product.id,
+                "productName": product.name,
+                "quantity": quantity,
+                "unitPrice": product.price,
+                "totalPrice": round(quantity * product.price, 2),
+                "supplierId": supplier_id,
+                "supplierName": supplier_names[supplier_id],
+            })
+        created_at = started_at + timedelta(seconds=(position + rng.random()) * step)
+        statuses = OPEN_STATUSES if created_at >= open_since else SETTLED_STATUSES
+        status = rng.choices(*statuses)[0]
+        yield {
+            "id": seeded_uuid(rng),
+            "checkoutId": seeded_uuid(rng),
+            "orderNumber": number,
+            "vendorId": vendor["id"],
+            "vendorName": vendor["businessName"],
+            "supplierId": supplier_id,
+            "supplierName": supplier_names[supplier_id],
+            "items": items,
+            "totalAmount": round(sum(item["totalPrice"] for item in items), 2),
+            "status": status,
+            "deliveryAddress": f"{vendor['businessName']}, {vendor['city']}",
+            "createdAt": created_at,
+            "updatedAt": created_at if status == "pending" else min(end, created_at + timedelta(hours=rng.randint(1, 48))),
+        }
+
+
+def hash_demo_password(password: str = DEMO_PASSWORD) -> str:
+    # One bcrypt hash for every seeded account; hashing per user would take minutes at 100k users
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+async def insert_batched(collection, documents: Iterable[Dict[str, Any]], batch_size: int = BATCH_SIZE) -> int:
+    """insert_many in batches, generating the next batch while the previous one is written."""
+    inserted = 0
+    pending: Optional[asyncio.Task] = None
+    batches = iter(documents)
+    while True:
+        batch = list(itertools.islice(batches, batch_size))
+        if pending is not None:
+            await pending
+        if not batch:
+            return inserted
+        pending = asyncio.ensure_future(collection.insert_many(batch, ordered=False))
+        inserted += len(batch)
+
+
+class SeedReport:
+    """Rows and seconds per collection; `verbose` prints each collection as it finishes."""
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self.rows: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    async def timed(self, name: str, collection, documents: Iterable[Dict[str, Any]], batch_size: int) -> int:
+        started = time.perf_counter()
+        rows = await insert_batched(collection, documents, batch_size)
+        self.rows[name] = rows
+        self.seconds[name] = time.perf_counter() - started
+        if self.verbose:
+            print(f"{name:<10} {rows:>10} rows in {self.seconds[name]:>8.1f}s  "
+                  f"{rows / max(self.seconds[name], 1e-9):>10.0f} rows/s")
+        return rows
+
+
+async def seed_database(db, vendors: int, suppliers: int, products: int, orders: int, seed: int = 1,
+                        end: Optional[datetime] = None, batch_size: int = BATCH_SIZE,
+                        password: str = DEMO_PASSWORD, verbose: bool = False) -> SeedReport:
+    """Insert a synthetic dataset; supplier counters are rebuilt afterwards.
+
+    Order numbers and catalog sequence numbers are reserved from the same
+    counters the server uses, so seeded and live documents never collide.
+    """
+    if (suppliers == 0 and (products or orders)) or (vendors == 0 and orders) or (products == 0 and orders):
+        raise ValueError("products need suppliers, and orders need vendors and products")
+    end = end or datetime.utcnow()
+    report = SeedReport(verbose)
+    password_hash = await asyncio.to_thread(hash_demo_password, password)
+
+    # Orders need every vendor and supplier and a compact view of the catalog
+    vendor_docs: List[Dict[str, Any]] = []
+    products_by_supplier: Dict[str, List[SeedProduct]] = {}
+
+    def remember_vendors(documents):
+        for vendor in documents:
+            vendor_docs.append({key: vendor[key] for key in ("id", "businessName", "city")})
+            yield vendor
+
+    def remember_products(documents):
+        for product in documents:
+            products_by_supplier.setdefault(product["supplierId"], []).append(SeedProduct(
+                product["id"], product["name"], product["price"], product["minOrderQty"], product["maxOrderQty"]))
+            yield product
+
+    await report.timed("vendors", db.users,
+                       remember_vendors(generate_users(vendors, "vendor", password_hash, seed, end)), batch_size)
+    supplier_docs = list(generate_users(suppliers, "supplier", password_hash, seed, end))
+    await report.timed("suppliers", db.users, supplier_docs, batch_size)
+
+    counters = MongoCounterRepo(db.counters)
+    catalog_seq = await counters.increment("catalogSeq", products)
+    await report.timed("products", db.products, remember_products(generate_products(
+        products, supplier_docs, seed, catalog_seq - products + 1, end)), batch_size)
+
+    if orders:
+        numbers = OrderNumberService(counters)
+        reserved = await numbers.reserve(orders)
+        supplier_names = {supplier["id"]: supplier["businessName"] for supplier in supplier_docs}
+        await report.timed("orders", db.orders, generate_orders(
+            orders, vendor_docs, products_by_supplier, supplier_names, seed, map(numbers.format, reserved), end),
+            batch_size)
+    return report
+
+
+async def main(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from indexes import ensure_indexes
+    from supplier_stats import reconcile_supplier_stats
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    try:
+        if args.drop:
+            for name in ("users", "products", "orders", "supplier_stats"):
+                await db[name].delete_many({})
+        elif await db.users.find_one({"email": f"seed{args.seed}.vendor0@example.com"}, {"_id": 1}):
+            print(f"{os.environ['DB_NAME']} already holds seed {args.seed}; pass --drop or another --seed")
+            return 1
+
+        end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else datetime.utcnow()
+        started = time.perf_counter()
+        report = await seed_database(db, args.vendors, args.suppliers, args.products, args.orders, args.seed,
+                                     end, args.batch_size, verbose=True)
+        inserted = time.perf_counter() - started
+        total = sum(report.rows.values())
+        print(f"{'total':<10} {total:>10} rows in {inserted:>8.1f}s  {total / max(inserted, 1e-9):>10.0f} rows/s")
+
+        # On a fresh database the indexes are built once over the loaded data
+        for failure in await ensure_indexes(db):
+            print(f"index failed: {failure}")
+        await reconcile_supplier_stats(db, int(os.environ.get("LOW_STOCK_THRESHOLD", "10")), fix=True)
+        print(f"indexes and supplier stats ready after {time.perf_counter() - started:.1f}s; "
+              f"log in as seed{args.seed}.vendor0@example.com / {DEMO_PASSWORD}")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed StreetBazaar with synthetic data")
+    parser.add_argument("--vendors", type=int, default=1000)
+    parser.add_argument("--suppliers", type=int, default=200)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1, help="same seed and --end, same data")
+    parser.add_argument("--end", help="YYYY-MM-DD the order history runs up to (default now)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="documents per insert_many")
+    parser.add_argument("--drop", action="store_true", help="empty users, products, orders and supplier_stats first")
+    sys.exit(asyncio.run(main(parser.parse_args())))
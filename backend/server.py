@@ -1,34 +1,211 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pymongo.errors import DuplicateKeyError
+from pydantic import BaseModel, Field, ValidationError
+from typing import Awaitable, Callable, Dict, List, Literal, Optional, Type, Union
 from datetime import datetime, timedelta
 import os
 import logging
 import bcrypt
 import jwt
+import json
+import orjson
+import gzip
+import base64
+import hashlib
+import hmac
+import asyncio
 from dotenv import load_dotenv
 from pathlib import Path
 import uuid
 
+try:
+    import brotli
+except ImportError:  # brotli is optional; clients then get gzip
+    brotli = None
+
+from bulk_import import IMPORT_FORMATS, ImportFormatError
+from cache import MemoryBackend, RedisBackend, TTLCache, VersionedCache
+from cities import geo_point, geocode
+from demo import DEMO_PASSWORD
+from events import EventBroker
+from hashing import HashingPool, HashingPoolBusy
+from memory_storage import MemoryStorage
+from metrics import CommandMetrics, Metrics, MetricsMiddleware
+from mongo_storage import MongoStorage
+from order_export import EXPORT_MEDIA_TYPES, encode_orders
+from order_numbers import OrderNumberService
+from profiling import CommandTrace, ProfileSettings, ProfilingMiddleware
+from search import ProductSearchIndex, tokenize
+from storage import ENGINES, GeoPosition, KeysetPosition
+from supplier_stats import (StatsChange, low_stock_delta, order_created_update, products_created_updates,
+                            status_changed_update)
+
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Request and MongoDB command metrics, served at /metrics
+metrics = Metrics(enabled=os.environ.get("METRICS_ENABLED", "true").lower() == "true")
+
+# Request profiling (profiling.py). Requests sending X-Profile: $PROFILE_TOKEN
+# are profiled on demand; a PROFILE_SAMPLE_RATE share of all requests is
+# profiled and kept when slower than PROFILE_SLOW_MS. Profiles are written
+# to PROFILE_DIR, which keeps the newest PROFILE_MAX_FILES.
+profile_settings = ProfileSettings(
+    token=os.environ.get("PROFILE_TOKEN", ""),
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+    slow_ms=float(os.environ.get("PROFILE_SLOW_MS", "1000")),
+    directory=os.environ.get("PROFILE_DIR", str(ROOT_DIR / "profiles")),
+    max_files=int(os.environ.get("PROFILE_MAX_FILES", "200")),
+)
+
+# Storage engine (storage.py). "mongo" keeps everything in MongoDB; "memory"
+# keeps it in this process, for tests and single-worker edge deployments
+# without a database (nothing survives a restart).
+STORAGE_ENGINE = os.environ.get("STORAGE_ENGINE", "mongo").lower()
+if STORAGE_ENGINE not in ENGINES:
+    raise RuntimeError(f"STORAGE_ENGINE must be one of: {', '.join(ENGINES)}")
+
+# Stock reservation uses a multi-document transaction when the deployment
+# supports one (replica set or sharded cluster); detected at startup
+USE_TRANSACTIONS = os.environ.get("USE_TRANSACTIONS", "auto").lower()
+
+if STORAGE_ENGINE == "memory":
+    client = db = None
+    storage = MemoryStorage()
+else:
+    # MongoDB connection
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[CommandMetrics(metrics), CommandTrace()])
+    db = client[os.environ['DB_NAME']]
+    storage = MongoStorage(client, db, USE_TRANSACTIONS)
 
 # JWT Configuration
 SECRET_KEY = "your-secret-key-here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
+# When enabled, tokens carrying userType/businessName claims authenticate
+# without a database lookup (claims may lag a user record change until expiry)
+TRUST_TOKEN_CLAIMS = os.environ.get("TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+# Authenticated-user cache, keyed by user id
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("USER_CACHE_TTL_SECONDS", "60")),
+)
+
+# Password hashing pool (bcrypt is too slow to run on the event loop)
+hashing_pool = HashingPool(
+    kind=os.environ.get("HASH_POOL_KIND", "thread"),
+    workers=int(os.environ.get("HASH_POOL_WORKERS", "4")),
+    max_concurrency=int(os.environ.get("HASH_POOL_MAX_CONCURRENCY", "0")) or None,
+    max_queue=int(os.environ.get("HASH_POOL_MAX_QUEUE", "256")),
+)
+
+# Catalog read-through cache. The version counter lives in the backend, so
+# with CATALOG_CACHE_BACKEND=redis a product write invalidates every worker.
+if os.environ.get("CATALOG_CACHE_BACKEND", "memory") == "redis":
+    catalog_cache_backend = RedisBackend(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+else:
+    catalog_cache_backend = MemoryBackend(
+        max_entries=int(os.environ.get("CATALOG_CACHE_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.environ.get("CATALOG_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    )
+catalog_cache = VersionedCache(
+    catalog_cache_backend,
+    namespace="catalog",
+    ttl=float(os.environ.get("CATALOG_CACHE_TTL_SECONDS", "300")),
+)
+
+# Supplier analytics share the catalog cache backend, with a version counter
+# per supplier that order writes bump
+analytics_cache = VersionedCache(
+    catalog_cache_backend,
+    namespace="analytics",
+    ttl=float(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", "600")),
+)
+ANALYTICS_TOP_PRODUCTS = 50
+ANALYTICS_TOP_VENDORS = 10
+
+# Catalog responses at least this large are compressed when the client accepts it.
+# Compressed bodies are keyed by content hash, so they never go stale.
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+compressed_bodies = TTLCache(maxsize=1024, ttl=600)
+
+# Product search index, rebuilt at startup and kept in sync on writes.
+# Other workers' inserts are picked up by a periodic createdAt sync.
+search_index = ProductSearchIndex()
+search_index_watermark: Optional[datetime] = None
+SEARCH_INDEX_SYNC_SECONDS = float(os.environ.get("SEARCH_INDEX_SYNC_SECONDS", "30"))
+SEARCH_PROJECTION = {"_id": 0, "id": 1, "name": 1, "description": 1, "category": 1, "isAvailable": 1, "createdAt": 1}
+
+# Catalog delta sync. Every product write takes the next catalog sequence
+# number from the counters store. Writes only become visible in sequence order
+# once they are older than the settle window; sync tokens never move past
+# a more recent write, so a slow concurrent write is never skipped.
+CATALOG_CHANGES_SETTLE_SECONDS = float(os.environ.get("CATALOG_CHANGES_SETTLE_SECONDS", "5"))
+
+# Bulk product import: rows are validated as they stream in and written in
+# unordered batches; at most IMPORT_MAX_ERRORS row errors are reported
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", "1000"))
+IMPORT_MAX_LINE_BYTES = int(os.environ.get("IMPORT_MAX_LINE_BYTES", str(64 * 1024)))
+
+# Per-supplier counters in supplier_stats, incremented on every order,
+# product and stock write; a periodic reconciliation logs any drift
+LOW_STOCK_THRESHOLD = int(os.environ.get("LOW_STOCK_THRESHOLD", "10"))
+SUPPLIER_STATS_RECONCILE_SECONDS = float(os.environ.get("SUPPLIER_STATS_RECONCILE_SECONDS", "3600"))
+
+# Order numbers are served from per-worker blocks reserved in the counters store
+order_numbers = OrderNumberService(storage.counters, block_size=int(os.environ.get("ORDER_NUMBER_BLOCK_SIZE", "100")))
+
+# Idempotency keys: the first successful response is stored and replayed to
+# retries for a day (the TTL index on idempotency_keys.createdAt)
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "30"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+idempotency_inflight: Dict[str, asyncio.Future] = {}
+
+# Order event stream. ORDER_EVENTS_SOURCE picks how events reach this worker:
+# "local" publishes this worker's own writes (single worker), "changestream"
+# tails the orders change feed (replica sets, or the memory engine) and "poll"
+# queries orders by updatedAt.
+ORDER_EVENTS_SOURCE = os.environ.get("ORDER_EVENTS_SOURCE", "local")
+ORDER_EVENTS_POLL_SECONDS = float(os.environ.get("ORDER_EVENTS_POLL_SECONDS", "2"))
+ORDER_STREAM_HEARTBEAT_SECONDS = float(os.environ.get("ORDER_STREAM_HEARTBEAT_SECONDS", "15"))
+ORDER_EVENT_PROJECTION = {"_id": 0, "id": 1, "checkoutId": 1, "orderNumber": 1, "vendorId": 1,
+                          "supplierId": 1, "status": 1, "totalAmount": 1, "createdAt": 1, "updatedAt": 1}
+order_events = EventBroker(
+    buffer_size=int(os.environ.get("ORDER_STREAM_BUFFER", "100")),
+    max_subscriptions=int(os.environ.get("ORDER_STREAM_MAX_CONNECTIONS", "10000")),
+)
+
+# Keyset pagination
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+CHANGES_PAGE_SIZE = 500
+MAX_CHANGES_PAGE_SIZE = 2000
+# Order exports stream from a cursor fetching this many orders per batch
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+
+# Location-based discovery. Users are geocoded from their city and state
+# (cities.py); products carry their supplier's location so nearby product
+# pages are one $geoNear over products.
+NEARBY_RADIUS_KM = 25.0
+MAX_NEARBY_RADIUS_KM = 2000.0
+# A text search combined with near= ranks at most this many matches by distance
+NEARBY_SEARCH_CANDIDATES = 1000
+
+# Background tasks started at startup, cancelled at shutdown
+background_tasks: List[asyncio.Task] = []
+
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Create FastAPI app
 app = FastAPI()
@@ -43,6 +220,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(ProfilingMiddleware, settings=profile_settings)
+
+# Added last so it is outermost and times the whole stack
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 # Pydantic Models
 class UserBase(BaseModel):
     email: str
@@ -60,11 +242,16 @@ class UserLogin(BaseModel):
     email: str
     password: str
 
+class GeoPoint(BaseModel):
+    type: str = "Point"
+    coordinates: List[float]  # [longitude, latitude]
+
 class UserResponse(UserBase):
     id: str
     businessName: str = ""
     city: str = ""
     state: str = ""
+    location: Optional[GeoPoint] = None
     createdAt: datetime
 
 class Product(BaseModel):
@@ -81,6 +268,7 @@ class Product(BaseModel):
     supplierName: str = ""
     isAvailable: bool = True
     createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: Optional[datetime] = None
 
 class ProductCreate(BaseModel):
     name: str
@@ -92,6 +280,105 @@ class ProductCreate(BaseModel):
     minOrderQty: int = 1
     maxOrderQty: int = 1000
 
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_cursor: Optional[str] = None
+
+class NearbyProduct(Product):
+    distanceKm: float
+
+class NearbyProductPage(BaseModel):
+    items: List[NearbyProduct]
+    next_cursor: Optional[str] = None
+
+class NearbySupplier(BaseModel):
+    id: str
+    name: str
+    businessName: str = ""
+    phone: str = ""
+    city: str = ""
+    state: str = ""
+    location: GeoPoint
+    distanceKm: float
+
+class NearbySupplierPage(BaseModel):
+    items: List[NearbySupplier]
+    next_cursor: Optional[str] = None
+
+class ProductChanges(BaseModel):
+    items: List[Product]
+    removed: List[str]
+    next_token: str
+    has_more: bool = False
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ProductImportReport(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+    errorsTruncated: bool = False
+
+class SalesTotals(BaseModel):
+    revenue: float = 0.0
+    orders: int = 0
+    units: int = 0
+    averageOrderValue: float = 0.0
+
+class StatusBreakdown(BaseModel):
+    status: str
+    orders: int
+    revenue: float
+
+class ProductSales(BaseModel):
+    productId: str
+    productName: str = ""
+    units: int
+    revenue: float
+
+class VendorSales(BaseModel):
+    vendorId: str
+    vendorName: str = ""
+    orders: int
+    revenue: float
+
+class SalesPeriod(BaseModel):
+    period: str
+    orders: int
+    units: int
+    revenue: float
+
+class SupplierAnalytics(BaseModel):
+    totals: SalesTotals
+    byStatus: List[StatusBreakdown]
+    products: List[ProductSales]
+    topVendors: List[VendorSales]
+    daily: List[SalesPeriod]
+    weekly: List[SalesPeriod]
+    generatedAt: datetime
+
+class DailyRevenue(BaseModel):
+    date: str
+    revenue: float
+
+class SupplierSummary(BaseModel):
+    orders: Dict[str, int]
+    revenue: float
+    revenueToday: float
+    recentRevenue: List[DailyRevenue]
+    unitsSold: int
+    products: int
+    lowStockProducts: int
+    lowStockThreshold: int
+
+class ProfilingStatus(BaseModel):
+    available: bool
+    sampleRate: float
+    slowMs: float
+    directory: str
+
 class CartItem(BaseModel):
     productId: str
     productName: str
@@ -105,8 +392,11 @@ class OrderCreate(BaseModel):
     items: List[CartItem]
     deliveryAddress: str = ""
 
+OrderStatus = Literal["pending", "confirmed", "delivered", "cancelled"]
+
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    checkoutId: str = ""
     orderNumber: str
     vendorId: str
     vendorName: str = ""
@@ -114,9 +404,53 @@ class Order(BaseModel):
     supplierName: str = ""
     items: List[CartItem]
     totalAmount: float
-    status: str = "pending"
+    status: OrderStatus = "pending"
     deliveryAddress: str = ""
     createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: Optional[datetime] = None
+
+class Checkout(BaseModel):
+    checkoutId: str
+    orders: List[Order]
+    totalAmount: float
+
+class OrderPage(BaseModel):
+    items: List[Order]
+    next_cursor: Optional[str] = None
+
+# Fast response encoding
+class WireShape:
+    """Projects trusted Mongo documents straight into a response model's JSON shape.
+
+    Documents written by this API already match the models, so list endpoints
+    skip building and re-validating a Pydantic object per item and encode the
+    projected dicts with orjson. The models stay the declared response_model,
+    which keeps the OpenAPI schema unchanged.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.fields: List[tuple] = []
+        for name, field in model.model_fields.items():
+            if field.default_factory is not None:
+                self.fields.append((name, field.default_factory))
+            elif field.is_required():
+                self.fields.append((name, None))
+            else:
+                default = field.default
+                self.fields.append((name, lambda default=default: default))
+        self.projection = {"_id": 0, **{name: 1 for name, _ in self.fields}}
+
+    def project(self, doc: dict) -> dict:
+        return {name: doc[name] if name in doc else (factory() if factory else None)
+                for name, factory in self.fields}
+
+PRODUCT_WIRE = WireShape(Product)
+ORDER_WIRE = WireShape(Order)
+NEARBY_PRODUCT_WIRE = WireShape(NearbyProduct)
+NEARBY_SUPPLIER_WIRE = WireShape(NearbySupplier)
+
+def encode_page(shape: WireShape, docs: List[dict], next_cursor: Optional[str]) -> bytes:
+    return orjson.dumps({"items": [shape.project(doc) for doc in docs], "next_cursor": next_cursor})
 
 # Utility functions
 def hash_password(password: str) -> str:
@@ -125,29 +459,295 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+async def hash_password_async(password: str) -> str:
+    try:
+        return await hashing_pool.run(hash_password, password)
+    except HashingPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    try:
+        return await hashing_pool.run(verify_password, password, hashed)
+    except HashingPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+
 def create_access_token(data: dict):
     expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
     to_encode = data.copy()
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def token_claims(user: dict) -> dict:
+    return {"sub": user["id"], "userType": user["userType"], "businessName": user.get("businessName", "")}
+
+def invalidate_user(user_id: str):
+    # Must be called by every code path that changes a user record
+    user_cache.invalidate(user_id)
+
+async def load_user(user_id: str) -> Optional[dict]:
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await storage.users.get(user_id, {"_id": 0, "password": 0})
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
+
+async def authenticate_token(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id})
+        if TRUST_TOKEN_CLAIMS and "userType" in payload:
+            return {"id": user_id, "userType": payload["userType"], "businessName": payload.get("businessName", "")}
+        user = await load_user(user_id)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
         return user
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await authenticate_token(credentials.credentials)
+
+async def get_stream_user(token: Optional[str] = None,
+                          credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    # Browsers' EventSource cannot send headers, so the token may come as ?token=
+    if credentials is not None:
+        return await authenticate_token(credentials.credentials)
+    if token:
+        return await authenticate_token(token)
+    raise HTTPException(status_code=401, detail="Not authenticated")
+
+async def get_current_user_record(current_user: dict = Depends(get_current_user)):
+    # Full profile for endpoints that need more than the token claims
+    if "email" in current_user:
+        return current_user
+    user = await load_user(current_user["id"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+# Pagination helpers
+def encode_cursor(position: dict) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+async def keyset_page(fetch: Callable[[Optional[KeysetPosition], int], Awaitable[List[dict]]],
+                      cursor: Optional[str], limit: int):
+    # Newest first, with id as the tie-breaker so the order is total and stable.
+    # `fetch(after, limit)` is a repository page method.
+    after = None
+    if cursor:
+        position = decode_cursor(cursor)
+        try:
+            after = (datetime.fromisoformat(position["t"]), str(position["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    docs = await fetch(after, limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor({"t": docs[-1]["createdAt"].isoformat(), "id": docs[-1]["id"]})
+    return docs, next_cursor
+
+# Geospatial helpers
+def parse_near(near: str) -> dict:
+    try:
+        lat, lng = (float(part) for part in near.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="near must be \"latitude,longitude\"")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="near is outside the valid latitude/longitude range")
+    return geo_point(lat, lng)
+
+async def geo_near_page(fetch: Callable[[Optional[GeoPosition], int], Awaitable[List[dict]]],
+                        cursor: Optional[str], limit: int):
+    # Nearest first, with id as the tie-breaker; the cursor holds the last
+    # (distance, id). `fetch(after, limit)` is a repository nearby method.
+    after = None
+    if cursor:
+        position = decode_cursor(cursor)
+        try:
+            after = (float(position["d"]), str(position["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not 0 <= after[0] < float("inf"):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    docs = await fetch(after, limit + 1)
+    for doc in docs:
+        doc["distanceKm"] = round(doc["distance"] / 1000, 3)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor({"d": docs[-1]["distance"], "id": docs[-1]["id"]})
+    return docs, next_cursor
+
+async def supplier_location(supplier_id: str) -> Optional[dict]:
+    supplier = await load_user(supplier_id)
+    return supplier.get("location") if supplier else None
+
+async def backfill_locations():
+    # Users registered before geocoding existed, and their products, are located once
+    unlocated = await storage.users.unlocated()
+    locations = {}
+    for user in unlocated:
+        location = geocode(user.get("city", ""), user.get("state", ""))
+        if location is not None:
+            locations[user["id"]] = location
+    if locations:
+        await storage.users.set_locations(locations)
+        for user in unlocated:
+            invalidate_user(user["id"])
+        logger.info("Geocoded %d of %d users without a location", len(locations), len(unlocated))
+    
+    supplier_ids = await storage.products.unlocated_suppliers()
+    if not supplier_ids:
+        return
+    supplier_locations = await storage.users.locations(supplier_ids)
+    if supplier_locations:
+        located = await storage.products.locate(supplier_locations)
+        logger.info("Located %d products from their suppliers", located)
+
+# Catalog cache helpers
+def catalog_key(kind: str, **params) -> str:
+    return kind + ":" + json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+async def catalog_changed():
+    # Every product write path must call this after its write succeeds
+    await catalog_cache.bump()
+
+# Catalog change tracking
+async def next_catalog_seq(count: int = 1) -> int:
+    # Reserves `count` sequence numbers and returns the last of them
+    return await storage.counters.increment("catalogSeq", count)
+
+async def stamp_product_changes(products: List[dict]):
+    # Every product write path must stamp the documents it writes; updatedAt
+    # is set before the sequence number is taken
+    now = datetime.utcnow()
+    for product in products:
+        product["updatedAt"] = now
+    last = await next_catalog_seq(len(products))
+    for offset, product in enumerate(products):
+        product["changeSeq"] = last - len(products) + 1 + offset
+
+async def backfill_catalog_seq():
+    # Products written before change tracking existed get sequence numbers once
+    unstamped = await storage.products.unstamped()
+    if not unstamped:
+        return
+    last = await next_catalog_seq(len(unstamped))
+    await storage.products.stamp([
+        (product["id"], last - len(unstamped) + 1 + offset, product.get("createdAt") or datetime.utcnow())
+        for offset, product in enumerate(unstamped)
+    ])
+    logger.info("Assigned catalog sequence numbers to %d products", len(unstamped))
+
+def decode_sync_token(token: Optional[str]) -> int:
+    if not token:
+        return 0
+    seq = decode_cursor(token).get("s")
+    if not isinstance(seq, int) or seq < 0:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return seq
+
+# Conditional GET and compression for catalog responses
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def etag_matches(if_none_match: Optional[str], digest: str) -> bool:
+    # Any encoding of the same content counts as a match
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-")[0] == digest:
+            return True
+    return False
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def catalog_response(request: Request, body: bytes) -> Response:
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    encoding = None
+    if len(body) >= COMPRESSION_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": f'"{digest}-{encoding}"' if encoding else f'"{digest}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), digest):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        compressed = compressed_bodies.get((digest, encoding))
+        if compressed is None:
+            compressed = compress_body(body, encoding)
+            compressed_bodies.set((digest, encoding), compressed)
+        headers["Content-Encoding"] = encoding
+        body = compressed
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Search index maintenance
+def index_product(product: dict):
+    global search_index_watermark
+    search_index.add(product)
+    created_at = product.get("createdAt")
+    if created_at and (search_index_watermark is None or created_at > search_index_watermark):
+        search_index_watermark = created_at
+
+async def rebuild_search_index():
+    global search_index_watermark
+    products = [product async for product in storage.products.scan(SEARCH_PROJECTION)]
+    search_index.bulk_load(products)
+    search_index_watermark = max((p["createdAt"] for p in products if p.get("createdAt")), default=None)
+    logger.info("Search index built with %d products", len(search_index))
+
+async def sync_search_index():
+    while True:
+        await asyncio.sleep(SEARCH_INDEX_SYNC_SECONDS)
+        try:
+            async for product in storage.products.scan(SEARCH_PROJECTION, search_index_watermark):
+                index_product(product)
+        except Exception:
+            logger.exception("Search index sync failed")
+
 # Initialize sample data
 async def init_sample_data():
     # Check if data already exists
-    existing_users = await db.users.count_documents({})
+    existing_users = await storage.users.count()
     if existing_users > 0:
         return
     
@@ -156,7 +756,6 @@ async def init_sample_data():
         {
             "id": str(uuid.uuid4()),
             "email": "rajesh.dosa@gmail.com",
-            "password": hash_password("demo123"),
             "name": "Rajesh Kumar",
             "phone": "9876543210",
             "userType": "vendor",
@@ -168,7 +767,6 @@ async def init_sample_data():
         {
             "id": str(uuid.uuid4()),
             "email": "sunita.chaat@gmail.com",
-            "password": hash_password("demo123"),
             "name": "Sunita Sharma",
             "phone": "9876543211",
             "userType": "vendor",
@@ -180,7 +778,6 @@ async def init_sample_data():
         {
             "id": str(uuid.uuid4()),
             "email": "vikram.paratha@gmail.com",
-            "password": hash_password("demo123"),
             "name": "Vikram Singh",
             "phone": "9876543212",
             "userType": "vendor",
@@ -196,7 +793,6 @@ async def init_sample_data():
         {
             "id": str(uuid.uuid4()),
             "email": "delhi.agro@gmail.com",
-            "password": hash_password("demo123"),
             "name": "Amit Gupta",
             "phone": "9876543213",
             "userType": "supplier",
@@ -208,7 +804,6 @@ async def init_sample_data():
         {
             "id": str(uuid.uuid4()),
             "email": "mumbai.oils@gmail.com",
-            "password": hash_password("demo123"),
             "name": "Priya Patel",
             "phone": "9876543214",
             "userType": "supplier",
@@ -220,7 +815,6 @@ async def init_sample_data():
         {
             "id": str(uuid.uuid4()),
             "email": "punjab.fresh@gmail.com",
-            "password": hash_password("demo123"),
             "name": "Harjeet Singh",
             "phone": "9876543215",
             "userType": "supplier",
@@ -231,9 +825,15 @@ async def init_sample_data():
         }
     ]
     
-    # Insert users
+    # Every demo account shares one password, so it is hashed once
     all_users = vendors + suppliers
-    await db.users.insert_many(all_users)
+    password_hash = await hash_password_async(DEMO_PASSWORD)
+    for user_doc in all_users:
+        user_doc["password"] = password_hash
+        user_doc["location"] = geocode(user_doc["city"], user_doc["state"])
+    
+    # Insert users
+    await storage.users.insert_many(all_users)
     
     # Sample products
     products = [
@@ -359,23 +959,36 @@ async def init_sample_data():
         }
     ]
     
-    await db.products.insert_many(products)
+    supplier_locations = {supplier["id"]: supplier["location"] for supplier in suppliers}
+    for product in products:
+        product["location"] = supplier_locations[product["supplierId"]]
+    
+    await stamp_product_changes(products)
+    await storage.products.insert_many(products)
+    await record_supplier_stats(products_created_updates(products, LOW_STOCK_THRESHOLD))
 
 # API Routes
 @api_router.post("/auth/register", response_model=UserResponse)
 async def register(user: UserCreate):
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user.email})
+    existing_user = await storage.users.get_by_email(user.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
     user_dict = user.dict()
     user_dict["id"] = str(uuid.uuid4())
-    user_dict["password"] = hash_password(user.password)
+    user_dict["password"] = await hash_password_async(user.password)
     user_dict["createdAt"] = datetime.utcnow()
+    location = geocode(user.city, user.state)
+    if location is not None:
+        user_dict["location"] = location
     
-    await db.users.insert_one(user_dict)
+    try:
+        await storage.users.insert(user_dict)
+    except DuplicateKeyError:
+        # A concurrent sign-up with the same email won the unique index
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Return user without password
     user_dict.pop("password")
@@ -384,12 +997,12 @@ async def register(user: UserCreate):
 @api_router.post("/auth/login")
 async def login(user: UserLogin):
     # Find user
-    db_user = await db.users.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+    db_user = await storage.users.get_by_email(user.email)
+    if not db_user or not await verify_password_async(user.password, db_user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create access token
-    access_token = create_access_token(data={"sub": db_user["id"]})
+    access_token = create_access_token(data=token_claims(db_user))
     
     # Return user data and token
     db_user.pop("password")
@@ -400,117 +1013,760 @@ async def login(user: UserLogin):
     }
 
 @api_router.get("/auth/me", response_model=UserResponse)
-async def get_current_user_info(current_user: dict = Depends(get_current_user)):
+async def get_current_user_info(current_user: dict = Depends(get_current_user_record)):
     return UserResponse(**current_user)
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, search: Optional[str] = None):
-    query = {"isAvailable": True}
-    if category:
-        query["category"] = category
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
+async def load_product_page(category: Optional[str], search: Optional[str], cursor: Optional[str], limit: int) -> bytes:
+    # An empty search (a query with no words in it) matches nothing
+    if search is not None:
+        # Search results are ranked, so their cursor is an offset into the ranking
+        offset = decode_cursor(cursor).get("o", 0) if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        ranked_ids = search_index.search(search, category=category, limit=offset + limit + 1)
+        page_ids = ranked_ids[offset:offset + limit]
+        if not page_ids:
+            return encode_page(PRODUCT_WIRE, [], None)
+        # Ranked ids come from the in-process index; storage only fetches them by id
+        products = await storage.products.get_many(page_ids, PRODUCT_WIRE.projection, category=category,
+                                                   available_only=True)
+        rank = {product_id: position for position, product_id in enumerate(page_ids)}
+        products.sort(key=lambda product: rank[product["id"]])
+        next_cursor = encode_cursor({"o": offset + limit}) if len(ranked_ids) > offset + limit else None
+        return encode_page(PRODUCT_WIRE, products, next_cursor)
     
-    products = await db.products.find(query).to_list(1000)
-    return [Product(**product) for product in products]
+    products, next_cursor = await keyset_page(
+        lambda after, fetch_limit: storage.products.page(category, after, fetch_limit, PRODUCT_WIRE.projection),
+        cursor, limit,
+    )
+    return encode_page(PRODUCT_WIRE, products, next_cursor)
+
+async def load_nearby_product_page(category: Optional[str], search: Optional[str], point: dict, radius_km: float,
+                                   cursor: Optional[str], limit: int) -> bytes:
+    candidate_ids = None
+    if search is not None:
+        # Matches are ordered by distance, not rank, so only the candidate ids are needed
+        candidate_ids = search_index.search(search, category=category, limit=NEARBY_SEARCH_CANDIDATES)
+        if not candidate_ids:
+            return encode_page(NEARBY_PRODUCT_WIRE, [], None)
+    products, next_cursor = await geo_near_page(
+        lambda after, fetch_limit: storage.products.nearby(point, radius_km, category, candidate_ids, after,
+                                                           fetch_limit, NEARBY_PRODUCT_WIRE.projection),
+        cursor, limit,
+    )
+    return encode_page(NEARBY_PRODUCT_WIRE, products, next_cursor)
+
+@api_router.get("/products", response_model=Union[ProductPage, NearbyProductPage])
+async def get_products(
+    request: Request,
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    near: Optional[str] = Query(None, description="latitude,longitude; products are then sorted by distance"),
+    radius: float = Query(NEARBY_RADIUS_KM, gt=0, le=MAX_NEARBY_RADIUS_KM, description="Search radius in km"),
+):
+    normalized_search = " ".join(tokenize(search)) if search else None
+    point = parse_near(near) if near else None
+    geo = {"near": point["coordinates"], "radius": radius} if point else {}
+    key = catalog_key("products", category=category, search=normalized_search, cursor=cursor, limit=limit, **geo)
+    version, body = await catalog_cache.lookup(key)
+    if body is None:
+        if point:
+            body = await load_nearby_product_page(category, normalized_search, point, radius, cursor, limit)
+        else:
+            body = await load_product_page(category, normalized_search, cursor, limit)
+        await catalog_cache.store(key, version, body)
+    return catalog_response(request, body)
 
 @api_router.get("/products/categories")
-async def get_categories():
-    categories = await db.products.distinct("category")
-    return {"categories": categories}
+async def get_categories(request: Request):
+    key = catalog_key("categories")
+    version, body = await catalog_cache.lookup(key)
+    if body is None:
+        categories = await storage.products.categories()
+        body = orjson.dumps({"categories": categories})
+        await catalog_cache.store(key, version, body)
+    return catalog_response(request, body)
+
+@api_router.get("/products/changes", response_model=ProductChanges)
+async def get_product_changes(
+    request: Request,
+    since: Optional[str] = None,
+    limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=MAX_CHANGES_PAGE_SIZE),
+):
+    """Products created, updated or made unavailable since a sync token.
+    
+    Without `since` this pages through the whole catalog. Clients keep the
+    returned `next_token` and upsert `items` / drop `removed` by id; a change
+    may be sent twice, so applying it must be idempotent.
+    """
+    since_seq = decode_sync_token(since)
+    docs = await storage.products.changes(since_seq, limit + 1, {**PRODUCT_WIRE.projection, "changeSeq": 1})
+    
+    settled_before = datetime.utcnow() - timedelta(seconds=CATALOG_CHANGES_SETTLE_SECONDS)
+    items, removed, token_seq, settled = [], [], since_seq, True
+    for doc in docs[:limit]:
+        # A write that took an earlier number may still be in flight, so the
+        # token stops at the first recent write and later ones are re-sent
+        settled = settled and doc["updatedAt"] <= settled_before
+        if settled:
+            token_seq = doc["changeSeq"]
+        if doc.get("isAvailable", True):
+            items.append(PRODUCT_WIRE.project(doc))
+        else:
+            removed.append(doc["id"])
+    
+    body = orjson.dumps({
+        "items": items,
+        "removed": removed,
+        "next_token": encode_cursor({"s": token_seq}),
+        "has_more": len(docs) > limit and token_seq > since_seq,
+    })
+    return catalog_response(request, body)
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product)
+async def get_product(product_id: str, request: Request):
+    key = catalog_key("product", id=product_id)
+    version, body = await catalog_cache.lookup(key)
+    if body is None:
+        product = await storage.products.get(product_id, PRODUCT_WIRE.projection)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body = orjson.dumps(PRODUCT_WIRE.project(product))
+        await catalog_cache.store(key, version, body)
+    return catalog_response(request, body)
+
+# Idempotent writes
+def replay_response(body: str) -> Response:
+    return Response(content=body, media_type="application/json", headers={"Idempotent-Replayed": "true"})
+
+async def claim_idempotency_key(record_id: str, fingerprint: str) -> Optional[dict]:
+    """Returns None once this request owns the key, else the existing record."""
+    now = datetime.utcnow()
+    if await storage.idempotency.create(
+        {"_id": record_id, "state": "pending", "fingerprint": fingerprint, "createdAt": now, "lockedAt": now}
+    ):
+        return None
+    # Take over a pending key whose owner has not finished within the lock period
+    if await storage.idempotency.take_over(record_id, fingerprint, now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                                           now):
+        return None
+    return await storage.idempotency.get(record_id) or {"state": "released"}
+
+async def run_idempotent(key: Optional[str], scope: str, user_id: str, payload: dict,
+                         execute: Callable[[], Awaitable[BaseModel]]):
+    """Run `execute` at most once per (user, scope, key) and replay its response.
+    
+    Concurrent duplicates are coalesced: within a worker they await the same
+    future, across workers they poll the stored record until it completes.
+    Failed attempts release the key so the client can retry.
+    """
+    if key is None:
+        return await execute()
+    if not 0 < len(key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-255 characters")
+    
+    record_id = f"{user_id}:{scope}:{key}"
+    fingerprint = hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+    
+    while True:
+        inflight = idempotency_inflight.get(record_id)
+        if inflight is not None:
+            try:
+                return replay_response(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The owning request was cancelled; try to claim the key instead
+                continue
+        
+        record = await claim_idempotency_key(record_id, fingerprint)
+        if record is None:
+            break
+        if record["state"] == "released":
+            continue
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if record["state"] == "done":
+            return replay_response(record["body"])
+        if asyncio.get_running_loop().time() > deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(0.05)
+    
+    future = asyncio.get_running_loop().create_future()
+    idempotency_inflight[record_id] = future
+    try:
+        result = await execute()
+    except BaseException as e:
+        await storage.idempotency.delete(record_id)
+        if isinstance(e, Exception):
+            future.set_exception(e)
+            # Mark the exception retrieved; waiters re-raise it themselves
+            future.exception()
+        else:
+            future.cancel()
+        raise
+    finally:
+        idempotency_inflight.pop(record_id, None)
+    
+    body = result.model_dump_json()
+    await storage.idempotency.complete(record_id, body)
+    future.set_result(body)
+    return Response(content=body, media_type="application/json")
 
 @api_router.post("/products", response_model=Product)
-async def create_product(product: ProductCreate, current_user: dict = Depends(get_current_user)):
+async def create_product(
+    product: ProductCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
     if current_user["userType"] != "supplier":
         raise HTTPException(status_code=403, detail="Only suppliers can create products")
     
+    return await run_idempotent(idempotency_key, "products", current_user["id"], product.model_dump(),
+                                lambda: insert_product(product, current_user))
+
+def new_product(product: ProductCreate, current_user: dict, location: Optional[dict]) -> dict:
     product_dict = product.dict()
     product_dict["id"] = str(uuid.uuid4())
     product_dict["supplierId"] = current_user["id"]
     product_dict["supplierName"] = current_user["businessName"]
     product_dict["isAvailable"] = True
     product_dict["createdAt"] = datetime.utcnow()
+    if location is not None:
+        product_dict["location"] = location
+    return product_dict
+
+async def insert_product(product: ProductCreate, current_user: dict) -> Product:
+    product_dict = new_product(product, current_user, await supplier_location(current_user["id"]))
+    await stamp_product_changes([product_dict])
     
-    await db.products.insert_one(product_dict)
+    await storage.products.insert(product_dict)
+    await record_supplier_stats(products_created_updates([product_dict], LOW_STOCK_THRESHOLD))
+    index_product(product_dict)
+    await catalog_changed()
     return Product(**product_dict)
 
-@api_router.post("/orders", response_model=Order)
-async def create_order(order_data: OrderCreate, current_user: dict = Depends(get_current_user)):
+@api_router.post("/products/import", response_model=ProductImportReport)
+async def import_products(request: Request, current_user: dict = Depends(get_current_user)):
+    """Create products from a CSV (text/csv) or NDJSON (application/x-ndjson) upload.
+    
+    Columns / keys are the ProductCreate fields. Valid rows are imported even
+    when others fail; each failure is reported with its line number.
+    """
+    if current_user["userType"] != "supplier":
+        raise HTTPException(status_code=403, detail="Only suppliers can create products")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    parse_rows = IMPORT_FORMATS.get(content_type)
+    if parse_rows is None:
+        raise HTTPException(status_code=415, detail=f"Upload one of: {', '.join(IMPORT_FORMATS)}")
+    
+    report = ProductImportReport()
+    location = await supplier_location(current_user["id"])
+    
+    def reject(row: int, errors: List[str]):
+        report.failed += 1
+        if len(report.errors) < IMPORT_MAX_ERRORS:
+            report.errors.append(ImportRowError(row=row, errors=errors))
+        else:
+            report.errorsTruncated = True
+    
+    batch = []
+    try:
+        async for row_number, row, error in parse_rows(request.stream(), IMPORT_MAX_LINE_BYTES):
+            if error is not None:
+                reject(row_number, [error])
+                continue
+            try:
+                product = ProductCreate.model_validate(row)
+            except ValidationError as e:
+                reject(row_number, [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()])
+                continue
+            batch.append((row_number, new_product(product, current_user, location)))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                report.imported += await write_import_batch(batch, reject)
+                batch = []
+    except ImportFormatError as e:
+        reject(e.line, [str(e)])
+    if batch:
+        report.imported += await write_import_batch(batch, reject)
+    return report
+
+async def write_import_batch(batch: List[tuple], reject: Callable[[int, List[str]], None]) -> int:
+    products = [product for _, product in batch]
+    await stamp_product_changes(products)
+    failed = await storage.products.insert_many(products)
+    for index, message in failed.items():
+        reject(batch[index][0], [message])
+    inserted = [product for index, product in enumerate(products) if index not in failed]
+    await record_supplier_stats(products_created_updates(inserted, LOW_STOCK_THRESHOLD))
+    for product in inserted:
+        index_product(product)
+    await catalog_changed()
+    return len(inserted)
+
+# Cart pricing
+PRICE_TOLERANCE = 0.005
+
+async def price_cart(cart: List[CartItem]):
+    """Resolve every cart line with one lookup by id and recompute prices server-side.
+    
+    Raises 409 listing every line that no longer matches the catalog, so the
+    client can refresh its cart in a single round trip.
+    """
+    if not cart:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    product_ids = [item.productId for item in cart]
+    if len(set(product_ids)) != len(product_ids):
+        raise HTTPException(status_code=400, detail="Cart contains the same product more than once")
+    
+    products = await storage.products.get_many(product_ids, PRODUCT_WIRE.projection)
+    products_by_id = {product["id"]: product for product in products}
+    
+    items, problems, total_amount = [], [], 0.0
+    for item in cart:
+        product = products_by_id.get(item.productId)
+        if product is None:
+            problems.append({"productId": item.productId, "reason": "not_found"})
+            continue
+        if not product.get("isAvailable", True):
+            problems.append({"productId": item.productId, "reason": "unavailable"})
+            continue
+        if item.quantity < product.get("minOrderQty", 1) or item.quantity > product.get("maxOrderQty", 1000):
+            problems.append({"productId": item.productId, "reason": "quantity_out_of_range",
+                             "minOrderQty": product.get("minOrderQty", 1), "maxOrderQty": product.get("maxOrderQty", 1000)})
+            continue
+        if item.quantity > product["stock"]:
+            problems.append({"productId": item.productId, "reason": "insufficient_stock", "stock": product["stock"]})
+            continue
+        if abs(item.unitPrice - product["price"]) > PRICE_TOLERANCE:
+            problems.append({"productId": item.productId, "reason": "price_changed", "price": product["price"]})
+            continue
+        
+        line_total = round(product["price"] * item.quantity, 2)
+        total_amount += line_total
+        items.append({
+            "productId": product["id"],
+            "productName": product["name"],
+            "quantity": item.quantity,
+            "unitPrice": product["price"],
+            "totalPrice": line_total,
+            "supplierId": product["supplierId"],
+            "supplierName": product.get("supplierName", ""),
+        })
+    
+    if problems:
+        raise HTTPException(status_code=409, detail={"message": "Cart is out of date", "problems": problems})
+    return items, round(total_amount, 2)
+
+# Stock reservation
+async def stock_change_stamps(items: List[dict]) -> Dict[str, dict]:
+    # Stock writes are product writes: each product touched gets a new changeSeq
+    stamps = {item["productId"]: {} for item in items}
+    await stamp_product_changes(list(stamps.values()))
+    return stamps
+
+async def apply_stock_changes(items: List[dict], sign: int) -> List[Optional[dict]]:
+    # Guarded per line; None where a line could not be taken
+    levels = await storage.products.adjust_stock(items, sign, await stock_change_stamps(items))
+    await track_stock_levels([level for level in levels if level is not None], items, sign)
+    return levels
+
+async def release_stock(items: List[dict]):
+    if items:
+        await apply_stock_changes(items, +1)
+        await catalog_changed()
+
+async def reserve_stock(items: List[dict]):
+    """Atomically take stock for every line, or for none of them."""
+    levels, failed = await storage.products.reserve_stock(items, await stock_change_stamps(items))
+    if levels is not None:
+        await track_stock_levels(levels, items, -1)
+        await catalog_changed()
+        return
+    
+    # Report current stock for the lines that could not be reserved
+    stock = await storage.products.stock([item["productId"] for item in failed])
+    problems = [
+        {"productId": item["productId"], "reason": "insufficient_stock", "stock": stock.get(item["productId"], 0)}
+        for item in failed
+    ]
+    raise HTTPException(status_code=409, detail={"message": "Cart is out of date", "problems": problems})
+
+@api_router.post("/orders", response_model=Checkout)
+async def create_order(
+    order_data: OrderCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
     if current_user["userType"] != "vendor":
         raise HTTPException(status_code=403, detail="Only vendors can create orders")
     
-    # Calculate total amount
-    total_amount = sum(item.totalPrice for item in order_data.items)
-    
-    # Create order
-    order_dict = {
-        "id": str(uuid.uuid4()),
-        "orderNumber": f"ORD{datetime.now().strftime('%Y%m%d%H%M%S')}",
-        "vendorId": current_user["id"],
-        "vendorName": current_user["businessName"],
-        "supplierId": order_data.items[0].supplierId if order_data.items else "",
-        "supplierName": order_data.items[0].supplierName if order_data.items else "",
-        "items": [item.dict() for item in order_data.items],
-        "totalAmount": total_amount,
-        "status": "pending",
-        "deliveryAddress": order_data.deliveryAddress,
-        "createdAt": datetime.utcnow()
-    }
+    return await run_idempotent(idempotency_key, "orders", current_user["id"], order_data.model_dump(),
+                                lambda: place_order(order_data, current_user))
+
+async def place_order(order_data: OrderCreate, current_user: dict) -> Checkout:
+    # Price the cart from the catalog rather than trusting client prices
+    items, total_amount = await price_cart(order_data.items)
+    
+    # One child order per supplier, all under the same checkout
+    items_by_supplier = {}
+    for item in items:
+        items_by_supplier.setdefault(item["supplierId"], []).append(item)
     
-    await db.orders.insert_one(order_dict)
-    return Order(**order_dict)
+    checkout_id = str(uuid.uuid4())
+    numbers = await order_numbers.next_many(len(items_by_supplier))
+    created_at = datetime.utcnow()
+    orders = []
+    for order_number, supplier_items in zip(numbers, items_by_supplier.values()):
+        orders.append({
+            "id": str(uuid.uuid4()),
+            "checkoutId": checkout_id,
+            "orderNumber": order_number,
+            "vendorId": current_user["id"],
+            "vendorName": current_user["businessName"],
+            "supplierId": supplier_items[0]["supplierId"],
+            "supplierName": supplier_items[0]["supplierName"],
+            "items": supplier_items,
+            "totalAmount": round(sum(item["totalPrice"] for item in supplier_items), 2),
+            "status": "pending",
+            "deliveryAddress": order_data.deliveryAddress,
+            "createdAt": created_at,
+            "updatedAt": created_at
+        })
+    
+    await reserve_stock(items)
+    try:
+        await storage.orders.insert_many(orders)
+    except Exception:
+        # Undo a partially applied insert before handing the stock back
+        await storage.orders.delete_checkout(checkout_id)
+        await release_stock(items)
+        raise
+    await record_supplier_stats([order_created_update(order) for order in orders])
+    for order in orders:
+        await orders_changed(order["supplierId"])
+        publish_order_event(order)
+    return Checkout(checkoutId=checkout_id, orders=[Order(**order) for order in orders], totalAmount=total_amount)
 
-@api_router.get("/orders", response_model=List[Order])
-async def get_orders(current_user: dict = Depends(get_current_user)):
+def order_owner_query(current_user: dict) -> dict:
     if current_user["userType"] == "vendor":
-        orders = await db.orders.find({"vendorId": current_user["id"]}).to_list(1000)
-    else:
-        orders = await db.orders.find({"supplierId": current_user["id"]}).to_list(1000)
+        return {"vendorId": current_user["id"]}
+    return {"supplierId": current_user["id"]}
+
+@api_router.get("/orders", response_model=OrderPage)
+async def get_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user),
+):
+    owner = order_owner_query(current_user)
+    orders, next_cursor = await keyset_page(
+        lambda after, fetch_limit: storage.orders.page(owner, after, fetch_limit, ORDER_WIRE.projection),
+        cursor, limit,
+    )
+    return Response(content=encode_page(ORDER_WIRE, orders, next_cursor), media_type="application/json")
+
+@api_router.get("/orders/export")
+async def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """Stream the caller's orders, oldest first, with createdAt in [start, end)."""
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
     
-    return [Order(**order) for order in orders]
+    cursor = storage.orders.export(order_owner_query(current_user), start, end, ORDER_WIRE.projection,
+                                   EXPORT_BATCH_SIZE)
+    orders = (ORDER_WIRE.project(order) async for order in cursor)
+    filename = f"orders-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        encode_orders(orders, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @api_router.put("/orders/{order_id}/status")
-async def update_order_status(order_id: str, status: str, current_user: dict = Depends(get_current_user)):
+async def update_order_status(order_id: str, status: OrderStatus, current_user: dict = Depends(get_current_user)):
     if current_user["userType"] != "supplier":
         raise HTTPException(status_code=403, detail="Only suppliers can update order status")
     
-    result = await db.orders.update_one(
-        {"id": order_id, "supplierId": current_user["id"]},
-        {"$set": {"status": status}}
-    )
+    # Cancelled is terminal: the transition happens at most once and releases the
+    # order's stock reservation exactly once
+    updated_at = datetime.utcnow()
+    order = await storage.orders.update_status(order_id, current_user["id"], status, updated_at,
+                                               {**ORDER_EVENT_PROJECTION, "items": 1})
     
-    if result.matched_count == 0:
+    if order is None:
+        if await storage.orders.exists(order_id, current_user["id"]):
+            raise HTTPException(status_code=409, detail="Cancelled orders cannot be changed")
         raise HTTPException(status_code=404, detail="Order not found")
     
+    if status == "cancelled":
+        await release_stock(order["items"])
+    await record_supplier_stats([status_changed_update(order, status)])
+    await orders_changed(current_user["id"])
+    publish_order_event({**order, "status": status, "updatedAt": updated_at})
+    
     return {"message": "Order status updated successfully"}
 
+# Order event stream
+def order_event(order: dict) -> dict:
+    event = {field: order.get(field) for field in ORDER_EVENT_PROJECTION if field != "_id"}
+    event["type"] = "order.created" if order.get("updatedAt") == order.get("createdAt") else "order.updated"
+    return event
+
+def publish_order_event(order: dict):
+    # With a changestream or poll source every worker gets events from the feed
+    if ORDER_EVENTS_SOURCE == "local":
+        order_events.publish(order_event(order))
+
+async def watch_order_changes():
+    while True:
+        try:
+            async for order in storage.orders.watch():
+                order_events.publish(order_event(order))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Order change stream failed; reconnecting")
+            await asyncio.sleep(5)
+
+async def poll_order_changes():
+    watermark = datetime.utcnow()
+    seen_at_watermark = set()
+    while True:
+        await asyncio.sleep(ORDER_EVENTS_POLL_SECONDS)
+        try:
+            async for order in storage.orders.changed_since(watermark, ORDER_EVENT_PROJECTION):
+                if order["updatedAt"] > watermark:
+                    watermark = order["updatedAt"]
+                    seen_at_watermark = set()
+                elif order["id"] in seen_at_watermark:
+                    continue
+                seen_at_watermark.add(order["id"])
+                order_events.publish(order_event(order))
+        except Exception:
+            logger.exception("Order change poll failed")
+
+async def order_event_stream(subscription):
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            if not await subscription.wait(ORDER_STREAM_HEARTBEAT_SECONDS):
+                yield ": keepalive\n\n"
+                continue
+            if subscription.overflowed:
+                # Events were dropped; the client should re-fetch GET /api/orders
+                subscription.overflowed = False
+                subscription.events.clear()
+                yield "event: resync\ndata: {}\n\n"
+                continue
+            while subscription.events:
+                event = subscription.events.popleft()
+                yield f"event: {event['type']}\ndata: {orjson.dumps(event).decode()}\n\n"
+    finally:
+        order_events.unsubscribe(subscription)
+
+@api_router.get("/orders/stream")
+async def stream_orders(current_user: dict = Depends(get_stream_user)):
+    subscription = order_events.subscribe(current_user["id"])
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Too many open order streams")
+    return StreamingResponse(
+        order_event_stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Supplier discovery
+@api_router.get("/suppliers/nearby", response_model=NearbySupplierPage)
+async def get_nearby_suppliers(
+    near: Optional[str] = Query(None, description="latitude,longitude; defaults to your own city"),
+    radius: float = Query(NEARBY_RADIUS_KM, gt=0, le=MAX_NEARBY_RADIUS_KM, description="Search radius in km"),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user),
+):
+    if near:
+        point = parse_near(near)
+    else:
+        user = await load_user(current_user["id"])
+        point = user.get("location") if user else None
+        if point is None:
+            raise HTTPException(status_code=400, detail="Your city could not be located; pass near=latitude,longitude")
+    suppliers, next_cursor = await geo_near_page(
+        lambda after, fetch_limit: storage.users.nearby_suppliers(point, radius, after, fetch_limit,
+                                                                  NEARBY_SUPPLIER_WIRE.projection),
+        cursor, limit,
+    )
+    return Response(content=encode_page(NEARBY_SUPPLIER_WIRE, suppliers, next_cursor), media_type="application/json")
+
+# Supplier analytics
+async def orders_changed(supplier_id: str):
+    # Every order write path must call this for each supplier it touched
+    await analytics_cache.bump(supplier_id)
+
+async def load_supplier_analytics(supplier_id: str, days: int, weeks: int) -> bytes:
+    now = datetime.utcnow()
+    result = await storage.orders.supplier_analytics(supplier_id, days, weeks, now, ANALYTICS_TOP_PRODUCTS,
+                                                     ANALYTICS_TOP_VENDORS)
+    totals = result["totals"][0] if result["totals"] else {"revenue": 0.0, "orders": 0, "units": 0}
+    return orjson.dumps({
+        "totals": {
+            "revenue": round(totals["revenue"], 2),
+            "orders": totals["orders"],
+            "units": totals["units"],
+            "averageOrderValue": round(totals["revenue"] / totals["orders"], 2) if totals["orders"] else 0.0,
+        },
+        "byStatus": result["byStatus"],
+        "products": result["products"],
+        "topVendors": result["topVendors"],
+        "daily": result["daily"],
+        "weekly": result["weekly"],
+        "generatedAt": now,
+    })
+
+@api_router.get("/analytics/supplier", response_model=SupplierAnalytics)
+async def get_supplier_analytics(
+    days: int = Query(30, ge=1, le=366),
+    weeks: int = Query(12, ge=1, le=104),
+    current_user: dict = Depends(get_current_user),
+):
+    if current_user["userType"] != "supplier":
+        raise HTTPException(status_code=403, detail="Only suppliers can view sales analytics")
+    
+    key = f"days={days}&weeks={weeks}"
+    version, body = await analytics_cache.lookup(key, scope=current_user["id"])
+    if body is None:
+        body = await load_supplier_analytics(current_user["id"], days, weeks)
+        await analytics_cache.store(key, version, body, scope=current_user["id"])
+    return Response(content=body, media_type="application/json")
+
+# Supplier counters
+async def record_supplier_stats(changes: List[Optional[StatsChange]]):
+    changes = [change for change in changes if change is not None]
+    if changes:
+        await storage.supplier_stats.apply(changes)
+
+async def track_stock_levels(levels: List[dict], items: List[dict], sign: int):
+    # Count products whose stock change crossed LOW_STOCK_THRESHOLD either way
+    quantities = {item["productId"]: item["quantity"] for item in items}
+    changes: Dict[str, int] = {}
+    for level in levels:
+        delta = low_stock_delta(level["stock"], sign * quantities[level["id"]], LOW_STOCK_THRESHOLD)
+        if delta:
+            changes[level["supplierId"]] = changes.get(level["supplierId"], 0) + delta
+    await record_supplier_stats([
+        (supplier_id, {"products.lowStock": delta}) for supplier_id, delta in changes.items() if delta
+    ])
+
+async def reconcile_supplier_stats_periodically():
+    while True:
+        await asyncio.sleep(SUPPLIER_STATS_RECONCILE_SECONDS)
+        try:
+            drift = await storage.supplier_stats.reconcile(LOW_STOCK_THRESHOLD)
+            for supplier_id, problems in drift.items():
+                logger.warning("Supplier stats drift for %s: %s", supplier_id, "; ".join(problems))
+        except Exception:
+            logger.exception("Supplier stats reconciliation failed")
+
+async def bootstrap_supplier_stats():
+    # Build the counters once for databases that predate them
+    if await storage.supplier_stats.count() == 0:
+        drift = await storage.supplier_stats.reconcile(LOW_STOCK_THRESHOLD, fix=True)
+        if drift:
+            logger.info("Built supplier stats for %d suppliers", len(drift))
+
+@api_router.get("/analytics/supplier/summary", response_model=SupplierSummary)
+async def get_supplier_summary(current_user: dict = Depends(get_current_user)):
+    if current_user["userType"] != "supplier":
+        raise HTTPException(status_code=403, detail="Only suppliers can view sales analytics")
+    
+    today = datetime.utcnow()
+    days = [(today - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(6, -1, -1)]
+    stats = await storage.supplier_stats.get(current_user["id"], days) or {}
+    revenue_by_day = stats.get("revenueByDay", {})
+    products = stats.get("products", {})
+    return {
+        "orders": stats.get("orders", {"total": 0}),
+        "revenue": round(stats.get("revenue", 0.0), 2),
+        "revenueToday": round(revenue_by_day.get(days[-1], 0.0), 2),
+        "recentRevenue": [{"date": day, "revenue": round(revenue_by_day.get(day, 0.0), 2)} for day in days],
+        "unitsSold": stats.get("unitsSold", 0),
+        "products": products.get("total", 0),
+        "lowStockProducts": products.get("lowStock", 0),
+        "lowStockThreshold": LOW_STOCK_THRESHOLD,
+    }
+
 # Root endpoint
 @api_router.get("/")
 async def root():
     return {"message": "StreetBazaar API is running!"}
 
+@api_router.get("/health")
+async def health():
+    return {"status": "ok", "hashing": hashing_pool.stats(), "userCache": user_cache.stats(),
+            "catalogCache": catalog_cache.stats(), "analyticsCache": analytics_cache.stats(),
+            "orderStreams": order_events.stats()}
+
+# Request profiling settings, changeable without a restart. There are no
+# admin users, so the profiling token guards this endpoint.
+@api_router.put("/admin/profiling", response_model=ProfilingStatus)
+async def update_profiling(
+    sample_rate: Optional[float] = Query(None, ge=0, le=1),
+    slow_ms: Optional[float] = Query(None, ge=0),
+    x_profile_token: Optional[str] = Header(None),
+):
+    # X-Profile would profile this request too, so the token comes in its own header
+    if not (profile_settings.token and x_profile_token
+            and hmac.compare_digest(x_profile_token.encode("utf-8"), profile_settings.token.encode("utf-8"))):
+        raise HTTPException(status_code=403, detail="Profiling token required")
+    if sample_rate is not None:
+        profile_settings.sample_rate = sample_rate
+    if slow_ms is not None:
+        profile_settings.slow_ms = slow_ms
+    return ProfilingStatus(available=profile_settings.available, sampleRate=profile_settings.sample_rate,
+                           slowMs=profile_settings.slow_ms, directory=str(profile_settings.directory))
+
 # Include router
 app.include_router(api_router)
 
+# Prometheus scrape target, at the conventional path rather than under /api
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Initialize sample data on startup
 @app.on_event("startup")
 async def startup_event():
+    if (profile_settings.token or profile_settings.sample_rate) and not profile_settings.available:
+        logger.warning("Request profiling is configured but pyinstrument is not installed")
+    await storage.prepare()
     await init_sample_data()
+    await backfill_catalog_seq()
+    await backfill_locations()
+    await bootstrap_supplier_stats()
+    await rebuild_search_index()
+    background_tasks.append(asyncio.create_task(sync_search_index()))
+    if SUPPLIER_STATS_RECONCILE_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(reconcile_supplier_stats_periodically()))
+    if ORDER_EVENTS_SOURCE == "changestream":
+        background_tasks.append(asyncio.create_task(watch_order_changes()))
+    elif ORDER_EVENTS_SOURCE == "poll":
+        background_tasks.append(asyncio.create_task(poll_order_changes()))
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
-    client.close()
+    for task in background_tasks:
+        task.cancel()
+    storage.close()
+    hashing_pool.shutdown()
 
 # Configure logging
 logging.basicConfig(
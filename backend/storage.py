@@ -0,0 +1,271 @@
+"""Storage interface for the StreetBazaar collections.
+
+Handlers reach users, products, orders and the smaller bookkeeping
+collections only through the repositories below. Two engines implement
+them: mongo_storage (Motor, the default) and memory_storage (indexed
+in-process structures for tests, benchmarks and single-node kiosks).
+
+Documents are plain dicts shaped like the MongoDB documents, without
+`_id`. Projections use MongoDB's top-level syntax ({"field": 1} or
+{"field": 0}). Pages are fetched with `limit + 1` by the caller, which
+turns the extra document into a cursor.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from supplier_stats import StatsChange
+
+# Resume points: (createdAt, id) of the last document of a newest-first page,
+# and (distance in metres, id) of the last document of a nearest-first page
+KeysetPosition = Tuple[datetime, str]
+GeoPosition = Tuple[float, str]
+
+ENGINES = ("mongo", "memory")
+
+
+class UserRepo(ABC):
+    @abstractmethod
+    async def get(self, user_id: str, projection: Optional[Dict[str, int]] = None) -> Optional[dict]:
+        """The user by id, or None."""
+
+    @abstractmethod
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        """The full record, password hash included."""
+
+    @abstractmethod
+    async def insert(self, user: dict):
+        """Raises pymongo's DuplicateKeyError for a taken email or id."""
+
+    @abstractmethod
+    async def insert_many(self, users: List[dict]):
+        """Insert users in order."""
+
+    @abstractmethod
+    async def clear(self):
+        """Delete every document; benchmarks reset their data with this."""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Number of users."""
+
+    @abstractmethod
+    async def unlocated(self) -> List[dict]:
+        """id, city and state of users without a location."""
+
+    @abstractmethod
+    async def set_locations(self, locations: Dict[str, dict]):
+        """Set the location of each user id."""
+
+    @abstractmethod
+    async def locations(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """Location per user id, for the users that have one."""
+
+    @abstractmethod
+    async def nearby_suppliers(self, point: dict, radius_km: float, after: Optional[GeoPosition], limit: int,
+                               projection: Dict[str, int]) -> List[dict]:
+        """Suppliers nearest first (ties by id), each with `distance` in metres."""
+
+
+class ProductRepo(ABC):
+    @abstractmethod
+    async def get(self, product_id: str, projection: Optional[Dict[str, int]] = None) -> Optional[dict]:
+        """The product by id, or None."""
+
+    @abstractmethod
+    async def get_many(self, product_ids: List[str], projection: Optional[Dict[str, int]] = None,
+                       category: Optional[str] = None, available_only: bool = False) -> List[dict]:
+        """Products by id, in no particular order."""
+
+    @abstractmethod
+    async def page(self, category: Optional[str], after: Optional[KeysetPosition], limit: int,
+                   projection: Dict[str, int]) -> List[dict]:
+        """Available products newest first, ties broken by id."""
+
+    @abstractmethod
+    async def nearby(self, point: dict, radius_km: float, category: Optional[str], product_ids: Optional[List[str]],
+                     after: Optional[GeoPosition], limit: int, projection: Dict[str, int]) -> List[dict]:
+        """Available products nearest first (ties by id), each with `distance` in metres."""
+
+    @abstractmethod
+    async def categories(self) -> List[str]:
+        """Distinct product categories."""
+
+    @abstractmethod
+    async def changes(self, since_seq: int, limit: int, projection: Dict[str, int]) -> List[dict]:
+        """Products with changeSeq above `since_seq`, in changeSeq order."""
+
+    @abstractmethod
+    async def insert(self, product: dict):
+        """Raises pymongo's DuplicateKeyError for a taken id."""
+
+    @abstractmethod
+    async def insert_many(self, products: List[dict]) -> Dict[int, str]:
+        """Unordered insert; returns the error message per position that failed."""
+
+    @abstractmethod
+    async def clear(self):
+        """Delete every document; benchmarks reset their data with this."""
+
+    @abstractmethod
+    def scan(self, projection: Dict[str, int], created_since: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """Every product, or those created at or after `created_since`."""
+
+    @abstractmethod
+    async def unstamped(self) -> List[dict]:
+        """id and createdAt of products without a changeSeq."""
+
+    @abstractmethod
+    async def stamp(self, stamps: List[Tuple[str, int, datetime]]):
+        """Set (id, changeSeq, updatedAt) on products that still have no changeSeq."""
+
+    @abstractmethod
+    async def unlocated_suppliers(self) -> List[str]:
+        """Ids of suppliers with products that have no location."""
+
+    @abstractmethod
+    async def locate(self, locations: Dict[str, dict]) -> int:
+        """Give unlocated products their supplier's location; returns how many changed."""
+
+    @abstractmethod
+    async def stock(self, product_ids: List[str]) -> Dict[str, int]:
+        """Current stock per product id, for the products that exist."""
+
+    @abstractmethod
+    async def adjust_stock(self, items: List[dict], sign: int, stamps: Dict[str, dict]) -> List[Optional[dict]]:
+        """Add (sign +1) or take (sign -1) each item's quantity, line by line.
+
+        Taking is guarded: a line whose product is unavailable or short of
+        stock is left alone and gets None. The other lines get the product's
+        id, supplierId and stock after the change. `stamps` maps each product
+        id to the changeSeq and updatedAt set in the same write.
+        """
+
+    @abstractmethod
+    async def reserve_stock(self, items: List[dict], stamps: Dict[str, dict]) -> Tuple[Optional[List[dict]], List[dict]]:
+        """Take stock for every item or for none of them, stamping as adjust_stock does.
+
+        Returns (stock levels after the reservation, []) on success and
+        (None, the items that could not be reserved) otherwise.
+        """
+
+
+class OrderRepo(ABC):
+    @abstractmethod
+    async def insert_many(self, orders: List[dict]):
+        """Insert the orders of one checkout."""
+
+    @abstractmethod
+    async def clear(self):
+        """Delete every document; benchmarks reset their data with this."""
+
+    @abstractmethod
+    async def delete_checkout(self, checkout_id: str):
+        """Delete every order of a checkout."""
+
+    @abstractmethod
+    async def page(self, owner: Dict[str, str], after: Optional[KeysetPosition], limit: int,
+                   projection: Dict[str, int]) -> List[dict]:
+        """The owner's orders ({"vendorId": id} or {"supplierId": id}) newest first, ties by id."""
+
+    @abstractmethod
+    def export(self, owner: Dict[str, str], start: Optional[datetime], end: Optional[datetime],
+               projection: Dict[str, int], batch_size: int) -> AsyncIterator[dict]:
+        """The owner's orders oldest first, with createdAt in [start, end)."""
+
+    @abstractmethod
+    async def update_status(self, order_id: str, supplier_id: str, status: str, updated_at: datetime,
+                            projection: Dict[str, int]) -> Optional[dict]:
+        """Set the status of a supplier's order unless it is cancelled; returns the order as it was."""
+
+    @abstractmethod
+    async def exists(self, order_id: str, supplier_id: str) -> bool:
+        """Whether the supplier has an order with this id."""
+
+    @abstractmethod
+    def changed_since(self, since: datetime, projection: Dict[str, int]) -> AsyncIterator[dict]:
+        """Orders updated at or after `since`, in updatedAt order."""
+
+    @abstractmethod
+    def watch(self) -> AsyncIterator[dict]:
+        """Every order as it is inserted or updated, until cancelled."""
+
+    @abstractmethod
+    async def supplier_analytics(self, supplier_id: str, days: int, weeks: int, now: datetime,
+                                 top_products: int, top_vendors: int) -> Dict[str, Any]:
+        """Sales facets of one supplier's orders.
+
+        totals (one row, or none without sales), byStatus, products,
+        topVendors, and daily / weekly rows for the last `days` days and
+        `weeks` ISO weeks. Cancelled orders only count in byStatus.
+        """
+
+
+class SupplierStatsRepo(ABC):
+    @abstractmethod
+    async def apply(self, changes: List[StatsChange]):
+        """Add each change's increments to its supplier's counters, creating them as needed."""
+
+    @abstractmethod
+    async def clear(self):
+        """Delete every document; benchmarks reset their data with this."""
+
+    @abstractmethod
+    async def get(self, supplier_id: str, days: List[str]) -> Optional[dict]:
+        """The supplier's counters, with revenueByDay cut down to `days`."""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Number of suppliers with counters."""
+
+    @abstractmethod
+    async def reconcile(self, low_stock_threshold: int, fix: bool = False) -> Dict[str, List[str]]:
+        """supplier_stats.reconcile_supplier_stats for this engine."""
+
+
+class CounterRepo(ABC):
+    @abstractmethod
+    async def increment(self, name: str, count: int = 1) -> int:
+        """Add `count` to a named counter (created at 0) and return the new value."""
+
+
+class IdempotencyRepo(ABC):
+    @abstractmethod
+    async def create(self, record: dict) -> bool:
+        """Insert a record keyed by its _id; False when the key already exists."""
+
+    @abstractmethod
+    async def take_over(self, record_id: str, fingerprint: str, locked_before: datetime, now: datetime) -> bool:
+        """Re-lock a pending record whose lock is older than `locked_before`."""
+
+    @abstractmethod
+    async def get(self, record_id: str) -> Optional[dict]:
+        """The record by _id, or None."""
+
+    @abstractmethod
+    async def complete(self, record_id: str, body: str):
+        """Store the response body and mark the record done."""
+
+    @abstractmethod
+    async def delete(self, record_id: str):
+        """Delete the record, releasing its key."""
+
+
+class Storage(ABC):
+    """One engine's repositories, plus its startup and shutdown."""
+
+    engine = ""
+    users: UserRepo
+    products: ProductRepo
+    orders: OrderRepo
+    supplier_stats: SupplierStatsRepo
+    counters: CounterRepo
+    idempotency: IdempotencyRepo
+
+    @abstractmethod
+    async def prepare(self):
+        """Create indexes and probe capabilities; called once at startup."""
+
+    @abstractmethod
+    def close(self):
+        """Release connections; called once at shutdown."""
@@ -0,0 +1,211 @@
+"""Per-supplier counters kept in db.supplier_stats.
+
+Order, status, product and stock writes apply small increments built
+here, so dashboard reads are one document fetch. Reconciliation rebuilds
+the counters from orders and products and reports where they drifted.
+
+Run from the backend directory:
+    python supplier_stats.py          report drift
+    python supplier_stats.py --fix    report drift, then rewrite drifted suppliers
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReplaceOne
+
+STATUS_KEY_RE = re.compile(r"[A-Za-z_]{1,32}")
+REVENUE_TOLERANCE = 0.01
+
+# (supplier id, {dotted counter path: increment}); the storage engine applies
+# it as an upserting $inc
+StatsChange = Tuple[str, Dict[str, Any]]
+
+
+def status_key(status: str) -> str:
+    # Statuses become field names, so anything unusual is counted as "other"
+    return status if STATUS_KEY_RE.fullmatch(status or "") else "other"
+
+
+def day_key(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+
+def order_units(order: Dict[str, Any]) -> int:
+    return sum(item.get("quantity", 0) for item in order.get("items", []))
+
+
+def order_created_update(order: Dict[str, Any]) -> StatsChange:
+    return order["supplierId"], {
+        "orders.total": 1,
+        f"orders.{status_key(order['status'])}": 1,
+        "revenue": order["totalAmount"],
+        f"revenueByDay.{day_key(order['createdAt'])}": order["totalAmount"],
+        "unitsSold": order_units(order),
+    }
+
+
+def status_changed_update(order: Dict[str, Any], new_status: str) -> Optional[StatsChange]:
+    """Move an order between status counters; leaving for "cancelled" also takes back its sales."""
+    old_key, new_key = status_key(order["status"]), status_key(new_status)
+    changes: Dict[str, Any] = {}
+    if old_key != new_key:
+        changes[f"orders.{old_key}"] = -1
+        changes[f"orders.{new_key}"] = 1
+    if new_status == "cancelled" and order["status"] != "cancelled":
+        changes["revenue"] = -order["totalAmount"]
+        changes[f"revenueByDay.{day_key(order['createdAt'])}"] = -order["totalAmount"]
+        changes["unitsSold"] = -order_units(order)
+    return (order["supplierId"], changes) if changes else None
+
+
+def products_created_updates(products: Iterable[Dict[str, Any]], low_stock_threshold: int) -> List[StatsChange]:
+    counts: Dict[str, Dict[str, int]] = {}
+    for product in products:
+        count = counts.setdefault(product["supplierId"], {"products.total": 0, "products.lowStock": 0})
+        count["products.total"] += 1
+        count["products.lowStock"] += product["stock"] <= low_stock_threshold
+    return list(counts.items())
+
+
+def low_stock_delta(stock_after: int, change: int, low_stock_threshold: int) -> int:
+    """+1 when a stock change crossed down into low stock, -1 when it climbed out."""
+    stock_before = stock_after - change
+    return (stock_after <= low_stock_threshold) - (stock_before <= low_stock_threshold)
+
+
+def empty_stats(supplier_id: str) -> Dict[str, Any]:
+    return {"_id": supplier_id, "orders": {"total": 0}, "revenue": 0.0, "revenueByDay": {},
+            "unitsSold": 0, "products": {"total": 0, "lowStock": 0}}
+
+
+async def rebuild_supplier_stats(db, low_stock_threshold: int) -> Dict[str, Dict[str, Any]]:
+    """Counters for every supplier, recomputed from the orders and products collections."""
+    stats: Dict[str, Dict[str, Any]] = {}
+
+    def supplier(supplier_id: str) -> Dict[str, Any]:
+        return stats.setdefault(supplier_id, empty_stats(supplier_id))
+
+    async for row in db.orders.aggregate([
+        {"$group": {"_id": {"supplierId": "$supplierId", "status": "$status"}, "orders": {"$sum": 1},
+                    "revenue": {"$sum": "$totalAmount"}, "units": {"$sum": {"$sum": "$items.quantity"}}}},
+    ], allowDiskUse=True):
+        entry = supplier(row["_id"]["supplierId"])
+        key = status_key(row["_id"]["status"])
+        entry["orders"]["total"] += row["orders"]
+        entry["orders"][key] = entry["orders"].get(key, 0) + row["orders"]
+        if row["_id"]["status"] != "cancelled":
+            entry["revenue"] += row["revenue"]
+            entry["unitsSold"] += row["units"]
+
+    async for row in db.orders.aggregate([
+        {"$match": {"status": {"$ne": "cancelled"}}},
+        {"$group": {"_id": {"supplierId": "$supplierId",
+                            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}}},
+                    "revenue": {"$sum": "$totalAmount"}}},
+    ], allowDiskUse=True):
+        supplier(row["_id"]["supplierId"])["revenueByDay"][row["_id"]["day"]] = row["revenue"]
+
+    async for row in db.products.aggregate([
+        {"$group": {"_id": "$supplierId", "total": {"$sum": 1},
+                    "lowStock": {"$sum": {"$cond": [{"$lte": ["$stock", low_stock_threshold]}, 1, 0]}}}},
+    ]):
+        supplier(row["_id"])["products"] = {"total": row["total"], "lowStock": row["lowStock"]}
+
+    return stats
+
+
+def build_supplier_stats(orders: Iterable[Dict[str, Any]], products: Iterable[Dict[str, Any]],
+                         low_stock_threshold: int) -> Dict[str, Dict[str, Any]]:
+    """rebuild_supplier_stats over documents already in memory."""
+    stats: Dict[str, Dict[str, Any]] = {}
+    for order in orders:
+        entry = stats.setdefault(order["supplierId"], empty_stats(order["supplierId"]))
+        key = status_key(order["status"])
+        entry["orders"]["total"] += 1
+        entry["orders"][key] = entry["orders"].get(key, 0) + 1
+        if order["status"] != "cancelled":
+            day = day_key(order["createdAt"])
+            entry["revenue"] += order["totalAmount"]
+            entry["revenueByDay"][day] = entry["revenueByDay"].get(day, 0.0) + order["totalAmount"]
+            entry["unitsSold"] += order_units(order)
+    for product in products:
+        entry = stats.setdefault(product["supplierId"], empty_stats(product["supplierId"]))
+        entry["products"]["total"] += 1
+        entry["products"]["lowStock"] += product["stock"] <= low_stock_threshold
+    return stats
+
+
+def stats_drift(expected: Dict[str, Any], actual: Dict[str, Any], prefix: str = "") -> List[str]:
+    """Dotted paths whose stored value differs from the recomputed one (missing counts as zero)."""
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        if key in ("_id", "updatedAt"):
+            continue
+        want, have = expected.get(key), actual.get(key)
+        if isinstance(want, dict) or isinstance(have, dict):
+            drift.extend(stats_drift(want or {}, have or {}, f"{prefix}{key}."))
+        elif abs((want or 0) - (have or 0)) > REVENUE_TOLERANCE:
+            drift.append(f"{prefix}{key}: stored {have or 0}, actual {want or 0}")
+    return drift
+
+
+def supplier_drift(expected: Dict[str, Dict[str, Any]], stored: Iterable[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Drift per supplier between rebuilt counters and the stored documents."""
+    drift: Dict[str, List[str]] = {}
+    stored_ids = set()
+    for document in stored:
+        stored_ids.add(document["_id"])
+        problems = stats_drift(expected.get(document["_id"], {}), document)
+        if problems:
+            drift[document["_id"]] = problems
+    for supplier_id in expected.keys() - stored_ids:
+        drift[supplier_id] = ["missing"]
+    return drift
+
+
+async def reconcile_supplier_stats(db, low_stock_threshold: int, fix: bool = False) -> Dict[str, List[str]]:
+    """Compare stored counters with rebuilt ones; with `fix`, overwrite every drifted supplier.
+
+    Writes that land between the rebuild and the comparison show up as drift,
+    so a fix is best run when order traffic is low.
+    """
+    expected = await rebuild_supplier_stats(db, low_stock_threshold)
+    drift = supplier_drift(expected, await db.supplier_stats.find({}).to_list(None))
+    if fix and drift:
+        now = datetime.utcnow()
+        await db.supplier_stats.bulk_write([
+            ReplaceOne({"_id": supplier_id}, {**expected.get(supplier_id, {"_id": supplier_id}), "updatedAt": now},
+                       upsert=True)
+            for supplier_id in drift
+        ], ordered=False)
+    return drift
+
+
+async def main(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    try:
+        threshold = int(os.environ.get("LOW_STOCK_THRESHOLD", "10"))
+        drift = await reconcile_supplier_stats(db, threshold, fix=args.fix)
+        for supplier_id, problems in drift.items():
+            for problem in problems:
+                print(f"{'fixed' if args.fix else 'drift':<8} {supplier_id} {problem}")
+        return 1 if drift and not args.fix else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile StreetBazaar supplier counters")
+    parser.add_argument("--fix", action="store_true", help="rewrite counters that drifted")
+    sys.exit(asyncio.run(main(parser.parse_args())))
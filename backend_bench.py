@@ -0,0 +1,800 @@
+#!/usr/bin/env python3
+"""
+StreetBazaar Backend Benchmarks
+Drives the FastAPI app in-process and reports latency of backend hot paths
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Benchmarks run against a local MongoDB unless MONGO_URL says otherwise, or
+# entirely in process with STORAGE_ENGINE=memory
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "streetbazaar_bench")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+DEMO_VENDOR = {"email": "rajesh.dosa@gmail.com", "password": "demo123"}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(name, latencies, elapsed):
+    """Print throughput and latency percentiles in milliseconds"""
+    ms = [value * 1000 for value in latencies]
+    print(f"{name:<36} n={len(ms):<7} rps={len(ms) / elapsed:>9.1f} "
+          f"p50={percentile(ms, 50):>8.2f}ms p95={percentile(ms, 95):>8.2f}ms p99={percentile(ms, 99):>8.2f}ms")
+
+
+def app_client():
+    """httpx client bound to the in-process ASGI app"""
+    import httpx
+    import server
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    transport = httpx.ASGITransport(app=server.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+
+async def bench_login_contention(args):
+    """p99 of GET /api/products while concurrent logins saturate bcrypt"""
+    import server
+    await server.init_sample_data()
+    stop_at = time.perf_counter() + args.duration
+    login_latencies, browse_latencies = [], []
+
+    async with app_client() as client:
+        async def login_loop():
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                await client.post("/api/auth/login", json=DEMO_VENDOR)
+                login_latencies.append(time.perf_counter() - started)
+
+        async def browse_loop():
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                await client.get("/api/products")
+                browse_latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[login_loop() for _ in range(args.concurrency)], browse_loop())
+        elapsed = time.perf_counter() - started
+
+    print(f"hashing pool: {server.hashing_pool.stats()}")
+    report("POST /api/auth/login", login_latencies, elapsed)
+    report("GET /api/products", browse_latencies, elapsed)
+
+
+CATEGORIES = ["grains", "oils", "vegetables", "spices", "dairy", "pulses", "fruits", "snacks"]
+ITEM_WORDS = ["rice", "basmati", "wheat", "flour", "atta", "sunflower", "mustard", "groundnut", "onion",
+              "tomato", "potato", "chilli", "turmeric", "cumin", "coriander", "ghee", "paneer", "butter",
+              "moong", "toor", "chana", "masoor", "mango", "banana", "namkeen", "papad", "jaggery", "sugar"]
+QUALIFIERS = ["premium", "fresh", "organic", "refined", "pure", "whole", "roasted", "cold-pressed",
+              "local", "export", "grade", "bulk", "red", "green", "yellow", "desi"]
+ORIGINS = ["Punjab", "Rajasthan", "Maharashtra", "Gujarat", "Kerala", "Delhi", "Bihar", "Karnataka"]
+
+
+def synthetic_products(count, seed=42, suppliers=50):
+    """Deterministic catalog with realistic-looking names and descriptions"""
+    rng = random.Random(seed)
+    supplier_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(suppliers)]
+    started_at = datetime(2025, 1, 1)
+    for position in range(count):
+        words = rng.sample(QUALIFIERS, 2) + rng.sample(ITEM_WORDS, 2)
+        supplier_index = rng.randrange(suppliers)
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": " ".join(words).title(),
+            "category": rng.choice(CATEGORIES),
+            "description": f"{rng.choice(QUALIFIERS)} {rng.choice(ITEM_WORDS)} sourced from {rng.choice(ORIGINS)} farms",
+            "price": round(rng.uniform(10, 800), 2),
+            "unit": rng.choice(["kg", "liter", "packet", "dozen"]),
+            "stock": rng.randint(0, 1000),
+            "minOrderQty": 1,
+            "maxOrderQty": 100,
+            "supplierId": supplier_ids[supplier_index],
+            "supplierName": f"Supplier {supplier_index}",
+            "isAvailable": True,
+            "createdAt": started_at + timedelta(seconds=position),
+            "updatedAt": started_at + timedelta(seconds=position),
+            "changeSeq": position + 1,
+        }
+
+
+def synthetic_orders(count, vendor_id, supplier_id, seed=7):
+    """Orders between one vendor and one supplier, a minute apart"""
+    rng = random.Random(seed)
+    started_at = datetime(2024, 1, 1)
+    for position in range(count):
+        quantity = rng.randint(1, 50)
+        price = round(rng.uniform(10, 800), 2)
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "checkoutId": str(uuid.UUID(int=rng.getrandbits(128))),
+            "orderNumber": f"ORD{position + 1:010d}",
+            "vendorId": vendor_id,
+            "vendorName": "Bench Vendor",
+            "supplierId": supplier_id,
+            "supplierName": "Bench Supplier",
+            "items": [{
+                "productId": str(uuid.UUID(int=rng.getrandbits(128))),
+                "productName": " ".join(rng.sample(ITEM_WORDS, 2)).title(),
+                "quantity": quantity,
+                "unitPrice": price,
+                "totalPrice": round(quantity * price, 2),
+                "supplierId": supplier_id,
+                "supplierName": "Bench Supplier",
+            }],
+            "totalAmount": round(quantity * price, 2),
+            "status": rng.choice(["pending", "confirmed", "delivered"]),
+            "deliveryAddress": "Bench Market, Stall 4",
+            "createdAt": started_at + timedelta(minutes=position),
+            "updatedAt": started_at + timedelta(minutes=position),
+        }
+
+
+def synthetic_suppliers(count, seed=11):
+    """Suppliers scattered within about 15 km of the bundled cities"""
+    from cities import CITY_COORDINATES, geo_point
+    rng = random.Random(seed)
+    cities = sorted(CITY_COORDINATES.items())
+    for position in range(count):
+        city, (lat, lng) = rng.choice(cities)
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "email": f"bench.supplier{position}@example.com",
+            "name": f"Supplier {position}",
+            "phone": "",
+            "userType": "supplier",
+            "businessName": f"{city.title()} Traders {position}",
+            "city": city.title(),
+            "state": "",
+            "location": geo_point(lat + rng.uniform(-0.15, 0.15), lng + rng.uniform(-0.15, 0.15)),
+            "createdAt": datetime(2025, 1, 1),
+        }
+
+
+async def reset_collection(name, documents, batch_size=5000):
+    """Replace a collection's contents through the server's storage engine; refuses to touch non-benchmark databases"""
+    import server
+    if server.db is not None and "bench" not in server.db.name:
+        sys.exit(f"refusing to overwrite {server.db.name}: DB_NAME must be a benchmark database")
+    repo = getattr(server.storage, name)
+    await repo.clear()
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            await repo.insert_many(batch)
+            batch = []
+    if batch:
+        await repo.insert_many(batch)
+
+
+async def bench_search(args):
+    """In-process search index against a regex scan over a synthetic catalog"""
+    from search import ProductSearchIndex
+    products = list(synthetic_products(args.products))
+    queries = ["rice", "bas", "fresh tom", "organic ghee", "cold pressed mustard", "punj", "chilli", "de"]
+
+    index = ProductSearchIndex()
+    started = time.perf_counter()
+    index.bulk_load(products)
+    print(f"indexed {len(index)} products in {time.perf_counter() - started:.2f}s")
+
+    for name, run in (
+        ("index", lambda q: index.search(q, limit=50)),
+        ("regex scan", lambda q: [p for p in products
+                                  if re.search(q, p["name"], re.I) or re.search(q, p["description"], re.I)]),
+    ):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for query in queries:
+                query_started = time.perf_counter()
+                run(query)
+                latencies.append(time.perf_counter() - query_started)
+        report(f"search ({name})", latencies, time.perf_counter() - started)
+
+
+async def bench_catalog_transfer(args):
+    """Bytes on the wire and CPU per catalog request for each negotiated encoding"""
+    await reset_collection("products", synthetic_products(args.products))
+    url = "/api/products?limit=200"
+    variants = [
+        ("identity", {"Accept-Encoding": "identity"}),
+        ("gzip", {"Accept-Encoding": "gzip"}),
+        ("br", {"Accept-Encoding": "br, gzip"}),
+    ]
+
+    async with app_client() as client:
+        async def fetch(headers):
+            received = 0
+            async with client.stream("GET", url, headers=headers) as response:
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+            return response, received
+
+        for name, headers in variants + [("304 revalidate", None)]:
+            if headers is None:
+                response, _ = await fetch({"Accept-Encoding": "gzip"})
+                headers = {"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]}
+            await fetch(headers)  # warm the catalog cache
+            wire_bytes, latencies = 0, []
+            cpu_started, started = time.process_time(), time.perf_counter()
+            for _ in range(args.rounds):
+                request_started = time.perf_counter()
+                response, received = await fetch(headers)
+                latencies.append(time.perf_counter() - request_started)
+                wire_bytes += received
+            cpu_per_request = (time.process_time() - cpu_started) / args.rounds * 1000
+            report(f"GET /api/products ({name})", latencies, time.perf_counter() - started)
+            print(f"{'':<36} status={response.status_code} bytes/request={wire_bytes // args.rounds} "
+                  f"cpu/request={cpu_per_request:.3f}ms")
+
+
+async def bench_catalog_sync(args):
+    """Full catalog refresh against delta sync after a handful of product writes"""
+    import server
+    await reset_collection("products", synthetic_products(args.products))
+    # The synthetic products already carry changeSeq 1..products
+    await server.storage.counters.increment("catalogSeq", args.products)
+    await server.init_sample_data()
+    # Count writes as settled immediately so the delta contains exactly the new products
+    server.CATALOG_CHANGES_SETTLE_SECONDS = 0
+    headers = {"Accept-Encoding": "gzip"}
+
+    async with app_client() as client:
+        async def full_refresh():
+            received, items, cursor = 0, 0, None
+            while True:
+                params = {"limit": server.MAX_PAGE_SIZE, **({"cursor": cursor} if cursor else {})}
+                response = await client.get("/api/products", params=params, headers=headers)
+                received += response.num_bytes_downloaded
+                page = response.json()
+                items += len(page["items"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    return received, items
+
+        async def delta_sync(token):
+            received, items = 0, 0
+            while True:
+                response = await client.get("/api/products/changes", params={"since": token}, headers=headers)
+                received += response.num_bytes_downloaded
+                changes = response.json()
+                items += len(changes["items"]) + len(changes["removed"])
+                token = changes["next_token"]
+                if not changes["has_more"]:
+                    return received, items, token
+
+        response = await client.post("/api/auth/login", json={"email": "delhi.agro@gmail.com", "password": "demo123"})
+        supplier_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        _, _, token = await delta_sync(None)
+
+        for name, run in [("full refresh", full_refresh), ("delta sync (no changes)", lambda: delta_sync(token))]:
+            latencies, started = [], time.perf_counter()
+            for _ in range(args.rounds):
+                request_started = time.perf_counter()
+                received, items, *_ = await run()
+                latencies.append(time.perf_counter() - request_started)
+            report(name, latencies, time.perf_counter() - started)
+            print(f"{'':<36} bytes/sync={received} products/sync={items}")
+
+        for position in range(20):
+            product = {"name": f"Bench Product {position}", "category": "grains", "price": 10.0,
+                       "unit": "kg", "stock": 100}
+            await client.post("/api/products", json=product, headers=supplier_headers)
+        started = time.perf_counter()
+        received, items, _ = await delta_sync(token)
+        report("delta sync (20 new products)", [time.perf_counter() - started], time.perf_counter() - started)
+        print(f"{'':<36} bytes/sync={received} products/sync={items}")
+
+
+IMPORT_COLUMNS = ["name", "category", "description", "price", "unit", "stock", "minOrderQty", "maxOrderQty"]
+
+
+def import_file(kind, count, chunk_size=64 * 1024):
+    """Chunks of a CSV or NDJSON product upload, generated lazily"""
+    import csv
+    import io
+
+    def lines():
+        if kind == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(IMPORT_COLUMNS)
+            yield buffer.getvalue()
+        for product in synthetic_products(count):
+            row = {column: product[column] for column in IMPORT_COLUMNS}
+            if kind == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerow(row.values())
+                yield buffer.getvalue()
+            else:
+                yield json.dumps(row) + "\n"
+
+    async def chunks():
+        pending = []
+        size = 0
+        for line in lines():
+            pending.append(line.encode())
+            size += len(pending[-1])
+            if size >= chunk_size:
+                yield b"".join(pending)
+                pending, size = [], 0
+        if pending:
+            yield b"".join(pending)
+
+    return chunks()
+
+
+async def bench_product_import(args):
+    """Rows/sec of bulk CSV and NDJSON imports against one POST per product"""
+    import server
+    await reset_collection("products", [])
+    await server.init_sample_data()
+
+    async with app_client() as client:
+        response = await client.post("/api/auth/login", json={"email": "delhi.agro@gmail.com", "password": "demo123"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        for kind, content_type in [("csv", "text/csv"), ("ndjson", "application/x-ndjson")]:
+            started = time.perf_counter()
+            response = await client.post("/api/products/import", content=import_file(kind, args.products),
+                                         headers={**headers, "Content-Type": content_type}, timeout=None)
+            elapsed = time.perf_counter() - started
+            result = response.json()
+            print(f"{'import ' + kind:<36} rows={args.products:<7} rows/sec={args.products / elapsed:>9.1f} "
+                  f"imported={result['imported']} failed={result['failed']}")
+
+        count = min(args.products, 1000)
+        started = time.perf_counter()
+        for product in synthetic_products(count):
+            row = {column: product[column] for column in IMPORT_COLUMNS}
+            await client.post("/api/products", json=row, headers=headers)
+        elapsed = time.perf_counter() - started
+        print(f"{'POST /api/products per row':<36} rows={count:<7} rows/sec={count / elapsed:>9.1f}")
+
+
+async def asgi_stream(app, path, query_string, headers):
+    """Body chunks of a GET on the ASGI app, as the app sends them"""
+    chunks = asyncio.Queue()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [(b"host", b"bench")] + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    done = asyncio.Event()
+
+    async def receive():
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            await chunks.put(message.get("body", b""))
+            if not message.get("more_body", False):
+                await chunks.put(None)
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
+    finally:
+        done.set()
+        await task
+
+
+async def bench_order_export(args):
+    """Rows/sec and peak traced memory of streaming a supplier's full order history"""
+    import tracemalloc
+    import server
+    await server.init_sample_data()
+    async with app_client() as client:
+        response = await client.post("/api/auth/login", json={"email": "delhi.agro@gmail.com", "password": "demo123"})
+        supplier = response.json()
+        headers = {"Authorization": f"Bearer {supplier['access_token']}"}
+        await reset_collection("orders", synthetic_orders(args.orders, str(uuid.uuid4()), supplier["user"]["id"]))
+
+        for export_format in ("ndjson", "csv"):
+            tracemalloc.start()
+            started = time.perf_counter()
+            received = lines = 0
+            # httpx's ASGI transport buffers whole bodies, so read the stream directly
+            async for chunk in asgi_stream(server.app, "/api/orders/export", f"format={export_format}", headers):
+                received += len(chunk)
+                lines += chunk.count(b"\n")
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{'export ' + export_format:<36} orders={args.orders:<8} rows/sec={args.orders / elapsed:>9.1f} "
+                  f"lines={lines} MB={received / 1e6:.1f} peak traced={peak / 1e6:.1f}MB")
+
+
+async def bench_supplier_analytics(args):
+    """Supplier dashboard latency: cold aggregation, cached loads and reloads after an order write"""
+    import server
+    await server.init_sample_data()
+    async with app_client() as client:
+        response = await client.post("/api/auth/login", json={"email": "delhi.agro@gmail.com", "password": "demo123"})
+        supplier = response.json()
+        headers = {"Authorization": f"Bearer {supplier['access_token']}"}
+        vendor_ids = [str(uuid.uuid4()) for _ in range(200)]
+        orders = synthetic_orders(args.orders, vendor_ids[0], supplier["user"]["id"])
+        rng = random.Random(11)
+        await reset_collection("orders", ({**order, "vendorId": rng.choice(vendor_ids)} for order in orders))
+        await server.storage.prepare()
+
+        async def load():
+            started = time.perf_counter()
+            response = await client.get("/api/analytics/supplier", headers=headers)
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        cold = [await load()]
+        report(f"analytics cold ({args.orders} orders)", cold, time.perf_counter() - started)
+
+        warm, started = [], time.perf_counter()
+        while time.perf_counter() - started < args.duration:
+            warm.append(await load())
+        report("analytics cached", warm, time.perf_counter() - started)
+
+        async for order in server.storage.orders.export({"supplierId": supplier["user"]["id"]}, None, None,
+                                                        {"_id": 0, "id": 1, "status": 1}, 1000):
+            if order["status"] == "pending":
+                break
+        started = time.perf_counter()
+        await client.put(f"/api/orders/{order['id']}/status", params={"status": "confirmed"}, headers=headers)
+        reload = [await load()]
+        report("analytics after status change", reload, time.perf_counter() - started)
+
+
+async def bench_supplier_summary(args):
+    """Dashboard counters from supplier_stats against counting orders and products on each load"""
+    import server
+    await server.init_sample_data()
+    async with app_client() as client:
+        response = await client.post("/api/auth/login", json={"email": "delhi.agro@gmail.com", "password": "demo123"})
+        supplier = response.json()
+        supplier_id = supplier["user"]["id"]
+        headers = {"Authorization": f"Bearer {supplier['access_token']}"}
+        await reset_collection("orders", synthetic_orders(args.orders, str(uuid.uuid4()), supplier_id))
+        await server.storage.supplier_stats.clear()
+        started = time.perf_counter()
+        await server.storage.supplier_stats.reconcile(server.LOW_STOCK_THRESHOLD, fix=True)
+        print(f"{'rebuild supplier_stats':<36} orders={args.orders} seconds={time.perf_counter() - started:.2f}")
+
+        async def summary():
+            response = await client.get("/api/analytics/supplier/summary", headers=headers)
+            response.raise_for_status()
+
+        async def scans():
+            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            await asyncio.gather(
+                server.db.orders.count_documents({"supplierId": supplier_id, "status": "pending"}),
+                server.db.orders.aggregate([
+                    {"$match": {"supplierId": supplier_id, "createdAt": {"$gte": today}, "status": {"$ne": "cancelled"}}},
+                    {"$group": {"_id": None, "revenue": {"$sum": "$totalAmount"}}},
+                ]).to_list(1),
+                server.db.products.count_documents({"supplierId": supplier_id, "stock": {"$lte": server.LOW_STOCK_THRESHOLD}}),
+            )
+
+        loads = [("summary from supplier_stats", summary)]
+        # The scans are MongoDB queries; the memory engine has no equivalent
+        if server.storage.engine == "mongo":
+            loads.append(("same counters by scanning", scans))
+        for name, load in loads:
+            latencies, started = [], time.perf_counter()
+            while time.perf_counter() - started < args.duration:
+                request_started = time.perf_counter()
+                await load()
+                latencies.append(time.perf_counter() - request_started)
+            report(name, latencies, time.perf_counter() - started)
+
+
+async def bench_geo_nearby(args):
+    """Nearby-supplier latency, first page and a cursor page, as the supplier count grows"""
+    import server
+    await server.init_sample_data()
+    async with app_client() as client:
+        response = await client.post("/api/auth/login", json=DEMO_VENDOR)
+        vendor = response.json()
+        headers = {"Authorization": f"Bearer {vendor['access_token']}"}
+        vendor_doc = await server.storage.users.get_by_email(DEMO_VENDOR["email"])
+        params = {"near": "28.6139,77.2090", "radius": 25, "limit": 50}
+
+        for scale in sorted({args.suppliers // 10, args.suppliers // 2, args.suppliers}):
+            await reset_collection("users", [vendor_doc, *synthetic_suppliers(scale)])
+            response = await client.get("/api/suppliers/nearby", params=params, headers=headers)
+            response.raise_for_status()
+            cursor = response.json()["next_cursor"]
+
+            for name, page in [("first page", params), ("cursor page", {**params, "cursor": cursor})]:
+                latencies, started = [], time.perf_counter()
+                while time.perf_counter() - started < args.duration:
+                    request_started = time.perf_counter()
+                    response = await client.get("/api/suppliers/nearby", params=page, headers=headers)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - request_started)
+                report(f"nearby {name} suppliers={scale}", latencies, time.perf_counter() - started)
+
+
+async def bench_metrics_overhead(args):
+    """Request latency with metrics recording on and off, plus the cost of each recording"""
+    import server
+    from metrics import CommandMetrics, Metrics
+    from types import SimpleNamespace
+    await server.init_sample_data()
+
+    async def request(path, query_string=""):
+        async for _ in asgi_stream(server.app, path, query_string, {}):
+            pass
+
+    requests_per_round = 2000
+    for path, query_string in [("/api/", ""), ("/api/products", "limit=50")]:
+        per_request = {False: [], True: []}
+        # Rounds alternate so drift in machine load hits both sides alike; the
+        # first pair only warms up, and each side keeps its fastest round
+        for _ in range(args.rounds + 1):
+            for enabled in (False, True):
+                server.metrics.enabled = enabled
+                started = time.perf_counter()
+                for _ in range(requests_per_round):
+                    await request(path, query_string)
+                per_request[enabled].append((time.perf_counter() - started) / requests_per_round)
+        off, on = min(per_request[False][1:]), min(per_request[True][1:])
+        print(f"{path + ('?' + query_string if query_string else ''):<28} off={off * 1e6:8.1f}us "
+              f"on={on * 1e6:8.1f}us overhead={(on - off) / off * 100:+.2f}%")
+    server.metrics.enabled = True
+
+    metrics = Metrics()
+    iterations = 200000
+    started = time.perf_counter()
+    for position in range(iterations):
+        metrics.observe_request("GET", "/api/products", 200, position * 1e-7)
+    print(f"{'observe_request':<28} {(time.perf_counter() - started) / iterations * 1e9:8.0f}ns")
+
+    listener = CommandMetrics(metrics)
+    event = SimpleNamespace(command={"find": "products"}, command_name="find", connection_id=("localhost", 27017),
+                            request_id=1, duration_micros=350)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        listener.started(event)
+        listener.succeeded(event)
+    print(f"{'command started + succeeded':<28} {(time.perf_counter() - started) / iterations * 1e9:8.0f}ns")
+
+
+async def bench_serialization(args):
+    """Per-item cost of encoding product pages: validated models against direct projection"""
+    import server
+    from pydantic import TypeAdapter
+    adapter = TypeAdapter(server.ProductPage)
+
+    def validated(docs):
+        # What FastAPI does for a response_model: build, re-validate, encode
+        page = server.ProductPage(items=[server.Product(**doc) for doc in docs])
+        content = adapter.dump_python(adapter.validate_python(page), mode="json")
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    paths = [
+        ("pydantic + re-validation", validated),
+        ("model_dump_json", lambda docs: server.ProductPage(
+            items=[server.Product(**doc) for doc in docs]).model_dump_json().encode("utf-8")),
+        ("wire projection + orjson", lambda docs: server.encode_page(server.PRODUCT_WIRE, docs, None)),
+    ]
+    for size in (1000, 10000):
+        docs = list(synthetic_products(size))
+        for name, encode in paths:
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                encode(docs)
+            per_item = (time.perf_counter() - started) / (args.rounds * size) * 1e6
+            print(f"{size:>6} products  {name:<28} {per_item:>7.2f}us/item")
+
+
+def cart_line(product, quantity=1):
+    return {
+        "productId": product["id"],
+        "productName": product["name"],
+        "quantity": quantity,
+        "unitPrice": product["price"],
+        "totalPrice": product["price"] * quantity,
+        "supplierId": product["supplierId"],
+        "supplierName": product["supplierName"],
+    }
+
+
+async def vendor_headers(client):
+    response = await client.post("/api/auth/login", json=DEMO_VENDOR)
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def bench_cart_pricing(args):
+    """create_order latency for 1-item and 50-item carts priced server-side"""
+    import server
+    await server.init_sample_data()
+    products = list(synthetic_products(max(args.products, 50)))
+    for product in products:
+        product["stock"] = 10 ** 9
+    await reset_collection("products", products)
+    await reset_collection("orders", [])
+
+    async with app_client() as client:
+        headers = await vendor_headers(client)
+        for cart_size in (1, 50):
+            latencies = []
+            started = time.perf_counter()
+            for round_number in range(args.rounds):
+                offset = (round_number * cart_size) % (len(products) - cart_size + 1)
+                cart = [cart_line(product) for product in products[offset:offset + cart_size]]
+                request_started = time.perf_counter()
+                response = await client.post("/api/orders", json={"items": cart}, headers=headers)
+                latencies.append(time.perf_counter() - request_started)
+                if response.status_code != 200:
+                    sys.exit(f"order failed: {response.status_code} {response.text}")
+            report(f"POST /api/orders ({cart_size} items)", latencies, time.perf_counter() - started)
+
+
+async def bench_checkout_split(args):
+    """Checkout throughput for carts spanning 1 to 20 suppliers"""
+    import server
+    await server.init_sample_data()
+    products = list(synthetic_products(max(args.products, 1000), suppliers=20))
+    for product in products:
+        product["stock"] = 10 ** 9
+    await reset_collection("products", products)
+    await reset_collection("orders", [])
+    by_supplier = {}
+    for product in products:
+        by_supplier.setdefault(product["supplierId"], []).append(product)
+    suppliers = list(by_supplier.values())
+
+    async with app_client() as client:
+        headers = await vendor_headers(client)
+        for supplier_count in (1, 2, 5, 10, 20):
+            latencies = []
+            started = time.perf_counter()
+            for round_number in range(args.rounds):
+                # Two lines per supplier, rotating through each supplier's products
+                cart = []
+                for supplier_products in suppliers[:supplier_count]:
+                    offset = (round_number * 2) % (len(supplier_products) - 1)
+                    cart.extend(cart_line(product) for product in supplier_products[offset:offset + 2])
+                request_started = time.perf_counter()
+                response = await client.post("/api/orders", json={"items": cart}, headers=headers)
+                latencies.append(time.perf_counter() - request_started)
+                if response.status_code != 200 or len(response.json()["orders"]) != supplier_count:
+                    sys.exit(f"checkout failed: {response.status_code} {response.text}")
+            report(f"checkout ({supplier_count} suppliers)", latencies, time.perf_counter() - started)
+
+
+class StreamClient:
+    """Minimal ASGI client holding one SSE connection open on the in-process app"""
+
+    def __init__(self, app, path, token):
+        self.scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": f"token={token}".encode(), "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        }
+        self.app = app
+        self.status = None
+        self.events = 0
+        self.received = asyncio.Event()
+        self._disconnect = asyncio.Event()
+        self.task = None
+
+    async def _receive(self):
+        await self._disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body", b"").startswith(b"event:"):
+            self.events += 1
+            self.received.set()
+
+    def open(self):
+        self.task = asyncio.create_task(self.app(self.scope, self._receive, self._send))
+
+    async def close(self):
+        self._disconnect.set()
+        await asyncio.wait([self.task], timeout=5)
+
+
+def rss_kb():
+    """Resident set size of this process in kB (Linux)"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def bench_stream_connections(args):
+    """Idle SSE connections one worker can hold, memory per connection and fan-out latency"""
+    import server
+    await server.init_sample_data()
+    async with app_client() as client:
+        response = await client.post("/api/auth/login", json=DEMO_VENDOR)
+        token = response.json()["access_token"]
+        vendor_id = response.json()["user"]["id"]
+
+    connections = []
+    baseline = rss_kb()
+    for target in (1000, 2000, 5000, args.connections):
+        if target <= len(connections):
+            continue
+        while len(connections) < target:
+            connection = StreamClient(server.app, "/api/orders/stream", token)
+            connection.open()
+            connections.append(connection)
+        while server.order_events.connections < target:
+            await asyncio.sleep(0.01)
+            if any(c.status not in (None, 200) for c in connections):
+                sys.exit(f"stream refused at {server.order_events.connections} connections")
+
+        for connection in connections:
+            connection.received.clear()
+        started = time.perf_counter()
+        server.order_events.publish({"type": "order.updated", "vendorId": vendor_id, "status": "confirmed"})
+        await asyncio.gather(*(connection.received.wait() for connection in connections))
+        fan_out = (time.perf_counter() - started) * 1000
+        per_connection = (rss_kb() - baseline) / len(connections)
+        print(f"{len(connections):>6} open streams  rss/connection={per_connection:>6.1f}kB  "
+              f"fan-out to all={fan_out:>8.2f}ms")
+
+    await asyncio.gather(*(connection.close() for connection in connections))
+    print(f"order streams after close: {server.order_events.stats()}")
+
+
+BENCHMARKS = {
+    "login-contention": bench_login_contention,
+    "search": bench_search,
+    "catalog-transfer": bench_catalog_transfer,
+    "serialization": bench_serialization,
+    "cart-pricing": bench_cart_pricing,
+    "checkout-split": bench_checkout_split,
+    "stream-connections": bench_stream_connections,
+    "catalog-sync": bench_catalog_sync,
+    "product-import": bench_product_import,
+    "order-export": bench_order_export,
+    "supplier-analytics": bench_supplier_analytics,
+    "supplier-summary": bench_supplier_summary,
+    "geo-nearby": bench_geo_nearby,
+    "metrics-overhead": bench_metrics_overhead,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run load for")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent load generators")
+    parser.add_argument("--products", type=int, default=100000, help="synthetic catalog size")
+    parser.add_argument("--rounds", type=int, default=5, help="repetitions of each query set")
+    parser.add_argument("--orders", type=int, default=1000000, help="synthetic order history size")
+    parser.add_argument("--connections", type=int, default=10000, help="open streams to reach")
+    parser.add_argument("--suppliers", type=int, default=100000, help="synthetic suppliers for geo queries")
+    args = parser.parse_args()
+    asyncio.run(BENCHMARKS[args.benchmark](args))
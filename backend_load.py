@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+StreetBazaar Load Test
+Replays a weighted mix of vendor scenarios concurrently against the API and
+reports throughput and latency percentiles per endpoint.
+
+By default server.app runs in-process on mongomock-motor, so no server or
+database is needed; --mongo memory runs it on the in-memory storage engine,
+--mongo local uses the MongoDB at MONGO_URL instead and --url drives an
+already running server. Results can be saved as a JSON
+baseline and compared with a later run:
+
+    python backend_load.py --save baseline.json
+    python backend_load.py --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from backend_bench import DEMO_VENDOR, cart_line, percentile, reset_collection, synthetic_products
+
+SEARCH_TERMS = ["rice", "oil", "organic", "fresh", "masala", "dal", "flour", "premium"]
+DEFAULT_MIX = "browse=40,search=20,poll-orders=20,create-order=15,login=5"
+# Enough stock that the mix never runs a product out during a run
+LOAD_STOCK = 10 ** 9
+# Latency changes smaller than this are timer noise, whatever the percentage
+NOISE_FLOOR_MS = 1.0
+
+
+class LoadRecorder:
+    """Latency and status of every request, grouped by endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # Requests that start before this perf_counter() time are warmup
+        self.measure_from = float("inf")
+
+    async def call(self, client, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        if started >= self.measure_from:
+            self.latencies[endpoint].append(elapsed)
+            if response.status_code >= 400:
+                self.errors[endpoint] += 1
+        return response
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            }
+        return endpoints
+
+
+class VirtualVendor:
+    """One vendor session: a token, the catalog pages it has seen and its orders"""
+
+    def __init__(self, client, recorder, credentials, rng):
+        self.client = client
+        self.recorder = recorder
+        self.credentials = credentials
+        self.rng = rng
+        self.headers = {}
+        self.products = []
+        self.orders_cursor = None
+
+    async def login(self):
+        response = await self.recorder.call(self.client, "POST /api/auth/login", "POST", "/api/auth/login",
+                                            json=self.credentials)
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def browse(self):
+        params = {"limit": 50}
+        if self.rng.random() < 0.5:
+            response = await self.recorder.call(self.client, "GET /api/products/categories", "GET",
+                                                "/api/products/categories")
+            categories = response.json()["categories"] if response.status_code == 200 else []
+            if categories:
+                params["category"] = self.rng.choice(categories)
+        response = await self.recorder.call(self.client, "GET /api/products", "GET", "/api/products", params=params)
+        if response.status_code != 200:
+            return
+        page = response.json()
+        if page["items"]:
+            self.products = page["items"]
+            product = self.rng.choice(page["items"])
+            await self.recorder.call(self.client, "GET /api/products/{product_id}", "GET",
+                                     f"/api/products/{product['id']}")
+        if page["next_cursor"] and self.rng.random() < 0.3:
+            await self.recorder.call(self.client, "GET /api/products", "GET", "/api/products",
+                                     params={**params, "cursor": page["next_cursor"]})
+
+    async def search(self):
+        await self.recorder.call(self.client, "GET /api/products?search", "GET", "/api/products",
+                                 params={"search": self.rng.choice(SEARCH_TERMS), "limit": 20})
+
+    async def create_order(self):
+        if not self.products:
+            await self.browse()
+        if not self.products:
+            return
+        items = [cart_line(product, product["minOrderQty"])
+                 for product in self.rng.sample(self.products, min(len(self.products), self.rng.randint(1, 3)))]
+        await self.recorder.call(self.client, "POST /api/orders", "POST", "/api/orders",
+                                 json={"items": items}, headers=self.headers)
+
+    async def poll_orders(self):
+        params = {"limit": 20}
+        if self.orders_cursor and self.rng.random() < 0.3:
+            params["cursor"] = self.orders_cursor
+        response = await self.recorder.call(self.client, "GET /api/orders", "GET", "/api/orders",
+                                            params=params, headers=self.headers)
+        if response.status_code == 200:
+            self.orders_cursor = response.json()["next_cursor"]
+
+
+SCENARIOS = {
+    "login": VirtualVendor.login,
+    "browse": VirtualVendor.browse,
+    "search": VirtualVendor.search,
+    "create-order": VirtualVendor.create_order,
+    "poll-orders": VirtualVendor.poll_orders,
+}
+
+
+def parse_mix(mix):
+    """"browse=40,search=20" -> ([scenario names], [weights])"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            sys.exit(f"unknown scenario {name.strip()!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name.strip()] = float(weight or 1)
+    return list(weights), list(weights.values())
+
+
+async def prepare_in_process(args):
+    """Start server.app on the chosen database, seeded with a synthetic catalog"""
+    if args.mongo == "memory":
+        os.environ["STORAGE_ENGINE"] = "memory"
+    import server
+    if args.mongo == "mock":
+        from mongomock_motor import AsyncMongoMockClient
+        from mongo_storage import MongoStorage
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[os.environ["DB_NAME"]]
+        server.storage = MongoStorage(server.client, server.db)
+        server.order_numbers.counters = server.storage.counters
+    await server.startup_event()
+    if args.products:
+        products = []
+        for product in synthetic_products(args.products):
+            product["stock"] = LOAD_STOCK
+            products.append(product)
+        await reset_collection("products", products)
+        await server.rebuild_search_index()
+        await server.catalog_changed()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Print per-endpoint changes; returns the endpoints that regressed past `threshold` percent"""
+    regressions = []
+    print(f"\n{'endpoint':<34} {'rps':>16} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+    for endpoint, now in current["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if before is None:
+            print(f"{endpoint:<34} (not in baseline)")
+            continue
+        cells, regressed = [], False
+        for metric, higher_is_worse in [("rps", False), ("p50_ms", True), ("p95_ms", True), ("p99_ms", True)]:
+            change = (now[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+            if higher_is_worse:
+                worse = change > threshold and now[metric] - before[metric] > NOISE_FLOOR_MS
+            else:
+                worse = change < -threshold
+            regressed |= worse
+            cells.append(f"{now[metric]:>9.2f} {change:+6.1f}%{'!' if worse else ' '}")
+        print(f"{endpoint:<34} {' '.join(cells)}")
+        if regressed:
+            regressions.append(endpoint)
+    return regressions
+
+
+async def run(args):
+    import httpx
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    scenarios, weights = parse_mix(args.mix)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        await prepare_in_process(args)
+        import server
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://load", timeout=30)
+
+    recorder = LoadRecorder()
+    rng = random.Random(args.seed)
+    credentials = [DEMO_VENDOR, {"email": "sunita.chaat@gmail.com", "password": "demo123"},
+                   {"email": "vikram.paratha@gmail.com", "password": "demo123"}]
+    vendors = [VirtualVendor(client, recorder, credentials[position % len(credentials)],
+                             random.Random(rng.getrandbits(32)))
+               for position in range(args.concurrency)]
+    async with client:
+        await asyncio.gather(*(vendor.login() for vendor in vendors))
+        # The window is fixed up front rather than by a timer task, which a
+        # saturated event loop would wake late
+        recorder.measure_from = time.perf_counter() + args.warmup
+        stop_at = recorder.measure_from + args.duration
+
+        async def drive(vendor):
+            while time.perf_counter() < stop_at:
+                scenario = vendor.rng.choices(scenarios, weights)[0]
+                await SCENARIOS[scenario](vendor)
+
+        await asyncio.gather(*(drive(vendor) for vendor in vendors))
+        elapsed = time.perf_counter() - recorder.measure_from
+
+    if not args.url:
+        import server
+        await server.shutdown_event()
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "target": args.url or f"in-process ({args.mongo})",
+            "python": platform.python_version(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        },
+        "endpoints": recorder.summary(elapsed),
+    }
+    total = sum(endpoint["requests"] for endpoint in result["endpoints"].values())
+    print(f"{'endpoint':<34} {'requests':>9} {'errors':>7} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"{endpoint:<34} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>9.1f} "
+              f"{stats['p50_ms']:>7.2f}ms {stats['p95_ms']:>7.2f}ms {stats['p99_ms']:>7.2f}ms")
+    print(f"{'total':<34} {total:>9} {'':>7} {total / elapsed:>9.1f}")
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(result, baseline_file, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\nCompared with {args.compare} ({baseline['meta'].get('commit')}, {baseline['meta']['date']})")
+        regressions = compare(baseline, result, args.threshold)
+        if regressions:
+            print(f"\nRegressed by more than {args.threshold}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive a running server (e.g. http://localhost:8001) instead of server.app")
+    parser.add_argument("--mongo", choices=["mock", "memory", "local"], default="mock",
+                        help="in-process database: mongomock-motor, the in-memory storage engine, "
+                             "or the MongoDB at MONGO_URL")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to measure for")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent virtual vendors")
+    parser.add_argument("--products", type=int, default=5000, help="synthetic catalog size (in-process only)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the scenario sequence")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="compare with a saved baseline; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -6,11 +6,20 @@ Tests all backend endpoints comprehensively
 
 import requests
 import json
+import os
 import sys
+import asyncio
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 
-# Configuration
-BASE_URL = "https://0cede680-dc33-4764-a457-9c0b2c5dd951.preview.emergentagent.com/api"
+# Database checks import helpers from the backend package
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+# Configuration; BASE_URL=http://localhost:8001/api checks a local server
+BASE_URL = os.environ.get("BASE_URL", "https://0cede680-dc33-4764-a457-9c0b2c5dd951.preview.emergentagent.com/api")
 
 # Demo credentials
 DEMO_VENDOR = {"email": "rajesh.dosa@gmail.com", "password": "demo123"}
@@ -54,6 +63,26 @@ class StreetBazaarTester:
             self.log_test("API Health Check", False, f"Failed to connect to API: {str(e)}")
             return False
     
+    def test_metrics_endpoint(self):
+        """Test that /metrics reports product page requests by route template"""
+        try:
+            requests.get(f"{BASE_URL}/products", timeout=10)
+            # Served beside /api, at the path Prometheus scrapes by default
+            response = requests.get(f"{BASE_URL.rsplit('/api', 1)[0]}/metrics", timeout=10)
+            if response.status_code != 200:
+                self.log_test("Metrics Endpoint", False, f"Metrics returned status {response.status_code}")
+                return False
+            series = 'http_request_duration_seconds_count{method="GET",route="/api/products"}'
+            if series in response.text and "# TYPE http_requests_total counter" in response.text:
+                self.log_test("Metrics Endpoint", True, "Product page latency is exported")
+                return True
+            else:
+                self.log_test("Metrics Endpoint", False, "Product page latency series missing")
+                return False
+        except Exception as e:
+            self.log_test("Metrics Endpoint", False, f"Metrics request failed: {str(e)}")
+            return False
+    
     def test_vendor_login(self):
         """Test vendor login with demo credentials"""
         try:
@@ -139,12 +168,41 @@ class StreetBazaarTester:
             self.log_test("Invalid Token Handling", False, f"Invalid token test failed: {str(e)}")
             return False
     
+    def test_concurrent_registration(self):
+        """Test that parallel sign-ups with one email create a single account"""
+        attempts = 8
+        try:
+            user = {
+                "email": f"race-{datetime.now().strftime('%Y%m%d%H%M%S%f')}@example.com",
+                "password": "demo123",
+                "name": "Race Test",
+                "phone": "9000000000",
+                "userType": "vendor",
+            }
+            
+            def register(_):
+                return requests.post(f"{BASE_URL}/auth/register", json=user, timeout=30).status_code
+            
+            with ThreadPoolExecutor(max_workers=attempts) as pool:
+                statuses = list(pool.map(register, range(attempts)))
+            
+            if statuses.count(200) == 1 and statuses.count(400) == attempts - 1:
+                self.log_test("Concurrent Registration", True, f"1 of {attempts} sign-ups accepted, the rest got 400")
+                return True
+            else:
+                self.log_test("Concurrent Registration", False, "Expected one 200 and the rest 400",
+                              {code: statuses.count(code) for code in set(statuses)})
+                return False
+        except Exception as e:
+            self.log_test("Concurrent Registration", False, f"Registration race failed: {str(e)}")
+            return False
+    
     def test_get_products(self):
         """Test getting all products"""
         try:
             response = requests.get(f"{BASE_URL}/products", timeout=10)
             if response.status_code == 200:
-                products = response.json()
+                products = response.json().get("items")
                 if isinstance(products, list) and len(products) > 0:
                     self.log_test("Get Products", True, f"Retrieved {len(products)} products")
                     return products
@@ -158,6 +216,35 @@ class StreetBazaarTester:
             self.log_test("Get Products", False, f"Get products request failed: {str(e)}")
             return []
     
+    def test_product_pagination(self):
+        """Test walking the product catalog page by page with cursors"""
+        try:
+            seen_ids = []
+            params = {"limit": 3}
+            while True:
+                response = requests.get(f"{BASE_URL}/products", params=params, timeout=10)
+                if response.status_code != 200:
+                    self.log_test("Product Pagination", False, f"Page request failed with status {response.status_code}")
+                    return False
+                page = response.json()
+                if len(page["items"]) > 3:
+                    self.log_test("Product Pagination", False, f"Page exceeded limit: {len(page['items'])} items")
+                    return False
+                seen_ids.extend(product["id"] for product in page["items"])
+                if not page.get("next_cursor"):
+                    break
+                params = {"limit": 3, "cursor": page["next_cursor"]}
+            
+            if len(seen_ids) == len(set(seen_ids)) and len(seen_ids) > 3:
+                self.log_test("Product Pagination", True, f"Walked {len(seen_ids)} products without duplicates")
+                return True
+            else:
+                self.log_test("Product Pagination", False, f"Got {len(seen_ids)} ids, {len(set(seen_ids))} unique")
+                return False
+        except Exception as e:
+            self.log_test("Product Pagination", False, f"Pagination request failed: {str(e)}")
+            return False
+    
     def test_get_categories(self):
         """Test getting product categories"""
         try:
@@ -184,7 +271,7 @@ class StreetBazaarTester:
             # Test search by name
             response = requests.get(f"{BASE_URL}/products?search=rice", timeout=10)
             if response.status_code == 200:
-                products = response.json()
+                products = response.json().get("items")
                 if isinstance(products, list):
                     rice_products = [p for p in products if 'rice' in p.get('name', '').lower()]
                     if len(rice_products) > 0:
@@ -208,7 +295,7 @@ class StreetBazaarTester:
         try:
             response = requests.get(f"{BASE_URL}/products?category=grains", timeout=10)
             if response.status_code == 200:
-                products = response.json()
+                products = response.json().get("items")
                 if isinstance(products, list):
                     grain_products = [p for p in products if p.get('category') == 'grains']
                     if len(grain_products) > 0:
@@ -227,6 +314,55 @@ class StreetBazaarTester:
             self.log_test("Category Filter", False, f"Category filter request failed: {str(e)}")
             return False
     
+    def test_nearby_discovery(self):
+        """Test that nearby suppliers and products are sorted by distance and paginate without repeats"""
+        if not self.vendor_token:
+            self.log_test("Nearby Discovery", False, "No vendor token available")
+            return False
+        
+        try:
+            headers = {"Authorization": f"Bearer {self.vendor_token}"}
+            # The demo vendor is in Delhi, so the default origin is Delhi
+            response = requests.get(f"{BASE_URL}/suppliers/nearby", params={"radius": 50}, headers=headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Nearby Discovery", False, f"Nearby suppliers failed with status {response.status_code}")
+                return False
+            cities = {supplier["city"] for supplier in response.json()["items"]}
+            if "Delhi" not in cities or "Mumbai" in cities:
+                self.log_test("Nearby Discovery", False, f"Unexpected suppliers within 50 km of Delhi: {cities}")
+                return False
+            
+            seen, distances, cursor = [], [], None
+            while True:
+                params = {"near": "28.6139,77.2090", "radius": 2000, "limit": 2}
+                if cursor:
+                    params["cursor"] = cursor
+                response = requests.get(f"{BASE_URL}/products", params=params, timeout=10)
+                if response.status_code != 200:
+                    self.log_test("Nearby Discovery", False, f"Nearby products failed with status {response.status_code}")
+                    return False
+                page = response.json()
+                seen.extend(product["id"] for product in page["items"])
+                distances.extend(product["distanceKm"] for product in page["items"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+            
+            if not seen or len(seen) != len(set(seen)) or distances != sorted(distances):
+                self.log_test("Nearby Discovery", False, "Nearby products repeated or out of distance order", distances)
+                return False
+            
+            response = requests.get(f"{BASE_URL}/products", params={"near": "not-a-place"}, timeout=10)
+            if response.status_code != 400:
+                self.log_test("Nearby Discovery", False, f"Invalid near returned status {response.status_code}")
+                return False
+            
+            self.log_test("Nearby Discovery", True, f"{len(seen)} products within 2000 km, nearest {distances[0]} km")
+            return True
+        except Exception as e:
+            self.log_test("Nearby Discovery", False, f"Nearby discovery request failed: {str(e)}")
+            return False
+    
     def test_create_product(self):
         """Test product creation by supplier"""
         if not self.supplier_token:
@@ -262,6 +398,117 @@ class StreetBazaarTester:
             self.log_test("Create Product", False, f"Create product request failed: {str(e)}")
             return None
     
+    def test_non_latin_search(self):
+        """Test that a product named in Devanagari is found by its own words"""
+        if not self.supplier_token:
+            self.log_test("Non-Latin Search", False, "No supplier token available")
+            return False
+        
+        try:
+            headers = {"Authorization": f"Bearer {self.supplier_token}"}
+            new_product = {"name": "हल्दी पाउडर", "category": "spices", "price": 120.0, "unit": "kg", "stock": 50}
+            response = requests.post(f"{BASE_URL}/products", json=new_product, headers=headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Non-Latin Search", False, f"Product creation failed with status {response.status_code}")
+                return False
+            product_id = response.json()["id"]
+            
+            response = requests.get(f"{BASE_URL}/products", params={"search": "हल्दी"}, timeout=10)
+            found = [p["id"] for p in response.json().get("items", [])] if response.status_code == 200 else []
+            if product_id in found:
+                self.log_test("Non-Latin Search", True, "Devanagari product name is searchable")
+                return True
+            else:
+                self.log_test("Non-Latin Search", False, f"Search for हल्दी returned {len(found)} products, not the new one")
+                return False
+        except Exception as e:
+            self.log_test("Non-Latin Search", False, f"Non-Latin search request failed: {str(e)}")
+            return False
+    
+    def test_punctuation_search(self):
+        """Test that a search with no words in it matches nothing, near or not"""
+        try:
+            results = {}
+            for params in ({"search": "!!!"}, {"search": "?*@", "near": "28.61,77.20", "radius": 2000}):
+                response = requests.get(f"{BASE_URL}/products", params=params, timeout=10)
+                if response.status_code != 200:
+                    self.log_test("Punctuation Search", False, f"Search failed with status {response.status_code}")
+                    return False
+                results[params["search"]] = len(response.json()["items"])
+            if not any(results.values()):
+                self.log_test("Punctuation Search", True, "Searches without words returned no products")
+                return True
+            else:
+                self.log_test("Punctuation Search", False, "Searches without words returned products", results)
+                return False
+        except Exception as e:
+            self.log_test("Punctuation Search", False, f"Punctuation search request failed: {str(e)}")
+            return False
+    
+    def test_product_changes(self):
+        """Test that delta sync returns a product created after the sync token"""
+        try:
+            token, has_more = None, True
+            while has_more:
+                params = {"since": token} if token else {}
+                response = requests.get(f"{BASE_URL}/products/changes", params=params, timeout=10)
+                if response.status_code != 200:
+                    self.log_test("Product Delta Sync", False, f"Initial sync failed with status {response.status_code}")
+                    return False
+                changes = response.json()
+                token, has_more = changes["next_token"], changes["has_more"]
+            
+            product = self.test_create_product()
+            if not product:
+                self.log_test("Product Delta Sync", False, "Could not create a product to sync")
+                return False
+            
+            response = requests.get(f"{BASE_URL}/products/changes", params={"since": token}, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Product Delta Sync", False, f"Delta sync failed with status {response.status_code}")
+                return False
+            changed_ids = [item["id"] for item in response.json()["items"]]
+            if product["id"] in changed_ids:
+                self.log_test("Product Delta Sync", True, f"Delta contained {len(changed_ids)} changed products")
+                return True
+            else:
+                self.log_test("Product Delta Sync", False, "New product missing from the delta")
+                return False
+        except Exception as e:
+            self.log_test("Product Delta Sync", False, f"Delta sync request failed: {str(e)}")
+            return False
+    
+    def test_bulk_product_import(self):
+        """Test CSV bulk import with one invalid row"""
+        if not self.supplier_token:
+            self.log_test("Bulk Product Import", False, "No supplier token available")
+            return False
+        
+        try:
+            headers = {"Authorization": f"Bearer {self.supplier_token}", "Content-Type": "text/csv"}
+            upload = (
+                "name,category,description,price,unit,stock,minOrderQty,maxOrderQty\n"
+                "Test Bulk Chana Dal,grains,\"Split chickpeas, cleaned\",90,kg,200,5,50\n"
+                "Test Bulk Mustard Oil,oils,Cold pressed,not-a-price,liter,80,2,20\n"
+                "Test Bulk Turmeric,spices,,260,kg,40,1,10\n"
+            )
+            
+            response = requests.post(f"{BASE_URL}/products/import", data=upload.encode("utf-8"), headers=headers, timeout=30)
+            if response.status_code != 200:
+                self.log_test("Bulk Product Import", False, f"Import failed with status {response.status_code}: {response.text}")
+                return False
+            report = response.json()
+            failed_rows = [error["row"] for error in report["errors"]]
+            if report["imported"] == 2 and report["failed"] == 1 and failed_rows == [3]:
+                self.log_test("Bulk Product Import", True, "Imported 2 rows and reported the invalid row 3")
+                return True
+            else:
+                self.log_test("Bulk Product Import", False, "Unexpected import report", report)
+                return False
+        except Exception as e:
+            self.log_test("Bulk Product Import", False, f"Bulk import request failed: {str(e)}")
+            return False
+    
     def test_vendor_create_product_forbidden(self):
         """Test that vendors cannot create products"""
         if not self.vendor_token:
@@ -308,14 +555,15 @@ class StreetBazaarTester:
             headers = {"Authorization": f"Bearer {self.vendor_token}"}
             product = products[0]  # Use first product
             
+            quantity = product["minOrderQty"]
             order_data = {
                 "items": [
                     {
                         "productId": product["id"],
                         "productName": product["name"],
-                        "quantity": 10,
+                        "quantity": quantity,
                         "unitPrice": product["price"],
-                        "totalPrice": product["price"] * 10,
+                        "totalPrice": product["price"] * quantity,
                         "supplierId": product["supplierId"],
                         "supplierName": product["supplierName"]
                     }
@@ -325,7 +573,8 @@ class StreetBazaarTester:
             
             response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=headers, timeout=10)
             if response.status_code == 200:
-                order = response.json()
+                checkout = response.json()
+                order = checkout["orders"][0] if checkout.get("orders") else {}
                 if order.get("orderNumber") and order.get("totalAmount"):
                     self.log_test("Create Order", True, f"Created order {order.get('orderNumber')} for ₹{order.get('totalAmount')}")
                     return order
@@ -339,6 +588,417 @@ class StreetBazaarTester:
             self.log_test("Create Order", False, f"Create order request failed: {str(e)}")
             return None
     
+    def test_multi_supplier_checkout(self):
+        """Test that a cart spanning suppliers becomes one order per supplier"""
+        if not self.vendor_token:
+            self.log_test("Multi-Supplier Checkout", False, "No vendor token available")
+            return False
+        
+        products = self.test_get_products()
+        by_supplier = {}
+        for product in products:
+            by_supplier.setdefault(product["supplierId"], product)
+        if len(by_supplier) < 2:
+            self.log_test("Multi-Supplier Checkout", False, "Need products from at least two suppliers")
+            return False
+        
+        try:
+            headers = {"Authorization": f"Bearer {self.vendor_token}"}
+            items = []
+            for product in list(by_supplier.values())[:3]:
+                quantity = product["minOrderQty"]
+                items.append({
+                    "productId": product["id"],
+                    "productName": product["name"],
+                    "quantity": quantity,
+                    "unitPrice": product["price"],
+                    "totalPrice": product["price"] * quantity,
+                    "supplierId": product["supplierId"],
+                    "supplierName": product["supplierName"]
+                })
+            
+            response = requests.post(f"{BASE_URL}/orders", json={"items": items}, headers=headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Multi-Supplier Checkout", False, f"Checkout failed with status {response.status_code}: {response.text}")
+                return False
+            
+            checkout = response.json()
+            suppliers = {order["supplierId"] for order in checkout["orders"]}
+            checkout_ids = {order["checkoutId"] for order in checkout["orders"]}
+            if len(checkout["orders"]) == len(items) and len(suppliers) == len(items) and checkout_ids == {checkout["checkoutId"]}:
+                self.log_test("Multi-Supplier Checkout", True, f"Checkout split into {len(suppliers)} supplier orders")
+                return True
+            else:
+                self.log_test("Multi-Supplier Checkout", False, f"Expected {len(items)} orders, one per supplier", checkout)
+                return False
+        except Exception as e:
+            self.log_test("Multi-Supplier Checkout", False, f"Checkout request failed: {str(e)}")
+            return False
+    
+    def test_stale_cart_rejected(self):
+        """Test that orders are priced server-side and stale carts are rejected"""
+        if not self.vendor_token:
+            self.log_test("Stale Cart Rejected", False, "No vendor token available")
+            return False
+        
+        products = self.test_get_products()
+        if not products:
+            self.log_test("Stale Cart Rejected", False, "No products available to order")
+            return False
+        
+        try:
+            headers = {"Authorization": f"Bearer {self.vendor_token}"}
+            product = products[0]
+            quantity = product["minOrderQty"]
+            order_data = {
+                "items": [
+                    {
+                        "productId": product["id"],
+                        "productName": product["name"],
+                        "quantity": quantity,
+                        "unitPrice": 0.01,
+                        "totalPrice": 0.01 * quantity,
+                        "supplierId": product["supplierId"],
+                        "supplierName": product["supplierName"]
+                    }
+                ]
+            }
+            
+            response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=headers, timeout=10)
+            if response.status_code == 409:
+                reasons = [problem["reason"] for problem in response.json()["detail"]["problems"]]
+                self.log_test("Stale Cart Rejected", True, f"Cart rejected with reasons: {', '.join(reasons)}")
+                return True
+            else:
+                self.log_test("Stale Cart Rejected", False, f"Should return 409, got {response.status_code}")
+                return False
+        except Exception as e:
+            self.log_test("Stale Cart Rejected", False, f"Stale cart request failed: {str(e)}")
+            return False
+    
+    def test_concurrent_orders_no_oversell(self):
+        """Test that simultaneous orders for one product never oversell its stock"""
+        if not self.vendor_token or not self.supplier_token:
+            self.log_test("Concurrent Orders (No Oversell)", False, "Vendor and supplier tokens required")
+            return False
+        
+        stock = 20
+        attempts = 200
+        try:
+            supplier_headers = {"Authorization": f"Bearer {self.supplier_token}"}
+            vendor_headers = {"Authorization": f"Bearer {self.vendor_token}"}
+            new_product = {
+                "name": f"Stress Test Chillies {datetime.now().strftime('%H%M%S%f')}",
+                "category": "vegetables",
+                "price": 40.0,
+                "unit": "kg",
+                "stock": stock,
+                "minOrderQty": 1,
+                "maxOrderQty": 10
+            }
+            response = requests.post(f"{BASE_URL}/products", json=new_product, headers=supplier_headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Concurrent Orders (No Oversell)", False, f"Product creation failed with status {response.status_code}")
+                return False
+            product = response.json()
+            
+            order_data = {
+                "items": [
+                    {
+                        "productId": product["id"],
+                        "productName": product["name"],
+                        "quantity": 1,
+                        "unitPrice": product["price"],
+                        "totalPrice": product["price"],
+                        "supplierId": product["supplierId"],
+                        "supplierName": product["supplierName"]
+                    }
+                ]
+            }
+            
+            def place_order(_):
+                return requests.post(f"{BASE_URL}/orders", json=order_data, headers=vendor_headers, timeout=30).status_code
+            
+            with ThreadPoolExecutor(max_workers=50) as pool:
+                statuses = list(pool.map(place_order, range(attempts)))
+            
+            accepted = statuses.count(200)
+            rejected = statuses.count(409)
+            if accepted == stock and rejected == attempts - stock:
+                self.log_test("Concurrent Orders (No Oversell)", True, f"{accepted} of {attempts} orders accepted for stock of {stock}")
+                return True
+            else:
+                self.log_test("Concurrent Orders (No Oversell)", False,
+                              f"{accepted} accepted and {rejected} rejected for stock of {stock}",
+                              {code: statuses.count(code) for code in set(statuses)})
+                return False
+        except Exception as e:
+            self.log_test("Concurrent Orders (No Oversell)", False, f"Stress test failed: {str(e)}")
+            return False
+    
+    def test_concurrent_idempotent_retries(self):
+        """Test that concurrent retries with one Idempotency-Key create a single product and order"""
+        if not self.vendor_token or not self.supplier_token:
+            self.log_test("Idempotent Retries", False, "Vendor and supplier tokens required")
+            return False
+        
+        try:
+            suffix = datetime.now().strftime('%H%M%S%f')
+            supplier_headers = {"Authorization": f"Bearer {self.supplier_token}", "Idempotency-Key": f"product-{suffix}"}
+            new_product = {
+                "name": f"Idempotent Jaggery {suffix}",
+                "category": "sweeteners",
+                "price": 60.0,
+                "unit": "kg",
+                "stock": 100,
+                "minOrderQty": 1,
+                "maxOrderQty": 10
+            }
+            
+            def create_product(_):
+                return requests.post(f"{BASE_URL}/products", json=new_product, headers=supplier_headers, timeout=30)
+            
+            with ThreadPoolExecutor(max_workers=10) as pool:
+                product_responses = list(pool.map(create_product, range(10)))
+            product_ids = {r.json().get("id") for r in product_responses if r.status_code == 200}
+            if len(product_ids) != 1 or any(r.status_code != 200 for r in product_responses):
+                self.log_test("Idempotent Retries", False, f"Product retries produced {len(product_ids)} products",
+                              [r.status_code for r in product_responses])
+                return False
+            
+            product = product_responses[0].json()
+            vendor_headers = {"Authorization": f"Bearer {self.vendor_token}", "Idempotency-Key": f"order-{suffix}"}
+            order_data = {
+                "items": [
+                    {
+                        "productId": product["id"],
+                        "productName": product["name"],
+                        "quantity": 1,
+                        "unitPrice": product["price"],
+                        "totalPrice": product["price"],
+                        "supplierId": product["supplierId"],
+                        "supplierName": product["supplierName"]
+                    }
+                ]
+            }
+            
+            def create_order(_):
+                return requests.post(f"{BASE_URL}/orders", json=order_data, headers=vendor_headers, timeout=30)
+            
+            with ThreadPoolExecutor(max_workers=10) as pool:
+                order_responses = list(pool.map(create_order, range(10)))
+            checkout_ids = {r.json().get("checkoutId") for r in order_responses if r.status_code == 200}
+            if len(checkout_ids) == 1 and all(r.status_code == 200 for r in order_responses):
+                self.log_test("Idempotent Retries", True, "10 concurrent retries created one product and one checkout")
+                return True
+            else:
+                self.log_test("Idempotent Retries", False, f"Order retries produced {len(checkout_ids)} checkouts",
+                              [r.status_code for r in order_responses])
+                return False
+        except Exception as e:
+            self.log_test("Idempotent Retries", False, f"Idempotency test failed: {str(e)}")
+            return False
+    
+    def test_order_status_stream(self):
+        """Test that a vendor's order stream receives the vendor's new orders"""
+        if not self.vendor_token:
+            self.log_test("Order Status Stream", False, "No vendor token available")
+            return False
+        
+        products = self.test_get_products()
+        if not products:
+            self.log_test("Order Status Stream", False, "No products available to order")
+            return False
+        
+        try:
+            product = products[0]
+            order_data = {
+                "items": [
+                    {
+                        "productId": product["id"],
+                        "productName": product["name"],
+                        "quantity": product["minOrderQty"],
+                        "unitPrice": product["price"],
+                        "totalPrice": product["price"] * product["minOrderQty"],
+                        "supplierId": product["supplierId"],
+                        "supplierName": product["supplierName"]
+                    }
+                ]
+            }
+            
+            with requests.get(f"{BASE_URL}/orders/stream", params={"token": self.vendor_token},
+                              stream=True, timeout=10) as stream:
+                if stream.status_code != 200:
+                    self.log_test("Order Status Stream", False, f"Stream failed with status {stream.status_code}")
+                    return False
+                
+                headers = {"Authorization": f"Bearer {self.vendor_token}"}
+                response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=headers, timeout=10)
+                if response.status_code != 200:
+                    self.log_test("Order Status Stream", False, f"Order creation failed with status {response.status_code}")
+                    return False
+                order_id = response.json()["orders"][0]["id"]
+                
+                event_type = None
+                for line in stream.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        event_type = line[len("event: "):]
+                    elif line.startswith("data: ") and event_type == "order.created":
+                        if json.loads(line[len("data: "):])["id"] == order_id:
+                            self.log_test("Order Status Stream", True, "New order was pushed to the vendor's stream")
+                            return True
+            
+            self.log_test("Order Status Stream", False, "Stream closed before the order event arrived")
+            return False
+        except Exception as e:
+            self.log_test("Order Status Stream", False, f"Order stream request failed: {str(e)}")
+            return False
+    
+    def test_stock_change_sync(self):
+        """Test that delta sync returns a product whose stock an order took"""
+        if not self.vendor_token:
+            self.log_test("Stock Change Sync", False, "No vendor token available")
+            return False
+        
+        # Earlier order tests may have sold out a product, so check live stock
+        product = None
+        for listed in self.test_get_products():
+            response = requests.get(f"{BASE_URL}/products/{listed['id']}", timeout=10)
+            if response.status_code == 200 and response.json()["stock"] >= response.json()["minOrderQty"]:
+                product = response.json()
+                break
+        if not product:
+            self.log_test("Stock Change Sync", False, "No products in stock to order")
+            return False
+        
+        try:
+            token, has_more = None, True
+            while has_more:
+                params = {"since": token} if token else {}
+                response = requests.get(f"{BASE_URL}/products/changes", params=params, timeout=10)
+                if response.status_code != 200:
+                    self.log_test("Stock Change Sync", False, f"Initial sync failed with status {response.status_code}")
+                    return False
+                changes = response.json()
+                token, has_more = changes["next_token"], changes["has_more"]
+            
+            quantity = product["minOrderQty"]
+            order_data = {
+                "items": [
+                    {
+                        "productId": product["id"],
+                        "productName": product["name"],
+                        "quantity": quantity,
+                        "unitPrice": product["price"],
+                        "totalPrice": product["price"] * quantity,
+                        "supplierId": product["supplierId"],
+                        "supplierName": product["supplierName"]
+                    }
+                ]
+            }
+            headers = {"Authorization": f"Bearer {self.vendor_token}"}
+            response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Stock Change Sync", False, f"Order creation failed with status {response.status_code}")
+                return False
+            
+            response = requests.get(f"{BASE_URL}/products/changes", params={"since": token}, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Stock Change Sync", False, f"Delta sync failed with status {response.status_code}")
+                return False
+            synced = {item["id"]: item for item in response.json()["items"]}
+            expected = product["stock"] - quantity
+            if product["id"] in synced and synced[product["id"]]["stock"] == expected:
+                self.log_test("Stock Change Sync", True, f"Delta carried the ordered product at stock {expected}")
+                return True
+            else:
+                self.log_test("Stock Change Sync", False, "Ordered product missing from the delta or stale",
+                              synced.get(product["id"]))
+                return False
+        except Exception as e:
+            self.log_test("Stock Change Sync", False, f"Stock change sync failed: {str(e)}")
+            return False
+    
+    def test_invalid_order_status(self):
+        """Test that an unknown order status is rejected before any update"""
+        if not self.supplier_token:
+            self.log_test("Invalid Order Status", False, "No supplier token available")
+            return False
+        
+        try:
+            headers = {"Authorization": f"Bearer {self.supplier_token}"}
+            response = requests.put(f"{BASE_URL}/orders/unknown-order/status", params={"status": "shipped-ish"},
+                                    headers=headers, timeout=10)
+            if response.status_code == 422:
+                self.log_test("Invalid Order Status", True, "API correctly rejected an unknown status")
+                return True
+            else:
+                self.log_test("Invalid Order Status", False, f"API should return 422 for an unknown status, got {response.status_code}")
+                return False
+        except Exception as e:
+            self.log_test("Invalid Order Status", False, f"Invalid status test failed: {str(e)}")
+            return False
+    
+    def test_supplier_analytics(self):
+        """Test that supplier analytics reflect a new order immediately"""
+        if not self.supplier_token or not self.vendor_token:
+            self.log_test("Supplier Analytics", False, "Vendor and supplier tokens required")
+            return False
+        
+        # The oversell test may have sold out a product, so check live stock
+        products = []
+        for listed in self.test_get_products():
+            if listed["supplierId"] != self.supplier_user["id"]:
+                continue
+            response = requests.get(f"{BASE_URL}/products/{listed['id']}", timeout=10)
+            if response.status_code == 200 and response.json()["stock"] >= response.json()["minOrderQty"]:
+                products.append(response.json())
+                break
+        if not products:
+            self.log_test("Supplier Analytics", False, "Supplier has no products in stock to order")
+            return False
+        
+        try:
+            supplier_headers = {"Authorization": f"Bearer {self.supplier_token}"}
+            response = requests.get(f"{BASE_URL}/analytics/supplier", headers=supplier_headers, timeout=30)
+            if response.status_code != 200:
+                self.log_test("Supplier Analytics", False, f"Analytics failed with status {response.status_code}")
+                return False
+            before = response.json()["totals"]["orders"]
+            
+            product = products[0]
+            order_data = {
+                "items": [
+                    {
+                        "productId": product["id"],
+                        "productName": product["name"],
+                        "quantity": product["minOrderQty"],
+                        "unitPrice": product["price"],
+                        "totalPrice": product["price"] * product["minOrderQty"],
+                        "supplierId": product["supplierId"],
+                        "supplierName": product["supplierName"]
+                    }
+                ]
+            }
+            vendor_headers = {"Authorization": f"Bearer {self.vendor_token}"}
+            response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=vendor_headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Supplier Analytics", False, f"Order creation failed with status {response.status_code}")
+                return False
+            
+            response = requests.get(f"{BASE_URL}/analytics/supplier", headers=supplier_headers, timeout=30)
+            analytics = response.json()
+            if analytics["totals"]["orders"] == before + 1 and analytics["daily"]:
+                self.log_test("Supplier Analytics", True,
+                              f"{analytics['totals']['orders']} orders, ₹{analytics['totals']['revenue']} revenue")
+                return True
+            else:
+                self.log_test("Supplier Analytics", False, f"Expected {before + 1} orders after a new order", analytics["totals"])
+                return False
+        except Exception as e:
+            self.log_test("Supplier Analytics", False, f"Analytics request failed: {str(e)}")
+            return False
+    
     def test_get_vendor_orders(self):
         """Test getting orders for vendor"""
         if not self.vendor_token:
@@ -349,7 +1009,7 @@ class StreetBazaarTester:
             headers = {"Authorization": f"Bearer {self.vendor_token}"}
             response = requests.get(f"{BASE_URL}/orders", headers=headers, timeout=10)
             if response.status_code == 200:
-                orders = response.json()
+                orders = response.json().get("items")
                 if isinstance(orders, list):
                     self.log_test("Get Vendor Orders", True, f"Retrieved {len(orders)} orders for vendor")
                     return orders
@@ -373,7 +1033,7 @@ class StreetBazaarTester:
             headers = {"Authorization": f"Bearer {self.supplier_token}"}
             response = requests.get(f"{BASE_URL}/orders", headers=headers, timeout=10)
             if response.status_code == 200:
-                orders = response.json()
+                orders = response.json().get("items")
                 if isinstance(orders, list):
                     self.log_test("Get Supplier Orders", True, f"Retrieved {len(orders)} orders for supplier")
                     return orders
@@ -446,15 +1106,401 @@ class StreetBazaarTester:
         
         return success
     
+    def test_request_profile(self):
+        """Test that a profile can be requested inline for a product page"""
+        try:
+            headers = {"X-Profile": os.environ["PROFILE_TOKEN"], "X-Profile-Output": "json"}
+            response = requests.get(f"{BASE_URL}/products", headers=headers, timeout=30)
+            if response.status_code != 200:
+                self.log_test("Request Profile", False, f"Profiled request failed with status {response.status_code}")
+                return False
+            profile = response.json()
+            if profile.get("status") == 200 and "get_products" in json.dumps(profile.get("callTree")):
+                self.log_test("Request Profile", True, f"Profiled {profile['path']} in {profile['durationMs']} ms, "
+                                                       f"{len(profile['commands'])} MongoDB commands")
+                return True
+            else:
+                self.log_test("Request Profile", False, "Profile is missing the get_products call tree")
+                return False
+        except Exception as e:
+            self.log_test("Request Profile", False, f"Profiled request failed: {str(e)}")
+            return False
+    
+    def run_against_database(self, check):
+        """Run an async check against the database named by MONGO_URL/DB_NAME"""
+        from motor.motor_asyncio import AsyncIOMotorClient
+        
+        async def run():
+            client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+            try:
+                return await check(client[os.environ.get("DB_NAME", "streetbazaar_db")])
+            finally:
+                client.close()
+        
+        return asyncio.run(run())
+    
+    def test_hot_queries_use_indexes(self):
+        """Test that no hot endpoint query falls back to a COLLSCAN"""
+        try:
+            from indexes import ensure_indexes, explain_hot_queries
+            
+            async def explain(db):
+                await ensure_indexes(db)
+                return await explain_hot_queries(db)
+            
+            results = self.run_against_database(explain)
+            scans = [f"{r['collection']}.find({r['query']})" for r in results if r["collscan"]]
+            if not scans:
+                self.log_test("Hot Query Indexes", True, f"All {len(results)} hot queries use an index")
+                return True
+            else:
+                self.log_test("Hot Query Indexes", False, "COLLSCAN in winning plan", scans)
+                return False
+        except Exception as e:
+            self.log_test("Hot Query Indexes", False, f"Explain check failed: {str(e)}")
+            return False
+    
+    def test_order_numbers_unique(self):
+        """Test that 100k order numbers from parallel tasks on two workers never collide"""
+        try:
+            from mongo_storage import MongoCounterRepo
+            from order_numbers import OrderNumberService
+            sequence_name = f"orderNumberTest-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+            
+            async def generate(db):
+                # Two services sharing one sequence stand in for two workers
+                workers = [OrderNumberService(MongoCounterRepo(db.counters), name=sequence_name, block_size=100)
+                           for _ in range(2)]
+                
+                async def task(worker):
+                    return [await worker.next() for _ in range(1000)]
+                
+                try:
+                    return await asyncio.gather(*(task(workers[i % 2]) for i in range(100)))
+                finally:
+                    await db.counters.delete_one({"_id": sequence_name})
+            
+            batches = self.run_against_database(generate)
+            numbers = [number for batch in batches for number in batch]
+            in_order = all(batch == sorted(batch) for batch in batches)
+            if len(numbers) == 100000 and len(set(numbers)) == len(numbers) and in_order:
+                self.log_test("Order Numbers Unique", True, f"Generated {len(numbers)} unique, per-task increasing numbers")
+                return True
+            else:
+                self.log_test("Order Numbers Unique", False,
+                              f"{len(numbers)} numbers, {len(set(numbers))} unique, per-task increasing: {in_order}")
+                return False
+        except Exception as e:
+            self.log_test("Order Numbers Unique", False, f"Order number check failed: {str(e)}")
+            return False
+    
+    def test_supplier_stats_consistent(self):
+        """Test that incrementally kept supplier counters match a rebuild from orders and products"""
+        try:
+            from supplier_stats import reconcile_supplier_stats
+            threshold = int(os.environ.get("LOW_STOCK_THRESHOLD", "10"))
+            
+            drift = self.run_against_database(lambda db: reconcile_supplier_stats(db, threshold))
+            if not drift:
+                self.log_test("Supplier Stats Consistent", True, "No drift between counters and source collections")
+                return True
+            else:
+                self.log_test("Supplier Stats Consistent", False, f"Drift for {len(drift)} suppliers", drift)
+                return False
+        except Exception as e:
+            self.log_test("Supplier Stats Consistent", False, f"Reconciliation failed: {str(e)}")
+            return False
+    
+    def test_order_export_bounded_memory(self):
+        """Test that exporting 1M orders holds about one chunk in memory, not the history"""
+        try:
+            import tracemalloc
+            from order_export import encode_orders
+            
+            async def synthetic_orders(count):
+                created_at = datetime(2024, 1, 1)
+                for position in range(count):
+                    yield {
+                        "id": f"order-{position}",
+                        "orderNumber": f"ORD{position:010d}",
+                        "vendorId": "vendor-1",
+                        "supplierId": "supplier-1",
+                        "items": [{"productId": "product-1", "productName": "Basmati Rice", "quantity": 10,
+                                   "unitPrice": 95.0, "totalPrice": 950.0}],
+                        "totalAmount": 950.0,
+                        "status": "pending",
+                        "createdAt": created_at,
+                    }
+            
+            async def export(count, export_format):
+                received = 0
+                tracemalloc.start()
+                async for chunk in encode_orders(synthetic_orders(count), export_format):
+                    received += len(chunk)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                return received, peak
+            
+            results = {}
+            for export_format in ("ndjson", "csv"):
+                received, peak = asyncio.run(export(1000000, export_format))
+                results[export_format] = (received, peak)
+            
+            # 1M orders are over 100MB encoded; the peak must stay near the 64KB chunk size
+            limit = 4 * 1024 * 1024
+            summary = ", ".join(f"{fmt}: {received / 1e6:.0f}MB sent, peak {peak / 1e6:.2f}MB"
+                                for fmt, (received, peak) in results.items())
+            if all(peak < limit and received > 25 * limit for received, peak in results.values()):
+                self.log_test("Order Export Bounded Memory", True, summary)
+                return True
+            else:
+                self.log_test("Order Export Bounded Memory", False, summary)
+                return False
+        except Exception as e:
+            self.log_test("Order Export Bounded Memory", False, f"Export memory check failed: {str(e)}")
+            return False
+    
+    def test_order_export_escapes_formulas(self):
+        """Test that CSV exports quote text a spreadsheet would run as a formula"""
+        try:
+            from order_export import encode_orders
+            
+            async def orders():
+                yield {
+                    "id": "order-1",
+                    "orderNumber": "ORD0000000001",
+                    "vendorName": "=HYPERLINK(\"http://example.com\")",
+                    "deliveryAddress": "@SUM(A1:A9)",
+                    "items": [{"productId": "product-1", "productName": "+Basmati", "quantity": 10,
+                               "unitPrice": 95.0, "totalPrice": -950.0}],
+                    "totalAmount": 950.0,
+                    "status": "pending",
+                }
+            
+            async def export():
+                return b"".join([chunk async for chunk in encode_orders(orders(), "csv")]).decode("utf-8")
+            
+            row = next(csv.DictReader(io.StringIO(asyncio.run(export()))))
+            escaped = (row["vendorName"].startswith("'=") and row["deliveryAddress"] == "'@SUM(A1:A9)"
+                       and row["productName"] == "'+Basmati" and row["totalPrice"] == "-950.0")
+            if escaped:
+                self.log_test("Order Export Formula Escaping", True, "Formula-like text cells were quoted, numbers left alone")
+                return True
+            else:
+                self.log_test("Order Export Formula Escaping", False, "Formula-like cells were exported as is", row)
+                return False
+        except Exception as e:
+            self.log_test("Order Export Formula Escaping", False, f"Export escaping check failed: {str(e)}")
+            return False
+    
+    def test_synthetic_seed(self):
+        """Test that the seed generator is deterministic and its orders match the counters it builds"""
+        try:
+            from seed import generate_users, seed_database
+            from supplier_stats import reconcile_supplier_stats
+            end = datetime(2025, 6, 1)
+            
+            async def seed(client_db):
+                # A scratch database next to the real one, dropped afterwards
+                db = client_db.client[f"{client_db.name}_seed_check"]
+                try:
+                    report = await seed_database(db, 20, 5, 200, 2000, seed=7, end=end, batch_size=500)
+                    counted = {"users": await db.users.count_documents({}),
+                               "orders": await db.orders.count_documents({})}
+                    await reconcile_supplier_stats(db, 10, fix=True)
+                    return report.rows, counted, await reconcile_supplier_stats(db, 10)
+                finally:
+                    await db.client.drop_database(db.name)
+            
+            rows, counted, drift = self.run_against_database(seed)
+            repeatable = list(generate_users(50, "vendor", "hash", 7, end)) == list(generate_users(50, "vendor", "hash", 7, end))
+            if counted == {"users": 25, "orders": 2000} and rows["products"] == 200 and not drift and repeatable:
+                self.log_test("Synthetic Seed", True, f"Seeded {sum(rows.values())} documents; counters rebuilt without drift")
+                return True
+            else:
+                self.log_test("Synthetic Seed", False, f"rows {rows}, counted {counted}, drift {len(drift)}, repeatable {repeatable}")
+                return False
+        except Exception as e:
+            self.log_test("Synthetic Seed", False, f"Seeding failed: {str(e)}")
+            return False
+
+    def test_storage_engines_agree(self):
+        """Test that the in-memory storage engine answers like the MongoDB one on the same data"""
+        try:
+            from cities import geo_point
+            from memory_storage import MemoryStorage
+            from mongo_storage import MongoStorage
+            from seed import seed_database
+            end = datetime(2025, 6, 1)
+
+            async def walk(fetch, limit=7):
+                # Every page of a keyset listing, resumed from the last (createdAt, id)
+                ids, after = [], None
+                while True:
+                    docs = await fetch(after, limit)
+                    ids += [doc["id"] for doc in docs]
+                    if len(docs) < limit:
+                        return ids
+                    after = (docs[-1]["createdAt"], docs[-1]["id"])
+
+            async def answers(storage, vendor_id, supplier_id):
+                projection = {"_id": 0, "id": 1, "createdAt": 1}
+                near = geo_point(28.61, 77.21)
+                return {
+                    "products": await walk(lambda after, limit: storage.products.page(None, after, limit, projection)),
+                    "category": await walk(lambda after, limit: storage.products.page("grains", after, limit, projection)),
+                    "nearby": [doc["id"] for doc in await storage.products.nearby(near, 500, None, None, None, 20, projection)],
+                    "nearbySuppliers": [doc["id"] for doc in await storage.users.nearby_suppliers(near, 1500, None, 20, projection)],
+                    "changes": [doc["id"] for doc in await storage.products.changes(50, 30, projection)],
+                    "orders": await walk(lambda after, limit: storage.orders.page({"vendorId": vendor_id}, after, limit, projection)),
+                    "export": [doc["id"] async for doc in storage.orders.export({"supplierId": supplier_id}, datetime(2025, 3, 1), None, projection, 25)],
+                    "analytics": await storage.orders.supplier_analytics(supplier_id, 30, 8, end, 5, 5),
+                    "tiedAnalytics": await storage.orders.supplier_analytics("tie-supplier", 30, 8, end, 5, 5),
+                    "drift": await storage.supplier_stats.reconcile(10, fix=True),
+                }
+
+            async def compare(client_db):
+                db = client_db.client[f"{client_db.name}_engine_check"]
+                try:
+                    await seed_database(db, 10, 4, 120, 600, seed=3, end=end, batch_size=500)
+                    # Orders placed in one instant and inserted out of id order, so only
+                    # the tie-breaks decide analytics' row order and latest names
+                    placed = datetime(2025, 5, 31, 12)
+                    await db.orders.insert_many([
+                        {"id": f"tie-order-{n}", "checkoutId": f"tie-checkout-{n}", "orderNumber": f"TIE{n}",
+                         "vendorId": "tie-vendor", "vendorName": f"Tie Vendor {n}", "supplierId": "tie-supplier",
+                         "supplierName": "Tie Supplier", "status": status, "totalAmount": 100.0,
+                         "items": [{"productId": "tie-product", "productName": f"Tie Product {n}", "quantity": 1,
+                                    "unitPrice": 100.0, "totalPrice": 100.0}],
+                         "deliveryAddress": "", "createdAt": placed, "updatedAt": placed}
+                        for n, status in [(2, "pending"), (0, "delivered"), (1, "confirmed")]
+                    ])
+                    mongo = MongoStorage(db.client, db)
+                    memory = MemoryStorage()
+                    await memory.users.insert_many(await db.users.find({}, {"_id": 0}).to_list(None))
+                    await memory.products.insert_many(await db.products.find({}, {"_id": 0}).to_list(None))
+                    await memory.orders.insert_many(await db.orders.find({}, {"_id": 0}).to_list(None))
+                    order = await db.orders.find_one({}, {"_id": 0, "vendorId": 1, "supplierId": 1})
+                    results = []
+                    for storage in (mongo, memory):
+                        await storage.prepare()
+                        result = await answers(storage, order["vendorId"], order["supplierId"])
+                        # Reconciliation builds the memory counters; a second pass must find nothing
+                        result["drift"] = await storage.supplier_stats.reconcile(10)
+                        results.append(result)
+                    return results
+                finally:
+                    await db.client.drop_database(db.name)
+
+            mongo_result, memory_result = self.run_against_database(compare)
+            differing = [key for key in mongo_result if mongo_result[key] != memory_result[key]]
+            if not differing and mongo_result["products"] and mongo_result["orders"]:
+                self.log_test("Storage Engines Agree", True,
+                              f"Paging, geo, changes, export, analytics and counters match over "
+                              f"{len(mongo_result['products'])} products")
+                return True
+            else:
+                self.log_test("Storage Engines Agree", False, f"Engines differ on: {', '.join(differing) or 'empty data'}")
+                return False
+        except Exception as e:
+            self.log_test("Storage Engines Agree", False, f"Engine comparison failed: {str(e)}")
+            return False
+
+    def test_memory_engine_in_process(self):
+        """Test core flows on the in-memory engine through the ASGI app, with no server or database"""
+        try:
+            import httpx
+            # The server picks its storage engine when it is imported
+            os.environ["STORAGE_ENGINE"] = "memory"
+            import server
+            if server.storage.engine != "memory":
+                self.log_test("In-Process Memory Engine", False, "server was already imported with another engine")
+                return False
+            
+            async def exercise():
+                await server.startup_event()
+                transport = httpx.ASGITransport(app=server.app)
+                try:
+                    async with httpx.AsyncClient(transport=transport, base_url="http://testserver/api") as client:
+                        vendor = (await client.post("/auth/login", json=DEMO_VENDOR)).json()
+                        supplier = (await client.post("/auth/login", json=DEMO_SUPPLIER)).json()
+                        vendor_headers = {"Authorization": f"Bearer {vendor['access_token']}"}
+                        supplier_headers = {"Authorization": f"Bearer {supplier['access_token']}"}
+                        checks = {}
+                        
+                        products = (await client.get("/products")).json()["items"]
+                        checks["catalog"] = bool(products)
+                        product = next(p for p in products if p["supplierId"] == supplier["user"]["id"]
+                                       and p["stock"] >= p["minOrderQty"])
+                        quantity = product["minOrderQty"]
+                        search = (await client.get("/products", params={"search": product["name"].split()[0]})).json()
+                        checks["search"] = product["id"] in [p["id"] for p in search["items"]]
+                        
+                        analytics = (await client.get("/analytics/supplier", headers=supplier_headers)).json()
+                        orders_before = analytics["totals"]["orders"]
+                        token, has_more = None, True
+                        while has_more:
+                            changes = (await client.get("/products/changes", params={"since": token} if token else {})).json()
+                            token, has_more = changes["next_token"], changes["has_more"]
+                        
+                        line = {
+                            "productId": product["id"],
+                            "productName": product["name"],
+                            "quantity": quantity,
+                            "unitPrice": product["price"],
+                            "totalPrice": product["price"] * quantity,
+                            "supplierId": product["supplierId"],
+                            "supplierName": product["supplierName"]
+                        }
+                        order_headers = {**vendor_headers, "Idempotency-Key": "in-process-order"}
+                        order = await client.post("/orders", json={"items": [line]}, headers=order_headers)
+                        replay = await client.post("/orders", json={"items": [line]}, headers=order_headers)
+                        checks["order"] = order.status_code == 200 and replay.json() == order.json()
+                        
+                        delta = (await client.get("/products/changes", params={"since": token})).json()["items"]
+                        checks["delta sync"] = {"id": product["id"], "stock": product["stock"] - quantity} in [
+                            {"id": p["id"], "stock": p["stock"]} for p in delta]
+                        
+                        analytics = (await client.get("/analytics/supplier", headers=supplier_headers)).json()
+                        checks["analytics"] = analytics["totals"]["orders"] == orders_before + 1
+                        
+                        order_id = order.json()["orders"][0]["id"]
+                        await client.put(f"/orders/{order_id}/status", params={"status": "cancelled"}, headers=supplier_headers)
+                        restored = (await client.get(f"/products/{product['id']}")).json()
+                        checks["cancel"] = restored["stock"] == product["stock"]
+                        return checks
+                finally:
+                    await server.shutdown_event()
+            
+            checks = asyncio.run(exercise())
+            failed = [name for name, passed in checks.items() if not passed]
+            if not failed:
+                self.log_test("In-Process Memory Engine", True, f"{', '.join(checks)} work without a database")
+                return True
+            else:
+                self.log_test("In-Process Memory Engine", False, f"Failed checks: {', '.join(failed)}")
+                return False
+        except Exception as e:
+            self.log_test("In-Process Memory Engine", False, f"In-process run failed: {str(e)}")
+            return False
+
     def run_all_tests(self):
         """Run all tests in sequence"""
         print("🚀 Starting StreetBazaar Backend API Tests")
         print("=" * 60)
+        # Read before the app is imported, since importing it loads backend/.env
+        database_checks = bool(os.environ.get("MONGO_URL"))
+        
+        # These checks run the app in this process; no server or database needed
+        print("\n🧪 In-Process Checks")
+        print("-" * 30)
+        self.test_memory_engine_in_process()
         
         # Basic connectivity
         if not self.test_api_health():
-            print("❌ API is not accessible. Stopping tests.")
-            return False
+            print("❌ API is not accessible. Skipping the live API tests.")
+            return self.print_summary()
+        self.test_metrics_endpoint()
         
         # Authentication tests
         print("\n🔐 Authentication Tests")
@@ -463,21 +1509,36 @@ class StreetBazaarTester:
         self.test_supplier_login()
         self.test_jwt_validation()
         self.test_invalid_token()
+        self.test_concurrent_registration()
         
         # Product management tests
         print("\n📦 Product Management Tests")
         print("-" * 30)
         self.test_get_products()
+        self.test_product_pagination()
         self.test_get_categories()
         self.test_product_search()
         self.test_category_filter()
+        self.test_nearby_discovery()
         self.test_create_product()
+        self.test_non_latin_search()
+        self.test_punctuation_search()
+        self.test_product_changes()
+        self.test_bulk_product_import()
         self.test_vendor_create_product_forbidden()
         
         # Order management tests
         print("\n🛒 Order Management Tests")
         print("-" * 30)
         self.test_create_order()
+        self.test_multi_supplier_checkout()
+        self.test_stale_cart_rejected()
+        self.test_concurrent_orders_no_oversell()
+        self.test_concurrent_idempotent_retries()
+        self.test_stock_change_sync()
+        self.test_order_status_stream()
+        self.test_invalid_order_status()
+        self.test_supplier_analytics()
         self.test_get_vendor_orders()
         self.test_get_supplier_orders()
         
@@ -486,7 +1547,28 @@ class StreetBazaarTester:
         print("-" * 30)
         self.test_sample_data_validation()
         
-        # Summary
+        # These checks need direct database access
+        if database_checks:
+            print("\n🗂️ Database Checks")
+            print("-" * 30)
+            self.test_hot_queries_use_indexes()
+            self.test_order_numbers_unique()
+            self.test_supplier_stats_consistent()
+            self.test_order_export_bounded_memory()
+            self.test_order_export_escapes_formulas()
+            self.test_synthetic_seed()
+            self.test_storage_engines_agree()
+        
+        # Profiling needs the server's profiling token
+        if os.environ.get("PROFILE_TOKEN"):
+            print("\n⏱️ Profiling")
+            print("-" * 30)
+            self.test_request_profile()
+        
+        return self.print_summary()
+    
+    def print_summary(self):
+        """Print pass/fail counts and the failed tests; True when everything passed"""
         print("\n📋 Test Summary")
         print("=" * 60)
         
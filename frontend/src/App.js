@@ -419,7 +419,7 @@ const ProductCatalog = ({ onAddToCart, userType }) => {
       if (searchQuery) params.append('search', searchQuery);
       
       const response = await axios.get(`${API}/products?${params}`);
-      setProducts(response.data);
+      setProducts(response.data.items);
     } catch (error) {
       console.error('Error fetching products:', error);
     } finally {
@@ -578,7 +578,7 @@ const OrderHistory = () => {
   const fetchOrders = async () => {
     try {
       const response = await axios.get(`${API}/orders`);
-      setOrders(response.data);
+      setOrders(response.data.items);
     } catch (error) {
       console.error('Error fetching orders:', error);
     } finally {